@@ -34,25 +34,35 @@ MINIMUM_DIFF_ROUGH = 7
 MINIMUM_DIFF_FINE = 4
 
 
-def full_analysis(kwargs, bug_list=None, please_stop=None):
+def full_analysis(kwargs, bug_list=None, please_stop=None, analyzer=None, db=None):
     """
     THE CC LISTS (AND REVIEWS) ARE EMAIL ADDRESSES THE BELONG TO PEOPLE.
     SINCE THE EMAIL ADDRESS FOR A PERSON CAN CHANGE OVER TIME.  THIS CODE
     WILL ASSOCIATE EACH PERSON WITH THE EMAIL ADDRESSES USED
     OVER THE LIFETIME OF THE BUGZILLA DATA.  'PERSON' IS ABSTRACT, AND SIMPLY
     ASSIGNED A CANONICAL EMAIL ADDRESS TO FACILITATE IDENTIFICATION
+    :param analyzer: OPTIONAL AliasAnalyzer TO REUSE (SO ALIASES ARE NOT RELOADED)
+    :param db: OPTIONAL CONNECTION TO REUSE, ONLY USED WITH bug_list
     """
     if kwargs.args.quick:
         Log.note("Alias analysis skipped (--quick was used)")
         return
 
-    analyzer = AliasAnalyzer(kwargs.alias)
+    if analyzer is None:
+        analyzer = AliasAnalyzer(kwargs.alias)
+    else:
+        # FORGET THE BUGS FROM THE LAST ANALYSIS
+        analyzer.bugs = {}
 
     if bug_list:
-        with MySQL(kwargs=kwargs.bugzilla, readonly=True) as db:
+        if db is None:
+            with MySQL(kwargs=kwargs.bugzilla, readonly=True) as db:
+                data = get_all_cc_changes(db, bug_list)
+                analyzer.aggregator(data)
+        else:
             data = get_all_cc_changes(db, bug_list)
             analyzer.aggregator(data)
-            analyzer.analysis(True, please_stop)
+        analyzer.analysis(True, please_stop)
         return
 
     with MySQL(kwargs=kwargs.bugzilla, readonly=True) as db:
@@ -13,19 +13,25 @@ from __future__ import unicode_literals
 
 import jx_elasticsearch
 import mo_math
+from mo_math import MAX
 from bugzilla_etl import extract_bugzilla, alias_analysis, parse_bug_history
 from bugzilla_etl.alias_analysis import AliasAnalyzer
-from bugzilla_etl.extract_bugzilla import get_comments, get_current_time, MIN_TIMESTAMP, get_private_bugs_for_delete, get_recent_private_bugs, get_recent_private_attachments, get_recent_private_comments, get_comments_by_id, get_bugs, \
+from bugzilla_etl.delete_manager import DeleteManager
+from bugzilla_etl.extract_cache import ExtractCache, BUGS, COMMENTS
+from bugzilla_etl.metrics import METRICS
+from bugzilla_etl.extract_bugzilla import get_comments, get_current_time, MIN_TIMESTAMP, get_private_bugs_for_delete, get_recent_changes, get_comments_by_id, get_bugs, \
     get_dependencies, get_flags, get_new_activities, get_bug_see_also, get_attachments, get_tracking_flags, get_keywords, get_tags, get_cc, get_bug_groups, get_duplicates
-from bugzilla_etl.parse_bug_history import BugHistoryParser
+from bugzilla_etl.parse_bug_history import BugHistoryParser, CANONICAL_STATS
 from jx_python import jx
+from jx_python.expressions import COMPILE_STATS
 from mo_dots import wrap, coalesce, listwrap, Data
 from mo_files import File
 from mo_future import text_type, long
 from mo_json import scrub
 from mo_kwargs import override
 from mo_logs import Log, startup, constants
-from mo_threads import Lock, Queue, Thread, THREAD_STOP
+from mo_threads import Lock, Queue, Thread, THREAD_STOP, Signal, Till
+from mo_threads.sampler import SamplingProfiler, set_tag
 from mo_threads.threads import AllThread, MAIN_THREAD
 from mo_times.dates import unix2datetime
 from mo_times.timer import Timer
@@ -34,6 +40,14 @@ from pyLibrary.env.elasticsearch import Cluster
 from pyLibrary.sql.mysql import MySQL
 
 NUM_CONNECTIONS = 4
+DAEMON_INTERVAL = 60  # SECONDS BETWEEN INCREMENTAL RUNS, WHEN RUNNING AS DAEMON
+ROW_ORDER = [  # THE ORDER BugHistoryParser EXPECTS THE ROWS
+    "bug_id",
+    "_merge_order",
+    {"modified_ts": "desc"},
+    "modified_by",
+    {"id": "desc"}
+]
 
 db_cache_lock = Lock()
 db_cache = []
@@ -58,27 +72,66 @@ get_stuff_from_bugzilla = [
 ]
 
 
-def etl_comments(db, output_queue, param, please_stop):
-    # CONNECTIONS ARE EXPENSIVE, CACHE HERE
+def etl_comments(db, output_queue, param, please_stop, cache=None):
     global comment_db_cache
-    with comment_db_cache_lock:
-        if not comment_db_cache:
-            comment_db = MySQL(db.settings)
-            comment_db_cache = comment_db
 
-    with comment_db_cache_lock:
-        comments = get_comments(comment_db_cache, param)
+    if cache and cache.replay:
+        comments = cache.read(COMMENTS, param.block)
+    else:
+        # CONNECTIONS ARE EXPENSIVE, CACHE HERE
+        with comment_db_cache_lock:
+            if not comment_db_cache:
+                comment_db = MySQL(db.settings)
+                comment_db_cache = comment_db
+
+        with comment_db_cache_lock:
+            with METRICS.timer("extract.get_comments"):
+                comments = get_comments(comment_db_cache, param)
+            METRICS.counter("extract.get_comments").inc(len(comments))
+
+        if cache:
+            cache.write(COMMENTS, param.block, comments)
 
     for g, block_of_comments in jx.groupby(comments, size=500):
         output_queue.extend({"id": text_type(comment.comment_id), "value": scrub(comment)} for comment in block_of_comments)
 
 
-def etl(db, bug_output_queue, param, alias_analyzer, please_stop):
+def etl(db, bug_output_queue, param, alias_analyzer, please_stop, cache=None, current_output_queue=None):
     """
     PROCESS RANGE, AS SPECIFIED IN param AND PUSH
-    BUG VERSION RECORDS TO output_queue
+    BUG VERSION RECORDS TO output_queue, AND THE LAST
+    VERSION OF EACH BUG TO current_output_queue (IF ANY)
     """
+    if cache and cache.replay:
+        db_results = cache.read(BUGS, param.block)
+    else:
+        db_results = get_records_from_bugzilla(db, param)
+        if cache:
+            db_results = list(db_results)
+            cache.write(BUGS, param.block, db_results)
+
+    with METRICS.timer("sort"):
+        sorted = jx.sort(db_results, ROW_ORDER)
+    METRICS.counter("sort").inc(len(sorted))
+
+    # THE PARSER CALLS normalize(), SO parse TIME INCLUDES normalize TIME
+    process = BugHistoryParser(param, alias_analyzer, bug_output_queue, current_output_queue, please_stop=please_stop)
+    with METRICS.timer("parse"):
+        for i, s in enumerate(sorted):
+            process.processRow(s)
+        process.processRow(wrap({"bug_id": parse_bug_history.STOP_BUG, "_merge_order": 1}))
+    METRICS.counter("parse").inc(len(sorted))
+    if process.memory:
+        process.memory.report(block=param.block)
+    parse_bug_history.HOT.flush()
+    process.alias_analyzer.save_aliases()
+
 
+def get_records_from_bugzilla(db, param):
+    """
+    RUN ALL THE get_stuff_from_bugzilla FUNCTIONS OVER param.bug_list
+    :return: QUEUE OF ALL THE ROWS
+    """
     # MAKING CONNECTIONS ARE EXPENSIVE, CACHE HERE
     with db_cache_lock:
         if not db_cache:
@@ -87,13 +140,18 @@ def etl(db, bug_output_queue, param, alias_analyzer, please_stop):
                     db_cache.append(MySQL(db.settings))
 
     db_results = Queue(name="db results", max=2**30)
+    METRICS.watch(db_results)
 
-    def get_records_from_bugzilla(db, param, please_stop):
+    def extract(db, param, please_stop):
         with db.transaction():
             for get_stuff in get_stuff_from_bugzilla:
                 if please_stop:
                     break
-                db_results.extend(get_stuff(db, param))
+                name = "extract." + get_stuff.__name__
+                with METRICS.timer(name):
+                    rows = get_stuff(db, param)
+                METRICS.counter(name).inc(len(rows))
+                db_results.extend(rows)
 
     with AllThread() as all:
         with db_cache_lock:
@@ -102,27 +160,14 @@ def etl(db, bug_output_queue, param, alias_analyzer, please_stop):
             for g, bug_ids in jx.groupby(param.bug_list, size=size):
                 param = param.copy()
                 param.bug_list = bug_ids
-                all.add(get_records_from_bugzilla, db_cache[g], param)
+                all.add(extract, db_cache[g], param)
     db_results.add(THREAD_STOP)
-
-    sorted = jx.sort(db_results, [
-        "bug_id",
-        "_merge_order",
-        {"modified_ts": "desc"},
-        "modified_by",
-        {"id": "desc"}
-    ])
-
-    process = BugHistoryParser(param, alias_analyzer, bug_output_queue)
-    for i, s in enumerate(sorted):
-        process.processRow(s)
-    process.processRow(wrap({"bug_id": parse_bug_history.STOP_BUG, "_merge_order": 1}))
-    process.alias_analyzer.save_aliases()
+    return db_results
 
 
-def run_both_etl(db, bug_output_queue, comment_output_queue, param, alias_analyzer):
-    comment_thread = Thread.run("etl comments", etl_comments, db, comment_output_queue, param)
-    process_thread = Thread.run("etl", etl, db, bug_output_queue, param, alias_analyzer)
+def run_both_etl(db, bug_output_queue, comment_output_queue, param, alias_analyzer, cache=None, current_output_queue=None):
+    comment_thread = Thread.run("etl comments", etl_comments, db, comment_output_queue, param, cache=cache)
+    process_thread = Thread.run("etl", etl, db, bug_output_queue, param, alias_analyzer, cache=cache, current_output_queue=current_output_queue)
 
     comment_thread.join()
     process_thread.join()
@@ -139,6 +184,9 @@ def setup_es(settings, db):
         last_run_time = long(File(settings.param.last_run_time).read())
         esq = jx_elasticsearch.new_instance(read_only=False, kwargs=settings.es)
         esq_comments = jx_elasticsearch.new_instance(read_only=False, kwargs=settings.es_comments)
+        esq_current = None
+        if settings.es_current:
+            esq_current = jx_elasticsearch.new_instance(read_only=False, kwargs=settings.es_current)
     elif File(settings.param.first_run_time).exists:
         # DO NOT MAKE NEW INDEX, CONTINUE INITIAL FILL
         try:
@@ -149,6 +197,10 @@ def setup_es(settings, db):
             esq = jx_elasticsearch.new_instance(index=bugs.index, read_only=False, kwargs=settings.es)
             comments = Cluster(settings.es_comments).get_best_matching_index(settings.es_comments.index)
             esq_comments = jx_elasticsearch.new_instance(index=comments.index, read_only=False, kwargs=settings.es_comments)
+            esq_current = None
+            if settings.es_current:
+                current = Cluster(settings.es_current).get_best_matching_index(settings.es_current.index)
+                esq_current = jx_elasticsearch.new_instance(index=current.index, read_only=False, kwargs=settings.es_current)
             esq.es.set_refresh_interval(1)  #REQUIRED SO WE CAN SEE WHAT BUGS HAVE BEEN LOADED ALREADY
         except Exception as e:
             Log.warning("can not resume ETL, restarting", cause=e)
@@ -165,35 +217,66 @@ def setup_es(settings, db):
 
         esq = jx_elasticsearch.new_instance(read_only=False, index=es.settings.index, kwargs=settings.es)
         esq_comments = jx_elasticsearch.new_instance(read_only=False, index=es_comments.settings.index, kwargs=settings.es_comments)
+        esq_current = None
+        if settings.es_current:
+            es_current = Cluster(settings.es_current).create_index(kwargs=settings.es_current, limit_replicas=True)
+            esq_current = jx_elasticsearch.new_instance(read_only=False, index=es_current.settings.index, kwargs=settings.es_current)
+
+    return current_run_time, esq, esq_comments, esq_current, last_run_time
+
+
+def current_queue(esq_current):
+    """
+    :param esq_current: THE CURRENT BUGS INDEX, OR None
+    :return: CONTEXT MANAGER WITH THE BULK LOADER FOR THE CURRENT BUGS (None IF THERE IS NO INDEX)
+    """
+    if esq_current is None:
+        return _NoQueue()
+    return esq_current.es.threaded_queue(max_size=500, silent=True)
+
 
-    return current_run_time, esq, esq_comments, last_run_time
+class _NoQueue(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
 
 @override
-def incremental_etl(param, db, esq, esq_comments, bug_output_queue, comment_output_queue, kwargs):
+def incremental_etl(param, db, esq, esq_comments, bug_output_queue, comment_output_queue, alias_analyzer=None, esq_current=None, current_output_queue=None, kwargs=None):
     ####################################################################
     ## ES TAKES TIME TO DELETE RECORDS, DO DELETE FIRST WITH HOPE THE
     ## INDEX GETS A REWRITE DURING ADD OF NEW RECORDS
     ####################################################################
 
+    set_tag("incremental " + text_type(param.start_time))
+
+    # ALL THE RECENT CHANGES, IN ONE PASS
+    with Timer("time to get changed bug list"):
+        changes = get_recent_changes(db, param)
+
     # REMOVE PRIVATE BUGS
     private_bugs = get_private_bugs_for_delete(db, param)
 
-    alias_analyzer = AliasAnalyzer(kwargs.alias)
+    warm_aliases = alias_analyzer is not None
+    if not warm_aliases:
+        alias_analyzer = AliasAnalyzer(kwargs.alias)
+
+    # COLLECT EVERYTHING TO DELETE, SO ES GETS ONE SET OF TASKS PER INDEX
+    # THE CURRENT BUGS INDEX GETS THE SAME DELETES AS THE BUG VERSIONS
+    bug_deletes = DeleteManager(esq.es, esq_current.es if esq_current else None)
+    comment_deletes = DeleteManager(esq_comments.es)
 
     Log.note("Ensure the following private bugs are deleted:\n{{private_bugs|indent}}", private_bugs=sorted(private_bugs))
-    for g, delete_bugs in jx.groupby(private_bugs, size=1000):
-        still_existing = get_bug_ids(esq, {"terms": {"bug_id": delete_bugs}})
-        if still_existing:
-            Log.note("Ensure the following existing private bugs are deleted:\n{{private_bugs|indent}}", private_bugs=sorted(still_existing))
-        esq.es.delete_record({"terms": {"bug_id.~n~": delete_bugs}})
-        esq_comments.es.delete_record({"terms": {"bug_id.~n~": delete_bugs}})
+    bug_deletes.delete("bug_id", private_bugs)
+    comment_deletes.delete("bug_id", private_bugs)
 
     # RECENT PUBLIC BUGS
-    possible_public_bugs = get_recent_private_bugs(db, param)
+    possible_public_bugs = changes.privacy
     if param.allow_private_bugs:
         #PRIVATE BUGS
         #    A CHANGE IN PRIVACY INDICATOR MEANS THE WHITEBOARD IS AFFECTED, REDO
-        esq.es.delete_record({"terms": {"bug_id.~n~": possible_public_bugs}})
+        bug_deletes.delete("bug_id", possible_public_bugs)
     else:
         #PUBLIC BUGS
         #    IF ADDING GROUP THEN private_bugs ALREADY DID THIS
@@ -201,20 +284,33 @@ def incremental_etl(param, db, esq, esq_comments, bug_output_queue, comment_outp
         pass
 
     # REMOVE **RECENT** PRIVATE ATTACHMENTS
-    private_attachments = get_recent_private_attachments(db, param)
-    bugs_to_refresh = set(jx.select(private_attachments, "bug_id"))
-    esq.es.delete_record({"terms": {"bug_id.~n~": bugs_to_refresh}})
+    bugs_to_refresh = changes.private_attachments
+    bug_deletes.delete("bug_id", bugs_to_refresh)
+
+    # REFRESH COMMENTS WITH PRIVACY CHANGE
+    comment_list = changes.private_comments | {0}
+    comment_deletes.delete("comment_id", comment_list)
+
+    bug_deletes.start()
+    comment_deletes.start()
+
+    # PULL FROM THE DATABASE WHILE ES IS DELETING
+    changed_comments = list(get_comments_by_id(db, comment_list, param))
+
+    # NOTHING GETS ADDED UNTIL THE OLD RECORDS ARE GONE
+    bug_deletes.wait()
+    comment_deletes.wait()
 
     # REBUILD BUGS THAT GOT REMOVED
-    bug_list = jx.sort((possible_public_bugs | bugs_to_refresh) - private_bugs) # REMOVE PRIVATE BUGS
-    if bug_list:
+    refresh_list = jx.sort((possible_public_bugs | bugs_to_refresh) - private_bugs) # REMOVE PRIVATE BUGS
+    if refresh_list:
         refresh_param = param.copy()
-        refresh_param.bug_list = bug_list
+        refresh_param.bug_list = refresh_list
         refresh_param.start_time = MIN_TIMESTAMP
         refresh_param.start_time_str = extract_bugzilla.milli2string(db, MIN_TIMESTAMP)
 
         try:
-            etl(db, bug_output_queue, refresh_param.copy(), alias_analyzer, please_stop=None)
+            etl(db, bug_output_queue, refresh_param.copy(), alias_analyzer, please_stop=None, current_output_queue=current_output_queue)
             etl_comments(db, esq_comments.es, refresh_param.copy(), please_stop=None)
         except Exception as e:
             Log.error(
@@ -223,63 +319,51 @@ def incremental_etl(param, db, esq, esq_comments, bug_output_queue, comment_outp
                 cause=e
             )
 
-
-    # REFRESH COMMENTS WITH PRIVACY CHANGE
-    private_comments = get_recent_private_comments(db, param)
-    comment_list = set(jx.select(private_comments, "comment_id")) | {0}
-    esq_comments.es.delete_record({"terms": {"comment_id.~n~": comment_list}})
-    changed_comments = get_comments_by_id(db, comment_list, param)
     esq_comments.es.extend({"id": c.comment_id, "value": c} for c in changed_comments)
 
-    # GET LIST OF CHANGED BUGS
-    with Timer("time to get changed bug list"):
-        if param.allow_private_bugs:
-            bug_list = jx.select(db.query("""
-                SELECT
-                    b.bug_id
-                FROM
-                    bugs b
-                WHERE
-                    delta_ts >= {{start_time_str}}
-            """, {
-                "start_time_str": param.start_time_str
-            }), u"bug_id")
-        else:
-            bug_list = jx.select(db.query("""
-                SELECT
-                    b.bug_id
-                FROM
-                    bugs b
-                LEFT JOIN
-                    bug_group_map m ON m.bug_id=b.bug_id
-                WHERE
-                    delta_ts >= {{start_time_str}} AND
-                    m.bug_id IS NULL
-            """, {
-                "start_time_str": param.start_time_str
-            }), u"bug_id")
-
+    # CHANGED BUGS, EXCEPT THE ONES ALREADY REBUILT
+    bug_list = jx.sort(changes.changed - set(refresh_list) - private_bugs)
     if not bug_list:
         return
 
-    with Thread.run("alias analysis", alias_analysis.full_analysis, kwargs=kwargs, bug_list=bug_list):
-        Log.note(
-            "Updating {{num}} bugs:\n{{bug_list|indent}}",
-            num=len(bug_list),
-            bug_list=bug_list
-        )
-        param.bug_list = bug_list
+    Log.note(
+        "Updating {{num}} bugs:\n{{bug_list|indent}}",
+        num=len(bug_list),
+        bug_list=bug_list
+    )
+    param.bug_list = bug_list
+
+    if warm_aliases:
+        # THE ANALYZER IS KEPT BETWEEN RUNS, SO IT CAN NOT BE SHARED WITH
+        # ANOTHER THREAD; ANALYSE FIRST SO THE ETL SEES THE NEW ALIASES
+        alias_analysis.full_analysis(kwargs, bug_list=bug_list, analyzer=alias_analyzer, db=db)
         run_both_etl(
             db=db,
             bug_output_queue=bug_output_queue,
             comment_output_queue=comment_output_queue,
             param=param.copy(),
-            alias_analyzer=alias_analyzer
+            alias_analyzer=alias_analyzer,
+            current_output_queue=current_output_queue
         )
+    else:
+        with Thread.run("alias analysis", alias_analysis.full_analysis, kwargs=kwargs, bug_list=bug_list):
+            run_both_etl(
+                db=db,
+                bug_output_queue=bug_output_queue,
+                comment_output_queue=comment_output_queue,
+                param=param.copy(),
+                alias_analyzer=alias_analyzer,
+                current_output_queue=current_output_queue
+            )
 
 @override
-def full_etl(resume_from_last_run, param, db, esq, esq_comments, bug_output_queue, comment_output_queue, kwargs):
-    end = coalesce(param.end, db.query("SELECT max(bug_id) bug_id FROM bugs")[0].bug_id)
+def full_etl(resume_from_last_run, param, db, esq, esq_comments, bug_output_queue, comment_output_queue, current_output_queue=None, kwargs=None):
+    cache = ExtractCache(kwargs=kwargs.cache) if kwargs.cache.directory else None
+    if cache and cache.replay:
+        Log.note("replay extracted rows from {{directory}}", directory=cache.directory.abspath)
+        end = coalesce(param.end, MAX([m for _, m in cache.blocks()]), 0)
+    else:
+        end = coalesce(param.end, db.query("SELECT max(bug_id) bug_id FROM bugs")[0].bug_id)
     start = coalesce(param.start, 0)
     alias_analyzer = AliasAnalyzer(kwargs=kwargs.alias)
     if resume_from_last_run:
@@ -289,58 +373,72 @@ def full_etl(resume_from_last_run, param, db, esq, esq_comments, bug_output_queu
     #############################################################
     ## MAIN ETL LOOP
     #############################################################
-    for min, max in jx.reverse(jx.intervals(start, end, param.increment)):
+    if cache and cache.replay:
+        blocks = [(min, max) for min, max in cache.blocks() if start <= min < end]
+    else:
+        blocks = jx.intervals(start, end, param.increment)
+
+    for min, max in jx.reverse(blocks):
         with Timer("etl block {{min}}..{{max}}", param={"min":min, "max":max}, silent=not param.debug):
             if kwargs.args.quick and min < end - param.increment and min != 0:
                 #--quick ONLY DOES FIRST AND LAST BLOCKS
                 continue
 
+            set_tag("block " + text_type(min) + ".." + text_type(max))
             try:
-                #GET LIST OF CHANGED BUGS
-                with Timer("time to get {{min}}..{{max}} bug list", {"min":min, "max":max}):
-                    if param.allow_private_bugs:
-                        bug_list = jx.select(db.query("""
-                            SELECT
-                                b.bug_id
-                            FROM
-                                bugs b
-                            WHERE
-                                delta_ts >= {{start_time_str}} AND
-                                ({{min}} <= b.bug_id AND b.bug_id < {{max}})
-                        """, {
-                            "min": min,
-                            "max": max,
-                            "start_time_str": param.start_time_str
-                        }), u"bug_id")
-                    else:
-                        bug_list = jx.select(db.query("""
-                            SELECT
-                                b.bug_id
-                            FROM
-                                bugs b
-                            LEFT JOIN
-                                bug_group_map m ON m.bug_id=b.bug_id
-                            WHERE
-                                delta_ts >= {{start_time_str}} AND
-                                ({{min}} <= b.bug_id AND b.bug_id < {{max}}) AND
-                                m.bug_id IS NULL
-                        """, {
-                            "min": min,
-                            "max": max,
-                            "start_time_str": param.start_time_str
-                        }), u"bug_id")
-
-                if not bug_list:
-                    continue
+                if cache and cache.replay:
+                    # THE CACHE HAS THE ROWS FOR ALL THE BUGS IN THE BLOCK
+                    bug_list = None
+                else:
+                    #GET LIST OF CHANGED BUGS
+                    with Timer("time to get {{min}}..{{max}} bug list", {"min":min, "max":max}):
+                        if param.allow_private_bugs:
+                            bug_list = jx.select(db.query("""
+                                SELECT
+                                    b.bug_id
+                                FROM
+                                    bugs b
+                                WHERE
+                                    delta_ts >= {{start_time_str}} AND
+                                    ({{min}} <= b.bug_id AND b.bug_id < {{max}})
+                            """, {
+                                "min": min,
+                                "max": max,
+                                "start_time_str": param.start_time_str
+                            }), u"bug_id")
+                        else:
+                            bug_list = jx.select(db.query("""
+                                SELECT
+                                    b.bug_id
+                                FROM
+                                    bugs b
+                                LEFT JOIN
+                                    bug_group_map m ON m.bug_id=b.bug_id
+                                WHERE
+                                    delta_ts >= {{start_time_str}} AND
+                                    ({{min}} <= b.bug_id AND b.bug_id < {{max}}) AND
+                                    m.bug_id IS NULL
+                            """, {
+                                "min": min,
+                                "max": max,
+                                "start_time_str": param.start_time_str
+                            }), u"bug_id")
+
+                    if not bug_list:
+                        continue
 
                 param.bug_list = bug_list
+                param.block = {"min": min, "max": max}
                 run_both_etl(
                     db,
                     bug_output_queue,
                     comment_output_queue,
                     param.copy(),
-                    alias_analyzer=alias_analyzer
+                    alias_analyzer=alias_analyzer,
+                    cache=cache,
+                    current_output_queue=current_output_queue
                 )
+                METRICS.write(block=param.block)
 
             except Exception as e:
                 Log.error(
@@ -351,7 +449,7 @@ def full_etl(resume_from_last_run, param, db, esq, esq_comments, bug_output_queu
                 )
 
 @override
-def main(param, es, es_comments, bugzilla, kwargs):
+def main(param, es, es_comments, bugzilla, es_current=None, kwargs=None):
     param.allow_private_bugs = param.allow_private_bugs in [True, "true"]
     if not param.allow_private_bugs and es and not es_comments:
         Log.error("Must have ES for comments")
@@ -361,19 +459,17 @@ def main(param, es, es_comments, bugzilla, kwargs):
     # MAKE HANDLES TO CONTAINERS
     try:
         with MySQL(kwargs=bugzilla, readonly=True) as db:
-            current_run_time, esq, esq_comments, last_run_time = setup_es(kwargs, db)
-
-            with esq.es.threaded_queue(max_size=500, silent=True) as output_queue:
-                #SETUP RUN PARAMETERS
-                param_new = Data()
-                param_new.end_time = convert.datetime2milli(get_current_time(db))
-                # MySQL WRITES ARE DELAYED, RESULTING IN UNORDERED bug_when IN bugs_activity (AS IS ASSUMED FOR bugs(delats_ts))
-                # THIS JITTER IS USUALLY NO MORE THAN ONE SECOND, BUT WE WILL GO BACK 60sec, JUST IN CASE.
-                param_new.start_time = last_run_time - coalesce(param.look_back, 5 * 60 * 1000)  # 5 MINUTE LOOK_BACK
-                param_new.start_time_str = extract_bugzilla.milli2string(db, param_new.start_time)
-                param_new.alias = param.alias
-                param_new.allow_private_bugs = param.allow_private_bugs
-                param_new.increment = param.increment
+            current_run_time, esq, esq_comments, esq_current, last_run_time = setup_es(kwargs, db)
+            METRICS.instrument(esq.es)
+            METRICS.instrument(esq_comments.es)
+            if esq_current:
+                METRICS.instrument(esq_current.es)
+
+            with esq.es.threaded_queue(max_size=500, silent=True) as output_queue, current_queue(esq_current) as current_output_queue:
+                METRICS.watch(output_queue)
+                if current_output_queue:
+                    METRICS.watch(current_output_queue)
+                param_new = get_run_param(db, param, last_run_time)
 
                 if last_run_time > MIN_TIMESTAMP:
                     with Timer("run incremental etl"):
@@ -384,6 +480,8 @@ def main(param, es, es_comments, bugzilla, kwargs):
                             esq_comments=esq_comments,
                             bug_output_queue=output_queue,
                             comment_output_queue=esq_comments.es,
+                            esq_current=esq_current,
+                            current_output_queue=current_output_queue,
                             kwargs=kwargs
                         )
                 else:
@@ -396,6 +494,7 @@ def main(param, es, es_comments, bugzilla, kwargs):
                             esq_comments=esq_comments,
                             bug_output_queue=output_queue,
                             comment_output_queue=esq_comments.es,
+                            current_output_queue=current_output_queue,
                             kwargs=kwargs
                         )
 
@@ -411,7 +510,25 @@ def main(param, es, es_comments, bugzilla, kwargs):
             esq.es.cluster.delete_all_but(s.alias, s.index)
             esq_comments.es.add_alias(s.alias)
 
+        if esq_current:
+            s = Data(alias=es_current.index, index=esq_current.es.settings.index)
+            if s.alias:
+                esq_current.es.cluster.delete_all_but(s.alias, s.index)
+                esq_current.es.add_alias(s.alias)
+
         File(param.last_run_time).write(text_type(convert.datetime2milli(current_run_time)))
+
+        if kwargs.args.daemon:
+            run_daemon(
+                param=param,
+                bugzilla=bugzilla,
+                esq=esq,
+                esq_comments=esq_comments,
+                esq_current=esq_current,
+                last_run_time=convert.datetime2milli(current_run_time),
+                kwargs=kwargs,
+                please_stop=MAIN_THREAD.please_stop
+            )
     except Exception as e:
         Log.error("Problem with main ETL loop", cause=e)
     finally:
@@ -424,17 +541,89 @@ def main(param, es, es_comments, bugzilla, kwargs):
         except Exception as e:
             pass
 
-def get_bug_ids(esq, filter):
-    try:
-        result = esq.query({"from": esq.name, "select": "bug_id", "where": filter, "limit": 20000, "format": "list"})
-        return set(result.data) - {None}
-    except Exception as e:
-        Log.error(
-            "Can not get_max_bug from {{host}}/{{index}}",
-            host=esq.settings.host,
-            index=esq.settings.index,
-            cause=e
-        )
+def get_run_param(db, param, last_run_time):
+    """
+    SETUP RUN PARAMETERS
+    """
+    param_new = Data()
+    param_new.end_time = convert.datetime2milli(get_current_time(db))
+    # MySQL WRITES ARE DELAYED, RESULTING IN UNORDERED bug_when IN bugs_activity (AS IS ASSUMED FOR bugs(delats_ts))
+    # THIS JITTER IS USUALLY NO MORE THAN ONE SECOND, BUT WE WILL GO BACK 60sec, JUST IN CASE.
+    param_new.start_time = last_run_time - coalesce(param.look_back, 5 * 60 * 1000)  # 5 MINUTE LOOK_BACK
+    param_new.start_time_str = extract_bugzilla.milli2string(db, param_new.start_time)
+    param_new.alias = param.alias
+    param_new.allow_private_bugs = param.allow_private_bugs
+    param_new.increment = param.increment
+    param_new.snapshot_interval = param.snapshot_interval
+    return param_new
+
+
+def run_daemon(param, bugzilla, esq, esq_comments, last_run_time, kwargs, please_stop, esq_current=None):
+    """
+    RUN INCREMENTAL ETL EVERY param.interval SECONDS, UNTIL please_stop
+    THE DATABASE CONNECTIONS, ALIASES, AND ES METADATA ARE KEPT BETWEEN RUNS
+    """
+    interval = coalesce(param.interval, DAEMON_INTERVAL)
+    Log.note("Poll for changes every {{interval}} seconds", interval=interval)
+    alias_analyzer = AliasAnalyzer(kwargs.alias)
+    db = None
+
+    with esq.es.threaded_queue(max_size=500, silent=True) as output_queue, current_queue(esq_current) as current_output_queue:
+        METRICS.watch(output_queue)
+        if current_output_queue:
+            METRICS.watch(current_output_queue)
+        while not please_stop:
+            (Till(seconds=interval) | please_stop).wait()
+            if please_stop:
+                break
+
+            try:
+                if db is None:
+                    db = MySQL(kwargs=bugzilla, readonly=True)
+                current_run_time = get_current_time(db)
+                with Timer("run incremental etl"):
+                    incremental_etl(
+                        param=get_run_param(db, param, last_run_time),
+                        db=db,
+                        esq=esq,
+                        esq_comments=esq_comments,
+                        bug_output_queue=output_queue,
+                        comment_output_queue=esq_comments.es,
+                        alias_analyzer=alias_analyzer,
+                        esq_current=esq_current,
+                        current_output_queue=current_output_queue,
+                        kwargs=kwargs
+                    )
+
+                    # ALL BUG VERSIONS MUST BE IN ES BEFORE WE MOVE last_run_time
+                    pushed = Signal("all bugs pushed")
+                    output_queue.add(lambda: pushed.go())
+                    (pushed | please_stop).wait()
+                    if please_stop:
+                        break
+                    if current_output_queue:
+                        current_pushed = Signal("all current bugs pushed")
+                        current_output_queue.add(lambda: current_pushed.go())
+                        (current_pushed | please_stop).wait()
+                        if please_stop:
+                            break
+
+                last_run_time = convert.datetime2milli(current_run_time)
+                File(param.last_run_time).write(text_type(last_run_time))
+                METRICS.write(last_run_time=last_run_time)
+            except Exception as e:
+                Log.warning("Problem with incremental ETL, will reconnect and try again", cause=e)
+                # CONNECTIONS MAY HAVE GONE STALE
+                close_db_connections()
+                if db is not None:
+                    try:
+                        db.close()
+                    except Exception:
+                        pass
+                    db = None
+
+    if db is not None:
+        db.close()
 
 
 def get_min_bug_id(esq):
@@ -463,6 +652,7 @@ def close_db_connections():
 
 
 def setup():
+    profiler = None
     try:
         settings = startup.read_settings(defs=[{
             "name": ["--quick", "--fast"],
@@ -474,8 +664,22 @@ def setup():
             "help": "use this to force a reprocessing of all data",
             "action": "store_true",
             "dest": "restart"
+        }, {
+            "name": ["--replay"],
+            "help": "use this to read the extracted rows from the cache directory, not from the database",
+            "action": "store_true",
+            "dest": "replay"
+        }, {
+            "name": ["--daemon"],
+            "help": "use this to keep running, and poll for changes every param.interval seconds",
+            "action": "store_true",
+            "dest": "daemon"
         }])
         constants.set(settings.constants)
+        if settings.args.replay:
+            if not settings.cache.directory:
+                Log.error("--replay requires a cache.directory in the settings")
+            settings.cache.replay = True
 
         with startup.SingleInstance(flavor_id=settings.args.filename):
             if settings.args.restart:
@@ -486,10 +690,21 @@ def setup():
                 File(settings.param.last_run_time).delete()
 
             Log.start(settings.debug)
+            if settings.metrics:
+                METRICS.start(kwargs=settings.metrics)
+                METRICS.gauge("jx.compile.hit", lambda: COMPILE_STATS["hit"])
+                METRICS.gauge("jx.compile.miss", lambda: COMPILE_STATS["miss"])
+                METRICS.gauge("parse.canonical.hit", lambda: CANONICAL_STATS["hit"])
+                METRICS.gauge("parse.canonical.miss", lambda: CANONICAL_STATS["miss"])
+            if settings.profile.filename:
+                profiler = SamplingProfiler(kwargs=settings.profile).start()
             main(settings)
     except Exception as e:
         Log.error("Can not start", e)
     finally:
+        if profiler:
+            profiler.stop()
+        METRICS.stop()
         MAIN_THREAD.stop()
 
 
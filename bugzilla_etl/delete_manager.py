@@ -0,0 +1,118 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+# COLLECT ALL THE RECORDS TO BE REMOVED FROM AN INDEX, AND SEND THEM AS
+# ASYNCHRONOUS delete_by_query TASKS SO ES CAN DELETE WHILE WE EXTRACT
+#
+# INDEXES THAT HOLD THE SAME BUGS (LIKE THE CURRENT BUGS INDEX) CAN SHARE ONE
+# DeleteManager, SO THEY ARE SENT THE SAME DELETES
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+from bugzilla_etl.metrics import METRICS
+from jx_python import jx
+from mo_logs import Log
+from mo_threads import Till
+from mo_times.timer import Timer
+
+BATCH_SIZE = 1000  # MAXIMUM NUMBER OF ids IN A SINGLE terms FILTER
+MAX_TASKS = 10  # MAXIMUM NUMBER OF delete_by_query TASKS RUNNING AT ONCE
+POLL_INTERVAL = 1  # SECONDS BETWEEN CHECKS ON THE TASKS
+TIMEOUT = 600  # SECONDS TO WAIT FOR ALL TASKS
+
+
+class DeleteManager(object):
+
+    def __init__(self, *indexes):
+        """
+        :param indexes: THE pyLibrary.env.elasticsearch.Index(es) TO DELETE FROM
+        """
+        self.indexes = [i for i in indexes if i is not None]
+        self.pending = {}  # MAP FROM FIELD NAME TO SET OF VALUES TO DELETE
+        self.tasks = []  # LIST OF (index, task id) PAIRS
+
+    def delete(self, field, values):
+        """
+        REMEMBER TO DELETE ALL RECORDS WITH field IN values
+        """
+        self.pending.setdefault(field, set()).update(v for v in values if v is not None)
+
+    def start(self):
+        """
+        SEND ALL PENDING DELETES TO ES, DO NOT WAIT FOR THEM TO FINISH
+        """
+        pending, self.pending = self.pending, {}
+        for index in self.indexes:
+            self._start(index, pending)
+
+    def _start(self, index, pending):
+        if int(index.cluster.version.split(".")[0]) < 5:
+            # NO TASK API, DELETE THE OLD WAY
+            with METRICS.timer("delete_by_query"):
+                for field, values in pending.items():
+                    for _, ids in jx.groupby(jx.sort(values), size=BATCH_SIZE):
+                        index.delete_record({"terms": {field + ".~n~": ids}})
+                        METRICS.counter("delete_by_query").inc(len(ids))
+            return
+
+        for field, values in pending.items():
+            for _, ids in jx.groupby(jx.sort(values), size=BATCH_SIZE):
+                if len(self.tasks) >= MAX_TASKS:
+                    # DO NOT FLOOD THE CLUSTER WITH TASKS
+                    with METRICS.timer("delete_by_query"):
+                        self._wait(MAX_TASKS - 1)
+                result = index.cluster.post(
+                    "/" + index.settings.index + "/_delete_by_query",
+                    json={"query": {"terms": {field + ".~n~": ids}}},
+                    timeout=60,
+                    params={"wait_for_completion": "false", "conflicts": "proceed"}
+                )
+                if not result.task:
+                    Log.error("Expecting a task from {{index}}:\n{{data|pretty}}", index=index.settings.index, data=result)
+                self.tasks.append((index, result.task))
+                METRICS.counter("delete_by_query").inc(len(ids))
+
+    def wait(self, please_stop=None):
+        """
+        SEND ANY PENDING DELETES, AND WAIT FOR ALL THE TASKS TO COMPLETE
+        """
+        self.start()
+        if not self.tasks:
+            return
+
+        names = [i.settings.index for i in self.indexes]
+        with METRICS.timer("delete_by_query"), Timer("wait for {{num}} deletes on {{index}}", {"num": len(self.tasks), "index": names}):
+            self._wait(0, please_stop)
+
+    def _wait(self, limit, please_stop=None):
+        """
+        WAIT UNTIL NO MORE THAN limit TASKS ARE RUNNING
+        """
+        timeout = Till(seconds=TIMEOUT)
+        while len(self.tasks) > limit:
+            index, task = self.tasks[0]
+            status = index.cluster.get("/_tasks/" + task, timeout=60)
+            if status.completed:
+                self.tasks.pop(0)
+                if status.error or status.response.failures:
+                    Log.error(
+                        "Failure to delete from {{index}}:\n{{data|pretty}}",
+                        index=index.settings.index,
+                        data=status
+                    )
+                continue
+            if please_stop or timeout:
+                Log.error(
+                    "Gave up waiting on {{num}} deletes from {{index}}",
+                    num=len(self.tasks),
+                    index=[i.settings.index for i in self.indexes]
+                )
+            (Till(seconds=POLL_INTERVAL) | please_stop | timeout).wait()
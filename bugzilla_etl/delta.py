@@ -0,0 +1,245 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+# COMPACT BUG HISTORY: A FULL SNAPSHOT EVERY snapshot_interval VERSIONS, AND
+# ONLY WHAT CHANGED FOR THE VERSIONS IN BETWEEN
+#
+# A DELTA DOCUMENT LOOKS LIKE A SPARSE BUG VERSION: IT HAS THE PROPERTIES
+# THAT ARE DIFFERENT FROM THE PREVIOUS VERSION (INCLUDING THE changes OF THE
+# VERSION), THE ALWAYS PROPERTIES, AND A delta PROPERTY:
+#
+#     "delta": {
+#         "snapshot": 1,                  # bug_version_num OF THE SNAPSHOT THIS DELTA BUILDS ON
+#         "unset": ["keywords"],          # PROPERTIES THAT ARE GONE
+#         "merge": ["previous_values"],   # OBJECTS WITH ONLY THE KEYS THAT CHANGED
+#         "lists": ["cc"],                # MULTI-VALUE FIELDS WITH ONLY THE VALUES ADDED
+#         "removed": [{"field_name": "cc", "value": "someone@example.com"}],
+#         "attachments": [12, 14]         # attach_id OF ALL ATTACHMENTS, IN ORDER
+#     }
+#
+# WITH delta.attachments, THE attachments PROPERTY ONLY HAS THE ATTACHMENTS
+# THAT CHANGED; THE REST ARE THE SAME AS THE PREVIOUS VERSION.  THE lists ARE
+# SORTED AFTER THE CHANGE, LIKE normalize() DOES
+#
+# SNAPSHOTS ARE THE FULL BUG VERSION, WITHOUT A delta PROPERTY
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from bugzilla_etl.transform_bugzilla import MULTI_FIELDS, _sort
+from mo_dots import listwrap, unwrap, wrap
+from mo_future import text_type
+from mo_logs import Log
+
+DELTA = "delta"  # PROPERTY THAT MARKS A DELTA DOCUMENT
+ALWAYS = ["bug_id", "id", "bug_version_num", "modified_ts", "expires_on"]  # PROPERTIES IN EVERY DELTA, SO THEY CAN BE QUERIED
+MERGED = {"previous_values"}  # OBJECTS THAT MOSTLY GROW, SO ONLY THE KEYS THAT CHANGED ARE STORED
+
+
+class DeltaEncoder(object):
+
+    def __init__(self, snapshot_interval):
+        """
+        :param snapshot_interval: NUMBER OF VERSIONS FROM ONE SNAPSHOT TO THE NEXT
+        """
+        if snapshot_interval < 1:
+            Log.error("Expecting a positive snapshot_interval, not {{num}}", num=snapshot_interval)
+        self.snapshot_interval = snapshot_interval
+        self.previous = None  # THE LAST VERSION ENCODED
+        self.snapshot = None  # bug_version_num OF THE LAST SNAPSHOT
+
+    def encode(self, version):
+        """
+        :param version: THE NEXT (NORMALIZED) VERSION OF THE BUG
+        :return: THE SNAPSHOT, OR DELTA, TO STORE INSTEAD OF version
+        """
+        version = unwrap(version)
+        previous, self.previous = self.previous, version
+        num = version["bug_version_num"]
+        if (
+            previous is None or
+            previous["bug_id"] != version["bug_id"] or
+            previous["bug_version_num"] != num - 1 or
+            (num - 1) % self.snapshot_interval == 0
+        ):
+            self.snapshot = num
+            return wrap(version)
+
+        output = {k: version[k] for k in ALWAYS if k in version}
+        delta = {"snapshot": self.snapshot}
+        unset = [k for k in previous if k not in version]
+        if unset:
+            delta["unset"] = sorted(unset)
+        for k, v in version.items():
+            p = previous.get(k)
+            if p is v or p == v:
+                continue
+            if k in MERGED and p.__class__ is dict and v.__class__ is dict and all(pk in v for pk in p):
+                output[k] = {vk: vv for vk, vv in v.items() if not _same(p.get(vk), vv)}
+                delta.setdefault("merge", []).append(k)
+            elif k in MULTI_FIELDS and _simple(p) and _simple(v):
+                added, removed = _list_diff(p, v)
+                if _merge_list(p, added, removed) != v:
+                    output[k] = v
+                    continue
+                if added:
+                    output[k] = added
+                delta.setdefault("lists", []).append(k)
+                delta.setdefault("removed", []).extend({"field_name": k, "value": r} for r in removed)
+            else:
+                output[k] = v
+
+        if "attachments" in output:
+            prev_attachments = _by_id(previous.get("attachments"))
+            curr_attachments = _by_id(version["attachments"])
+            if prev_attachments is not None and curr_attachments is not None:
+                changed = []
+                for a in listwrap(version["attachments"]):
+                    p = prev_attachments.get(a["attach_id"])
+                    if p is not a and p != a:
+                        changed.append(a)
+                delta["attachments"] = [unwrap(a)["attach_id"] for a in listwrap(version["attachments"])]
+                if changed:
+                    output["attachments"] = changed
+                else:
+                    del output["attachments"]
+
+        output[DELTA] = delta
+        return wrap(output)
+
+
+def _same(a, b):
+    return a is b or a == b
+
+
+def _simple(value):
+    """
+    :return: True IF value IS A (LIST OF) TEXT OR INTEGERS
+    """
+    return all(v.__class__ in (text_type, int) for v in listwrap(value))
+
+
+def _list_diff(previous, current):
+    """
+    :return: (added, removed) VALUES
+    """
+    remaining = Counter(listwrap(previous))
+    added = []
+    for v in listwrap(current):
+        if remaining[v]:
+            remaining[v] -= 1
+        else:
+            added.append(v)
+    return added, sorted(remaining.elements(), key=text_type)
+
+
+def _merge_list(previous, added, removed):
+    """
+    :return: THE previous VALUES, WITHOUT removed, WITH added, AS normalize() WOULD HAVE IT
+    """
+    values = list(listwrap(previous))
+    for r in removed:
+        values.remove(r)
+    values.extend(listwrap(added))
+    values = _sort(values)
+    if not values:
+        return None
+    elif len(values) == 1:
+        return values[0]
+    return values
+
+
+def _by_id(attachments):
+    """
+    :return: MAP FROM attach_id TO ATTACHMENT, OR None IF THE ATTACHMENTS CAN NOT BE KEYED THAT WAY
+    """
+    output = {}
+    for a in listwrap(attachments):
+        a = unwrap(a)
+        if not isinstance(a, dict):
+            return None
+        attach_id = a.get("attach_id")
+        if attach_id is None or attach_id in output:
+            return None
+        output[attach_id] = a
+    return output
+
+
+def versions(docs):
+    """
+    :param docs: SNAPSHOTS AND DELTAS OF ONE BUG, IN ANY ORDER, STARTING WITH A SNAPSHOT
+    :return: GENERATOR OF THE FULL VERSIONS, IN ORDER
+    """
+    docs = sorted((unwrap(d) for d in docs), key=lambda d: d["bug_version_num"])
+    state = None
+    for doc in docs:
+        delta = doc.get(DELTA)
+        if delta is None:
+            state = doc
+        elif state is None or state["bug_version_num"] != doc["bug_version_num"] - 1:
+            Log.error(
+                "[Bug {{bug_id}}]: Expecting version {{expected}} before delta {{num}}",
+                bug_id=doc["bug_id"],
+                expected=doc["bug_version_num"] - 1,
+                num=doc["bug_version_num"]
+            )
+        else:
+            state = _apply(state, doc, delta)
+        yield wrap(state)
+
+
+def reconstruct(docs, bug_version_num=None):
+    """
+    :param docs: SNAPSHOTS AND DELTAS OF ONE BUG, IN ANY ORDER; FROM THE SNAPSHOT AT, OR BEFORE, bug_version_num
+    :param bug_version_num: THE VERSION WANTED (DEFAULT IS THE LAST)
+    :return: THE FULL VERSION
+    """
+    output = None
+    for v in versions(docs):
+        if bug_version_num is None or v.bug_version_num <= bug_version_num:
+            output = v
+    if output is None or (bug_version_num is not None and output.bug_version_num != bug_version_num):
+        Log.error("Can not reconstruct version {{num}}", num=bug_version_num)
+    return output
+
+
+def _apply(state, doc, delta):
+    """
+    :return: NEW VERSION; state IS NOT CHANGED
+    """
+    output = dict(state)
+    for k in delta.get("unset", []):
+        output.pop(k, None)
+    merge = delta.get("merge", [])
+    lists = delta.get("lists", [])
+    for k, v in doc.items():
+        if k == DELTA or k in lists:
+            continue
+        elif k in merge:
+            output[k] = dict(state[k])
+            output[k].update(v)
+        else:
+            output[k] = v
+
+    for k in lists:
+        removed = [r["value"] for r in delta.get("removed", []) if r["field_name"] == k]
+        output[k] = _merge_list(state.get(k), doc.get(k), removed)
+
+    order = delta.get("attachments")
+    if order is not None:
+        attachments = _by_id(state.get("attachments"))
+        for a in listwrap(doc.get("attachments")):
+            a = unwrap(a)
+            attachments[a["attach_id"]] = a
+        attachments = [attachments[i] for i in order]
+        output["attachments"] = attachments[0] if len(attachments) == 1 else attachments
+    return output
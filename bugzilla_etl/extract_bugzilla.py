@@ -160,79 +160,81 @@ def get_private_bugs_for_delete(db, param):
         Log.error("problem getting private bugs", e)
 
 
-def get_recent_private_bugs(db, param):
+def get_recent_changes(db, param):
     """
-    GET ONLY BUGS THAT HAVE SWITCHED PRIVACY INDICATOR
-    THIS LIST IS USED TO SIGNAL BUGS THAT NEED TOTAL RE-ETL
-    """
-    param.field_id = PRIVATE_BUG_GROUP_FIELD_ID
-
-    try:
-        output = db.query("""
-        SELECT
-            a.bug_id
-        FROM
-            bugs_activity a
-        WHERE
-            bug_when >= {{start_time_str}} AND
-            fieldid={{field_id}}
-        """, param)
-
-        return set(output.bug_id)
-
-    except Exception as e:
-        Log.error("problem getting recent private attachments", e)
-
-
-def get_recent_private_attachments(db, param):
-    """
-    GET ONLY RECENT ATTACHMENTS THAT HAVE SWITCHED PRIVACY INDICATOR
-    THIS LIST IS USED TO SIGNAL BUGS THAT NEED TOTAL RE-ETL
-    """
-    if param.allow_private_bugs:
-        return []
-
-    param.field_id = PRIVATE_ATTACHMENT_FIELD_ID
-
-    try:
-        return db.query("""
-        SELECT
-            a.attach_id,
-            a.bug_id
-        FROM
-            bugs_activity a
-        WHERE
-            bug_when >= {{start_time_str}} AND
-            fieldid={{field_id}}
-        """, param)
-    except Exception as e:
-        Log.error("problem getting recent private attachments", e)
-
-
-def get_recent_private_comments(db, param):
-    """
-    GET COMMENTS THAT HAVE HAD THEIR PRIVACY INDICATOR CHANGED
+    ONE PASS OVER bugs AND bugs_activity (BOTH INDEXED ON TIME) TO FIND ALL
+    BUGS THAT NEED ETL SINCE param.start_time_str
+    :return: Data WITH
+        changed - BUGS WITH ANY CHANGE (ONLY PUBLIC BUGS, UNLESS allow_private_bugs)
+        privacy - BUGS THAT SWITCHED PRIVACY INDICATOR, THEY NEED TOTAL RE-ETL
+        private_attachments - BUGS WITH ATTACHMENTS THAT SWITCHED PRIVACY INDICATOR, THEY NEED TOTAL RE-ETL
+        private_comments - COMMENTS THAT SWITCHED PRIVACY INDICATOR
     """
     if param.allow_private_bugs:
-        return []
-
-    param.field_id = PRIVATE_COMMENTS_FIELD_ID
+        public_join = SQL("")
+        public_filter = SQL("1=1")  # ALWAYS TRUE, ALLOWS ALL BUGS
+        field_ids = [PRIVATE_BUG_GROUP_FIELD_ID]
+    else:
+        public_join = SQL("LEFT JOIN bug_group_map m ON m.bug_id=b.bug_id")
+        public_filter = esfilter2sqlwhere({"missing": "m.bug_id"})
+        field_ids = [PRIVATE_BUG_GROUP_FIELD_ID, PRIVATE_ATTACHMENT_FIELD_ID, PRIVATE_COMMENTS_FIELD_ID]
 
     try:
-        comments = db.query("""
+        changes = db.query(
+            """
             SELECT
-                a.comment_id,
-                a.bug_id
+                b.bug_id,
+                'changed' AS category,
+                CAST(null AS signed) AS comment_id
+            FROM
+                bugs b
+            {{public_join}}
+            WHERE
+                b.delta_ts >= {{start_time_str}} AND
+                {{public_filter}}
+            UNION ALL
+            SELECT
+                a.bug_id,
+                CASE a.fieldid
+                WHEN {{private_bug_field}} THEN 'privacy'
+                WHEN {{private_attachment_field}} THEN 'private_attachment'
+                ELSE 'private_comment'
+                END AS category,
+                a.comment_id
             FROM
                 bugs_activity a
             WHERE
-                bug_when >= {{start_time_str}} AND
-                fieldid={{field_id}}
-            """, param)
-
-        return comments
+                a.bug_when >= {{start_time_str}} AND
+                {{field_filter}}
+            """,
+            {
+                "public_join": public_join,
+                "public_filter": public_filter,
+                "start_time_str": param.start_time_str,
+                "private_bug_field": PRIVATE_BUG_GROUP_FIELD_ID,
+                "private_attachment_field": PRIVATE_ATTACHMENT_FIELD_ID,
+                "field_filter": esfilter2sqlwhere({"terms": {"a.fieldid": field_ids}})
+            }
+        )
     except Exception as e:
-        Log.error("problem getting recent private attachments", e)
+        Log.error("problem getting recent changes", e)
+
+    output = Data(
+        changed=set(),
+        privacy=set(),
+        private_attachments=set(),
+        private_comments=set()
+    )
+    for c in changes:
+        if c.category == "changed":
+            output.changed.add(c.bug_id)
+        elif c.category == "privacy":
+            output.privacy.add(c.bug_id)
+        elif c.category == "private_attachment":
+            output.private_attachments.add(c.bug_id)
+        else:
+            output.private_comments.add(c.comment_id)
+    return output
 
 
 def get_bugs(db, param):
@@ -269,6 +271,7 @@ def get_bugs(db, param):
         bugs = db.query(
             """
             SELECT
+                1 AS _merge_order,
                 b.bug_id,
                 UNIX_TIMESTAMP(b.creation_ts)*1000 AS modified_ts,
                 pr.login_name AS modified_by,
@@ -317,29 +320,12 @@ def get_bugs(db, param):
 
         if len(bugs) > len(param.bug_list):
             Log.error("expecting {{num}} bugs; likely a logic error", num=len(param.bug_list))
-        #bugs IS LIST OF BUGS WHICH MUST BE CONVERTED TO THE DELTA RECORDS FOR ALL FIELDS
-        output = []
-        for r in bugs:
-            flatten_bugs_record(r, output)
-
-        return output
+        # ONE ROW PER BUG, WITH ALL COLUMNS (NO field_name); THE PARSER APPLIES THEM AT ONCE
+        return bugs
     except Exception as e:
         Log.error("can not get basic bug data", cause=e)
 
 
-def flatten_bugs_record(r, output):
-    for field_name, value in r.items():
-        if value != "---":
-            newRow = Data()
-            newRow.bug_id = r.bug_id
-            newRow.modified_ts = r.modified_ts
-            newRow.modified_by = r.modified_by
-            newRow.field_name = field_name
-            newRow.new_value = value
-            newRow._merge_order = 1
-            output.append(newRow)
-
-
 def get_dependencies(db, param):
     param.blocks_filter = esfilter2sqlwhere({"terms": {"blocked": param.bug_list}})
     param.dependson_filter = esfilter2sqlwhere({"terms": {"dependson": param.bug_list}})
@@ -563,7 +549,8 @@ def get_attachments(db, param):
 
     param.bug_filter = esfilter2sqlwhere({"terms": {"bug_id": param.bug_list}})
 
-    output = db.query("""
+    # ONE ROW PER ATTACHMENT, WITH ALL COLUMNS (NO field_name); THE PARSER APPLIES THEM AT ONCE
+    return db.query("""
         SELECT bug_id
             , UNIX_TIMESTAMP(a.creation_ts)*1000 AS modified_ts
             , login_name AS modified_by
@@ -574,6 +561,7 @@ def get_attachments(db, param):
             , isprivate AS 'attachments_isprivate'
             , mimetype AS 'attachments_mimetype'
             , attach_id
+            , 7 AS _merge_order
         FROM
             attachments a
             JOIN profiles p ON a.submitter_id = p.userid
@@ -585,25 +573,6 @@ def get_attachments(db, param):
             attach_id,
             a.creation_ts
     """, param)
-    return flatten_attachments(output)
-
-
-def flatten_attachments(data):
-    output = []
-    for r in data:
-        for k,v in r.items():
-            if k=="bug_id":
-                continue
-            output.append(Data(
-                bug_id=r.bug_id,
-                modified_ts=r.modified_ts,
-                modified_by=r.modified_by,
-                field_name=k,
-                new_value=v, #THESE NAMES HAVE DOTS IN THEM
-                attach_id=r.attach_id,
-                _merge_order=7
-            ))
-    return output
 
 
 def get_bug_see_also(db, param):
@@ -0,0 +1,125 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+# KEEP A LOCAL COPY OF THE ROWS EXTRACTED FROM BUGZILLA, ONE GZIP FILE PER
+# ETL BLOCK, ONE JSON RECORD PER LINE.  WHEN replay IS ON, THE full_etl WILL
+# READ THESE FILES INSTEAD OF HITTING THE DATABASE, SO A CHANGE TO THE
+# PARSER (OR THE TRANSFORM) CAN BE REPROCESSED WITHOUT TOUCHING THE REPLICA
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import os
+import re
+from datetime import datetime, date
+
+from mo_dots import wrap, Data
+from mo_files import File
+from mo_json import value2json, json2value
+from mo_kwargs import override
+from mo_logs import Log
+from pyLibrary.env.big_data import ibytes2icompressed, ibytes2ilines, scompressed2ibytes
+
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+DATE_FORMAT = "%Y-%m-%d"
+BUGS = "bugs"
+COMMENTS = "comments"
+FILENAME_PATTERN = re.compile(r"^" + BUGS + r"_(\d+)_(\d+)\.json\.gz$")
+
+
+class ExtractCache(object):
+
+    @override
+    def __init__(
+        self,
+        directory,      # WHERE THE BLOCK FILES ARE KEPT
+        replay=False,   # True TO READ FROM THE FILES, NOT THE DATABASE
+        kwargs=None
+    ):
+        self.directory = File(directory)
+        self.replay = replay in [True, "true"]
+        self.kwargs = kwargs
+
+        if self.replay and not self.directory.exists:
+            Log.error("Can not replay from {{directory}}, it does not exist", directory=self.directory.abspath)
+
+    def blocks(self):
+        """
+        :return: LIST OF (min, max) PAIRS FOR THE BLOCKS IN THE CACHE
+        """
+        output = []
+        if not self.directory.exists:
+            return output
+        for f in os.listdir(self.directory.abspath):
+            match = FILENAME_PATTERN.match(f)
+            if match:
+                output.append((int(match.group(1)), int(match.group(2))))
+        return sorted(output)
+
+    def write(self, name, block, rows):
+        """
+        WRITE rows TO THE CACHE, REPLACING WHAT WAS THERE BEFORE
+        :param name: BUGS OR COMMENTS
+        :param block: {"min": min, "max": max} OF THE ETL BLOCK
+        :param rows: LIST OF ROWS, AS RETURNED BY THE extract_bugzilla FUNCTIONS
+        """
+        file = self._file(name, block)
+        temp = File(file.abspath + ".tmp")
+        if not self.directory.exists:
+            self.directory.create()
+
+        lines = (value2json(_encode(r)).encode("utf8") + b"\n" for r in rows)
+        with open(temp.abspath, "wb") as f:
+            for chunk in ibytes2icompressed(lines):
+                f.write(chunk)
+        # DO NOT LEAVE A HALF-WRITTEN FILE FOR replay TO FIND
+        os.rename(temp.abspath, file.abspath)
+
+    def read(self, name, block):
+        """
+        :return: GENERATOR OF ROWS, SAME AS THE extract_bugzilla FUNCTIONS WOULD HAVE RETURNED
+        """
+        file = self._file(name, block)
+        if not file.exists:
+            return
+
+        with open(file.abspath, "rb") as f:
+            for line in ibytes2ilines(scompressed2ibytes(f)):
+                if line:
+                    yield _decode(json2value(line))
+
+    def _file(self, name, block):
+        return File.new_instance(self.directory, name + "_" + str(block.min) + "_" + str(block.max) + ".json.gz")
+
+
+def _encode(row):
+    # JSON WILL FLATTEN DATES TO NUMBERS, MARK THEM SO WE GET THE SAME TYPES BACK
+    output = {}
+    for k, v in row.items():
+        if isinstance(v, datetime):
+            output[k] = {"$datetime": v.strftime(DATETIME_FORMAT)}
+        elif isinstance(v, date):
+            output[k] = {"$date": v.strftime(DATE_FORMAT)}
+        else:
+            output[k] = v
+    return output
+
+
+def _decode(row):
+    output = Data()
+    for k, v in row.items():
+        if isinstance(v, Data) or isinstance(v, dict):
+            v = wrap(v)
+            if v["$datetime"] != None:
+                v = datetime.strptime(v["$datetime"], DATETIME_FORMAT)
+            elif v["$date"] != None:
+                v = datetime.strptime(v["$date"], DATE_FORMAT).date()
+        output[k] = v
+    return output
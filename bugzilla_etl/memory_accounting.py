@@ -0,0 +1,124 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+# FIND THE BUGS THAT COST THE MOST MEMORY TO PARSE
+#
+# tracemalloc (WITH ONE FRAME) COUNTS THE BYTES ALLOCATED BY PYTHON. WE LOOK
+# AT THE COUNT WHEN EACH BUG STARTS, AS EACH VERSION IS EMITTED, AND WHEN THE
+# BUG IS DONE.  THE HEAVIEST BUGS ARE KEPT UNTIL THE NEXT report()
+#
+# tracemalloc COUNTS ALL THREADS, SO THE NUMBERS ARE NOISY WHEN OTHER THREADS
+# ARE BUSY; BUT PATHOLOGICAL BUGS STILL STAND OUT
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import heapq
+
+from mo_future import PYPY
+from mo_logs import Log
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+DEFAULT_TOP = 20
+
+
+class MemoryAccounting(object):
+
+    def __init__(self, top=DEFAULT_TOP):
+        """
+        :param top: NUMBER OF BUGS TO KEEP IN THE REPORT
+        """
+        self.top = top
+        self.heaviest = []  # HEAP OF (peak, bug_id, stats)
+        self.bug_id = None
+        self.enabled = False
+        if PYPY or tracemalloc is None:
+            Log.warning("tracemalloc is not available, no memory accounting")
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+        self.enabled = True
+
+    def start_bug(self, bug_id):
+        if not self.enabled:
+            return
+        self.bug_id = bug_id
+        self.rows = 0
+        self.activities = 0
+        self.start, _ = tracemalloc.get_traced_memory()
+        self.peak = self.start
+
+    def row(self):
+        if self.enabled:
+            self.rows += 1
+
+    def start_replay(self, activities):
+        """
+        ALL ROWS ARE IN; NOW BUILDING THE VERSIONS
+        :param activities: NUMBER OF CHANGE SETS TO REPLAY
+        """
+        if not self.enabled:
+            return
+        self.activities = activities
+        self.sample()
+
+    def sample(self):
+        if not self.enabled:
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.peak:
+            self.peak = current
+
+    def end_bug(self, versions):
+        """
+        :param versions: NUMBER OF VERSIONS EMITTED FOR THE BUG
+        """
+        if not self.enabled or self.bug_id is None:
+            return
+        self.sample()
+        current, _ = tracemalloc.get_traced_memory()
+        stats = {
+            "bug_id": self.bug_id,
+            "rows": self.rows,
+            "activities": self.activities,
+            "versions": versions,
+            "peak": self.peak - self.start,
+            "retained": current - self.start
+        }
+        entry = (stats["peak"], self.bug_id, stats)
+        if len(self.heaviest) < self.top:
+            heapq.heappush(self.heaviest, entry)
+        elif entry > self.heaviest[0]:
+            heapq.heapreplace(self.heaviest, entry)
+        self.bug_id = None
+
+    def report(self, **context):
+        """
+        LOG THE HEAVIEST BUGS SINCE THE LAST report(), AND START AGAIN
+        :param context: EXTRA PARAMETERS FOR THE LOG LINE (LIKE THE block)
+        :return: LIST OF STATS, HEAVIEST FIRST
+        """
+        heaviest, self.heaviest = self.heaviest, []
+        output = [stats for _, _, stats in sorted(heaviest, reverse=True)]
+        if output:
+            Log.note(
+                "Heaviest {{num}} bugs {{context|json}}:\n{{bugs|indent}}",
+                num=len(output),
+                context=context,
+                bugs="\n".join(
+                    "bug {bug_id}: peak {peak:,} bytes, retained {retained:,} bytes, {versions} versions, {activities} activities, {rows} rows".format(**s)
+                    for s in output
+                )
+            )
+        return output
@@ -0,0 +1,311 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+# COUNTERS, GAUGES AND LATENCY HISTOGRAMS FOR THE ETL STAGES
+#
+# EVERY SNAPSHOT COVERS THE TIME SINCE THE PREVIOUS SNAPSHOT: COUNTERS AND
+# HISTOGRAMS ARE RESET AFTER EACH WRITE, GAUGES ARE READ AT WRITE TIME.
+# SNAPSHOTS GO TO A JSON-LINES FILE, AND (OPTIONALLY) TO AN ES INDEX
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+from bisect import bisect_left
+from time import time
+
+from mo_dots import coalesce
+from mo_files import File
+from mo_json import value2json
+from mo_kwargs import override
+from mo_logs import Log
+from mo_threads import Lock, Thread, Till
+from mo_threads.sampler import push_stage, pop_stage
+from mo_times import Date
+
+DEFAULT_INTERVAL = 60  # SECONDS BETWEEN SNAPSHOTS
+BUCKETS = [0.0001 * 2 ** i for i in range(24)]  # UPPER BOUNDS, IN SECONDS: 100us TO ~14min
+PERCENTILES = [("p50", 0.5), ("p90", 0.9), ("p99", 0.99)]
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.lock = Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def _take(self):
+        with self.lock:
+            value, self.value = self.value, 0
+        return value
+
+
+class Gauge(object):
+
+    def __init__(self, func=None):
+        """
+        :param func: OPTIONAL FUNCTION TO READ THE CURRENT VALUE
+        """
+        self.func = func
+        self.value = None
+
+    def set(self, value):
+        self.value = value
+
+    def _take(self):
+        if self.func:
+            try:
+                return self.func()
+            except Exception:
+                return None
+        return self.value
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.lock = Lock()
+        self._clear()
+
+    def _clear(self):
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.sum += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+            self.buckets[bisect_left(BUCKETS, seconds)] += 1
+
+    def _take(self):
+        with self.lock:
+            if not self.count:
+                return None
+            output = {
+                "count": self.count,
+                "sum": self.sum,
+                "min": self.min,
+                "max": self.max
+            }
+            for name, p in PERCENTILES:
+                output[name] = self._percentile(p)
+            self._clear()
+        return output
+
+    def _percentile(self, p):
+        """
+        :return: UPPER BOUND OF THE BUCKET HOLDING PERCENTILE p, NO MORE THAN max
+        """
+        limit = p * self.count
+        total = 0
+        for i, c in enumerate(self.buckets):
+            total += c
+            if total >= limit:
+                if i == len(BUCKETS):
+                    return self.max
+                return min(BUCKETS[i], self.max)
+        return self.max
+
+
+class _Timing(object):
+    """
+    ALSO MARKS THE STAGE FOR THE SAMPLING PROFILER
+    """
+
+    __slots__ = ["name", "histogram", "start"]
+
+    def __init__(self, name, histogram):
+        self.name = name
+        self.histogram = histogram
+
+    def __enter__(self):
+        push_stage(self.name)
+        self.start = time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.add(time() - self.start)
+        pop_stage()
+
+
+class Metrics(object):
+    """
+    A REGISTRY OF NAMED METRICS; THE SAME NAME ALWAYS GIVES THE SAME METRIC
+    """
+
+    def __init__(self):
+        self.lock = Lock("metrics")
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.file = None
+        self.es = None
+        self.worker = None
+
+    def counter(self, name):
+        output = self.counters.get(name)
+        if output is None:
+            with self.lock:
+                output = self.counters.setdefault(name, Counter())
+        return output
+
+    def gauge(self, name, func=None):
+        """
+        :param func: OPTIONAL FUNCTION TO CALL AT SNAPSHOT TIME; REPLACES ANY PREVIOUS GAUGE WITH THE SAME NAME
+        """
+        with self.lock:
+            if func is not None:
+                self.gauges[name] = Gauge(func)
+            return self.gauges.setdefault(name, Gauge())
+
+    def histogram(self, name):
+        output = self.histograms.get(name)
+        if output is None:
+            with self.lock:
+                output = self.histograms.setdefault(name, Histogram())
+        return output
+
+    def timer(self, name):
+        """
+        :return: CONTEXT MANAGER THAT ADDS THE ELAPSED SECONDS TO HISTOGRAM name, AND
+                 LABELS PROFILER SAMPLES OF THE CURRENT THREAD WITH name
+        """
+        return _Timing(name, self.histogram(name))
+
+    def watch(self, queue):
+        """
+        REPORT THE DEPTH OF A (Threaded)Queue AS GAUGE "queue.<name>"
+        """
+        self.gauge("queue." + queue.name, lambda: len(queue))
+
+    def instrument(self, index, name=None):
+        """
+        MEASURE THE ENCODING AND BULK INSERTS OF A pyLibrary.env.elasticsearch.Index
+        (Index.extend() DOES THE ENCODING, SO bulk TIME INCLUDES encode TIME)
+        :param index: THE INDEX (OR ANYTHING WITH encode() AND extend())
+        :param name: SUFFIX FOR THE METRIC NAMES (DEFAULT IS THE INDEX NAME)
+        :return: index
+        """
+        name = coalesce(name, index.settings.index)
+        encode_time = self.histogram("encode." + name)
+        encode_count = self.counter("encode." + name)
+        bulk_time = self.histogram("bulk." + name)
+        bulk_count = self.counter("bulk." + name)
+
+        encode = getattr(index, "encode", None)
+        if encode is not None:
+            def timed_encode(record):
+                start = time()
+                output = encode(record)
+                encode_time.add(time() - start)
+                encode_count.inc()
+                return output
+            index.encode = timed_encode
+
+        extend = index.extend
+
+        def timed_extend(records):
+            records = list(records)
+            start = time()
+            output = extend(records)
+            bulk_time.add(time() - start)
+            bulk_count.inc(len(records))
+            return output
+        index.extend = timed_extend
+        return index
+
+    def snapshot(self):
+        """
+        :return: ALL METRICS SINCE THE LAST snapshot()
+        """
+        with self.lock:
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+            histograms = list(self.histograms.items())
+
+        output = {"timestamp": Date.now().unix, "counters": {}, "gauges": {}, "histograms": {}}
+        for name, c in counters:
+            output["counters"][name] = c._take()
+        for name, g in gauges:
+            output["gauges"][name] = g._take()
+        for name, h in histograms:
+            value = h._take()
+            if value:
+                output["histograms"][name] = value
+        return output
+
+    @override
+    def start(self, filename=None, interval=DEFAULT_INTERVAL, elasticsearch=None, kwargs=None):
+        """
+        WRITE A SNAPSHOT EVERY interval SECONDS
+        :param filename: JSON-LINES FILE TO APPEND SNAPSHOTS TO
+        :param interval: SECONDS BETWEEN SNAPSHOTS
+        :param elasticsearch: OPTIONAL SETTINGS FOR AN INDEX (LIKE THE debug INDEX) TO ALSO SEND SNAPSHOTS TO
+        """
+        if filename:
+            self.file = File(filename)
+            if not self.file.parent.exists:
+                self.file.parent.create()
+        if elasticsearch:
+            try:
+                from pyLibrary.env.elasticsearch import Cluster
+
+                self.es = Cluster(elasticsearch).get_or_create_index(
+                    limit_replicas=True,
+                    typed=True,
+                    read_only=False,
+                    kwargs=elasticsearch
+                )
+            except Exception as e:
+                Log.warning("Can not send metrics to {{index}}", index=elasticsearch.index, cause=e)
+        if self.worker is None:
+            self.worker = Thread.run("metrics", self._writer, interval)
+
+    def _writer(self, interval, please_stop):
+        while not please_stop:
+            (Till(seconds=interval) | please_stop).wait()
+            self.write()
+
+    def write(self, **context):
+        """
+        APPEND A SNAPSHOT TO THE FILE, AND ES
+        :param context: EXTRA PROPERTIES FOR THE SNAPSHOT (LIKE THE ETL block)
+        """
+        if self.file is None and self.es is None:
+            return
+        record = self.snapshot()
+        record.update(context)
+        try:
+            if self.file is not None:
+                with open(self.file.abspath, "ab") as f:
+                    f.write((value2json(record) + "\n").encode("utf8"))
+            if self.es is not None:
+                self.es.add({"value": record})
+        except Exception as e:
+            Log.warning("Problem writing metrics", cause=e)
+
+    def stop(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker.join()
+            self.worker = None
+
+
+METRICS = Metrics()
@@ -42,10 +42,16 @@ from __future__ import unicode_literals
 
 import math
 import re
+from bisect import insort
+from datetime import datetime
 
 from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.delta import DeltaEncoder
 from bugzilla_etl.extract_bugzilla import MAX_TIMESTAMP
-from bugzilla_etl.transform_bugzilla import normalize, NUMERIC_FIELDS, MULTI_FIELDS, DIFF_FIELDS, NULL_VALUES, TIME_FIELDS, LONG_FIELDS
+from bugzilla_etl.memory_accounting import MemoryAccounting
+from bugzilla_etl.metrics import METRICS
+from bugzilla_etl.qgrams import QGramIndex
+from bugzilla_etl.transform_bugzilla import normalize, DateNormalizer, NUMERIC_FIELDS, MULTI_FIELDS, DIFF_FIELDS, NULL_VALUES, TIME_FIELDS, LONG_FIELDS
 from jx_base import meta_columns
 from jx_elasticsearch.meta import python_type_to_es_type
 from jx_python import jx
@@ -53,12 +59,15 @@ from mo_dots import inverse, coalesce, wrap, unwrap, literal_field, listwrap
 from mo_dots.datas import Data
 from mo_dots.lists import FlatList
 from mo_dots.nones import Null
-from mo_future import text_type, long, PYPY, PY2
+from mo_future import text_type, long, PY2
 from mo_json import value2json, python_type_to_json_type, STRING
 from mo_logs import Log, strings, Except
-from mo_logs.strings import apply_diff
+from mo_logs.strings import apply_diff, patch_lines
+from mo_logs.throttle import Throttle
 from mo_math import MIN, is_integer
+from mo_threads import Signal, ThreadedQueue, Till
 from mo_times import Date
+from mo_times.dates import datetime2unix
 from pyLibrary import convert
 # Used to split a flag into (type, status [,requestee])
 # Example: "review?(mreid@mozilla.com)" -> (review, ?, mreid@mozilla.com)
@@ -72,7 +81,13 @@ DEBUG_STATUS = False    # SHOW CURRENT STATE OF PROCESSING
 DEBUG_CC_CHANGES = False  # SHOW MISMATCHED CC CHANGES
 DEBUG_FLAG_MATCHES = False
 DEBUG_MISSING_ATTACHMENTS = False
-DEBUG_MEMORY = False
+DEBUG_MEMORY = False  # KEEP TRACK OF THE BUGS THAT USE THE MOST MEMORY (tracemalloc)
+MEMORY_TOP = 20  # NUMBER OF BUGS IN THE MEMORY REPORT
+LARGE_BUG_ROWS = 10000  # BUGS WITH MORE ROWS THAN THIS ARE PARSED IN LARGE-BUG MODE
+LARGE_BUG_CHUNK = 1000  # IN LARGE-BUG MODE, THE NUMBER OF VERSIONS SENT TO THE OUTPUT AT A TIME
+LARGE_BUG_TIMEOUT = 600  # SECONDS TO WAIT FOR A CHUNK TO LEAVE THE OUTPUT QUEUE
+MAX_FLAG_CACHE = 10000  # NUMBER OF DISTINCT FLAG STRINGS TO REMEMBER THE PARSE OF
+MAX_CANONICAL_CACHE = 10000  # PER FIELD, NUMBER OF DISTINCT VALUES TO REMEMBER THE canonical() OF
 DEBUG_DIFF = False
 USE_PREVIOUS_VALUE_OBJECTS = False
 
@@ -93,17 +108,31 @@ FIELDS_CHANGED = wrap({
 })
 EMAIL_FIELDS = {'cc', 'assigned_to', 'modified_by', 'created_by', 'qa_contact', 'bug_mentor'}
 
+HOT = Throttle()  # FOR MESSAGES THAT CAN HAPPEN ON EVERY ROW, OR EVERY VERSION
+
 STOP_BUG = 999999999  # AN UNFORTUNATE SIDE EFFECT OF DATAFLOW PROGRAMMING (http://en.wikipedia.org/wiki/Dataflow_programming)
 
 
 class BugHistoryParser(object):
-    def __init__(self, settings, alias_analyzer, output_queue):
+    def __init__(self, settings, alias_analyzer, output_queue, current_queue=None, please_stop=None):
+        """
+        :param output_queue: GETS EVERY VERSION OF EVERY BUG
+        :param current_queue: OPTIONAL, GETS THE LAST VERSION OF EVERY BUG, WITH bug_id FOR id
+        :param please_stop: OPTIONAL SIGNAL TO STOP WAITING ON THE output_queue
+        """
+        self.please_stop = please_stop
+        self.memory = MemoryAccounting(MEMORY_TOP) if DEBUG_MEMORY else None
+        self.large_bug_rows = coalesce(settings.large_bug_rows, LARGE_BUG_ROWS)
+        self.large_bug_chunk = coalesce(settings.large_bug_chunk, LARGE_BUG_CHUNK)
         self.startNewBug(wrap({"bug_id": 0, "modified_ts": 0, "_merge_order": 1}))
         self.prevActivityID = Null
         self.prev_row = Null
         self.settings = settings
         self.output = output_queue
+        self.current = current_queue
+        self.delta = DeltaEncoder(settings.snapshot_interval) if settings.snapshot_interval else None
         self.alias_analyzer = alias_analyzer
+        self.dates = DateNormalizer()
 
         if not isinstance(alias_analyzer, AliasAnalyzer):
             Log.error("expecting an AliasAnalyzer")
@@ -122,17 +151,29 @@ class BugHistoryParser(object):
                     # Start replaying versions in ascending order to build full data on each version
                     if DEBUG_STATUS:
                         Log.note("[Bug {{bug_id}}]: Emitting intermediate versions", bug_id=self.prevBugID)
+                    if self.memory:
+                        self.memory.start_replay(len(self.bugVersions))
                     self.populateIntermediateVersionObjects()
+                    if self.memory:
+                        self.memory.end_bug(self.bug_version_num - 1)
                 if row_in.bug_id == STOP_BUG:
                     return
                 self.startNewBug(row_in)
-                if DEBUG_MEMORY and not PYPY:
-                    import objgraph
-
-                    result = objgraph.growth()
-                    if result:
-                        width = max(len(name) for name, _, _ in result)
-                        Log.note("objgraph.growth:\n{{data}}", data="\n".join('%-*s%9d %+9d' % (width, name, count, delta) for name, count, delta in result))
+            if self.memory:
+                self.memory.row()
+            self.currBugRows += 1
+            if self.currBugRows == self.large_bug_rows:
+                Log.note("[Bug {{bug_id}}]: more than {{num}} rows, using large-bug mode", bug_id=self.currBugID, num=self.large_bug_rows)
+                METRICS.counter("parse.large_bugs").inc()
+
+            if row_in.field_name == None:
+                # ONE ROW WITH ALL THE COLUMNS OF A bugs, OR attachments, RECORD
+                if row_in._merge_order == 1:
+                    self.processBugsTableRow(row_in)
+                    return
+                elif row_in._merge_order == 7:
+                    self.processAttachmentsTableRow(row_in)
+                    return
 
             # Bugzilla bug workaround - some values were truncated, introducing uncertainty / errors:
             # https://bugzilla.mozilla.org/show_bug.cgi?id=55161
@@ -143,7 +184,7 @@ class BugHistoryParser(object):
 
                 if added in ["? ?", "?"]: # Unknown value extracted from a possibly truncated field
                     uncertain = True
-                    Log.note("[Bug {{bug_id}}]: PROBLEM Encountered uncertain added value.  Skipping.", bug_id=self.currBugID)
+                    HOT.note("[Bug {{bug_id}}]: PROBLEM Encountered uncertain added value.  Skipping.", bug_id=self.currBugID)
                     row_in.new_value = Null
                 elif added != None and added.startswith("? "): # Possibly truncated value extracted from a possibly truncated field
                     uncertain = True
@@ -151,7 +192,7 @@ class BugHistoryParser(object):
 
                 if removed in ["? ?", "?"]:# Unknown value extracted from a possibly truncated field
                     uncertain = True
-                    Log.note("[Bug {{bug_id}}]: PROBLEM Encountered uncertain removed value.  Skipping.", bug_id=self.currBugID)
+                    HOT.note("[Bug {{bug_id}}]: PROBLEM Encountered uncertain removed value.  Skipping.", bug_id=self.currBugID)
                     row_in.old_value = Null
                 elif removed != None and removed.startswith("? "): # Possibly truncated value extracted from a possibly truncated field
                     uncertain = True
@@ -160,7 +201,7 @@ class BugHistoryParser(object):
                 if uncertain and self.currBugState.uncertain == None:
                     # Process the "uncertain" flag as an activity
                     # WE ARE GOING BACKWARDS IN TIME, SO MARKUP PAST
-                    Log.note("[Bug {{bug_id}}]: PROBLEM Setting this bug to be uncertain.", bug_id=self.currBugID)
+                    HOT.note("[Bug {{bug_id}}]: PROBLEM Setting this bug to be uncertain.", bug_id=self.currBugID)
                     self.processBugsActivitiesTableItem(wrap({
                         "modified_ts": row_in.modified_ts,
                         "modified_by": row_in.modified_by,
@@ -170,7 +211,7 @@ class BugHistoryParser(object):
                         "attach_id": Null
                     }))
                     if row_in.new_value == None and row_in.old_value == None:
-                        Log.note("[Bug {{bug_id}}]: Nothing added or removed. Skipping update.", bug_id=self.currBugID)
+                        HOT.note("[Bug {{bug_id}}]: Nothing added or removed. Skipping update.", bug_id=self.currBugID)
                         return
 
             # Treat timestamps as int values
@@ -189,17 +230,17 @@ class BugHistoryParser(object):
             elif row_in._merge_order == 9:
                 self.processBugsActivitiesTableItem(row_in)
             else:
-                Log.warning("Unhandled merge_order: {{order|quote}}", order=row_in._merge_order)
+                HOT.warning("Unhandled merge_order: {{order|quote}}", order=row_in._merge_order)
 
         except Exception as e:
-            Log.warning("Problem processing row: {{row}}", row=row_in, cause=e)
+            HOT.warning("Problem processing row: {{row}}", row=row_in, cause=e)
         finally:
             if row_in._merge_order > 1 and self.currBugState.created_ts == None:
-                Log.note("PROBLEM expecting a created_ts (did you install the timezone database into your MySQL instance?)", bug_id=self.currBugID)
+                HOT.note("PROBLEM expecting a created_ts (did you install the timezone database into your MySQL instance?)", bug_id=self.currBugID)
 
             for b in self.currBugState.blocked:
                 if isinstance(b, text_type):
-                    Log.note("PROBLEM error {{bug_id}}", bug_id=self.currBugID)
+                    HOT.note("PROBLEM error {{bug_id}}", bug_id=self.currBugID)
             self.prev_row = row_in
 
     @staticmethod
@@ -210,11 +251,16 @@ class BugHistoryParser(object):
         return text_type(bug_id) + "_" + text_type(modified_ts)[0:-3]
 
     def startNewBug(self, row_in):
+        if self.memory:
+            self.memory.start_bug(row_in.bug_id)
         self.prevBugID = row_in.bug_id
+        self.currBugRows = 0
         self.bugVersions = FlatList()
         self.bugVersionsMap = Data()
         self.currActivity = Data()
         self.currBugAttachmentsMap = {}
+        self.flagIndexes = {}  # MAP FROM id(flag list) TO _FlagIndex
+        self.currCC = None  # _CCIndex OF THE LATEST cc SET
         self.currBugState = Data(
             _id=BugHistoryParser.uid(row_in.bug_id, row_in.modified_ts),
             bug_id=row_in.bug_id,
@@ -236,14 +282,41 @@ class BugHistoryParser(object):
     def processSingleValueTableItem(self, field_name, new_value):
         self.currBugState[field_name] = self.canonical(field_name, new_value)
 
+    def processBugsTableRow(self, row_in):
+        """
+        APPLY ALL COLUMNS OF THE CURRENT bugs RECORD
+        """
+        for field_name, value in row_in.items():
+            if field_name == "_merge_order" or value == "---":
+                continue
+            if field_name in TRUNC_FIELDS:
+                # ONE COLUMN AT A TIME, SO IT GETS THE SAME CHECK FOR TRUNCATED VALUES
+                self.processRow(Data(
+                    bug_id=row_in.bug_id,
+                    modified_ts=row_in.modified_ts,
+                    modified_by=row_in.modified_by,
+                    field_name=field_name,
+                    new_value=value,
+                    _merge_order=1
+                ))
+                continue
+            try:
+                if field_name.endswith("_ts"):
+                    value = convert.value2int(value)
+                self.processSingleValueTableItem(field_name, value)
+            except Exception as e:
+                HOT.warning("Problem processing {{field|quote}} of row: {{row}}", field=field_name, row=row_in, cause=e)
+
     def processMultiValueTableItem(self, field_name, new_value):
         if field_name in NUMERIC_FIELDS:
             new_value = int(new_value)
         try:
             self.currBugState[field_name].add(new_value)
+            if field_name == "cc":
+                self.currCC = None  # CHANGED IN PLACE
             return Null
         except Exception as e:
-            Log.warning(
+            HOT.warning(
                 "Unable to push {{value}} to array field {{start_time}} on bug {{curr_value}} current value: {{curr_value}}",
                 value=new_value,
                 field=field_name,
@@ -253,6 +326,30 @@ class BugHistoryParser(object):
             )
 
     def processAttachmentsTableItem(self, row_in):
+        att = self.currAttachment(row_in)
+        att["created_ts"] = MIN([row_in.modified_ts, att["created_ts"]])
+        if row_in.field_name == "created_ts" and row_in.new_value == None:
+            pass
+        else:
+            att[row_in.field_name] = row_in.new_value
+
+    def processAttachmentsTableRow(self, row_in):
+        """
+        APPLY ALL COLUMNS OF ONE attachments RECORD
+        """
+        att = self.currAttachment(row_in)
+        for field_name, value in row_in.items():
+            if field_name in ["bug_id", "_merge_order"]:
+                continue
+            att["created_ts"] = MIN([row_in.modified_ts, att["created_ts"]])
+            if field_name == "created_ts" and value == None:
+                continue
+            att[field_name] = value
+
+    def currAttachment(self, row_in):
+        """
+        :return: THE ATTACHMENT row_in IS ABOUT, ADDING IT (AND ITS ACTIVITY) IF NEW
+        """
         currActivityID = BugHistoryParser.uid(self.currBugID, row_in.modified_ts)
         if currActivityID != self.prevActivityID:
             self.prevActivityID = currActivityID
@@ -282,12 +379,7 @@ class BugHistoryParser(object):
                 flags=[]
             )
             self.currBugAttachmentsMap[row_in.attach_id] = att
-
-        att["created_ts"] = MIN([row_in.modified_ts, att["created_ts"]])
-        if row_in.field_name == "created_ts" and row_in.new_value == None:
-            pass
-        else:
-            att[row_in.field_name] = row_in.new_value
+        return att
 
     def processFlagsTableItem(self, row_in):
         flag = parse_flag(row_in.new_value, row_in.modified_ts, row_in.modified_by)
@@ -300,9 +392,9 @@ class BugHistoryParser(object):
                         bug_id=self.currBugID
                     )
             else:
-                self.currBugAttachmentsMap[row_in.attach_id].flags.append(flag)
+                self.appendFlag(self.currBugAttachmentsMap[row_in.attach_id].flags, flag)
         else:
-            self.currBugState.flags.append(flag)
+            self.appendFlag(self.currBugState.flags, flag)
 
     def processBugsActivitiesTableItem(self, row_in):
         if self.currBugState.created_ts == None:
@@ -385,7 +477,7 @@ class BugHistoryParser(object):
                         "attach_id": row_in.attach_id
                     })
                 except Exception as e:
-                    Log.warning(
+                    HOT.warning(
                         "[Bug {{bug_id}}]: PROBLEM Unable to process {{field_name}} diff:\n{{diff|indent}}",
                         bug_id=self.currBugID,
                         field_name=row_in.field_name,
@@ -405,7 +497,7 @@ class BugHistoryParser(object):
                         "attach_id": row_in.attach_id
                     })
                 except Exception as e:
-                    Log.warning(
+                    HOT.warning(
                         "[Bug {{bug_id}}]: PROBLEM Unable to process {{field_name}} text:\n{{text|indent}}",
                         bug_id=self.currBugID,
                         field_name=row_in.field_name,
@@ -436,7 +528,7 @@ class BugHistoryParser(object):
                                 # expected_list += [expected_value]
                                 # File("expected_values.json").write(value2json(FIELDS_CHANGED, pretty=True))
 
-                                Log.note(
+                                HOT.note(
                                     "[Bug {{bug_id}}]: PROBLEM inconsistent change at {{timestamp}}: {{field}} was {{expecting|quote}} got {{observed|quote}}",
                                     bug_id=self.currBugID,
                                     timestamp=row_in.modified_ts,
@@ -455,14 +547,36 @@ class BugHistoryParser(object):
                 self.currBugState[row_in.field_name] = old_value
 
     def populateIntermediateVersionObjects(self):
+        # EACH ACTIVITY IS ONLY NEEDED UNTIL ITS VERSION IS MADE; _populate() pop()S
+        # THEM, OLDEST FIRST, SO NOTHING ELSE SHOULD HOLD THEM
+        self.bugVersionsMap = Data()
+        self.currActivity = Data()
+
         # Make sure the self.bugVersions are in descending order by modification time.
         # They could be mixed because of attachment activity
-        self.bugVersions = jx.sort(self.bugVersions, [
-            {"field": "modified_ts", "sort": -1}
-        ])
+        _sort_versions(self.bugVersions)
+
+        large = self.currBugRows >= self.large_bug_rows
+        if large:
+            # ONE BUG CAN NOT BE ALLOWED TO FILL THE OUTPUT QUEUE, OR OUR MEMORY
+            output = _ChunkedOutput(self.output, self.large_bug_chunk, self.currBugState.bug_id, self.currBugRows, self.please_stop)
+        else:
+            output = self.output
+        try:
+            last = self._populate(output)
+        finally:
+            if large:
+                output.flush()
+        if self.current is not None and last is not None:
+            self.current.add({"id": text_type(last.bug_id), "value": last})
 
+    def _populate(self, output):
+        """
+        :return: THE LAST VERSION SENT TO output (None IF NONE WERE SENT)
+        """
         # Tracks the previous distinct value for field
         prevValues = {}
+        last = None
         currVersion = Null
         # Prime the while loop with an empty next version so our first iteration outputs the initial bug state
         nextVersion = Data(_id=self.currBugState._id, changes=[])
@@ -605,7 +719,9 @@ class BugHistoryParser(object):
                 if not mergeBugVersion:
                     # This is not a "merge", so output a row for this bug version.
                     self.bug_version_num += 1
-                    state = normalize(self.currBugState)
+                    with METRICS.timer("normalize"):
+                        state = normalize(self.currBugState, self.dates)
+                    METRICS.counter("normalize").inc()
 
                     try:
                         value2json(state)
@@ -614,41 +730,60 @@ class BugHistoryParser(object):
 
                     if DEBUG_STATUS:
                         Log.note("[Bug {{bug_state.bug_id}}]: v{{bug_state.bug_version_num}} (id = {{bug_state.id}})", bug_state=state)
-                    self.output.add({"id": state.id, "value": state})  #ES EXPECTED FORMAT
+                    if self.delta:
+                        # ONLY WHAT CHANGED, WITH A FULL SNAPSHOT NOW AND THEN
+                        output.add({"id": state.id, "value": self.delta.encode(state)})
+                    else:
+                        output.add({"id": state.id, "value": state})  #ES EXPECTED FORMAT
+                    last = state
+                    if self.memory:
+                        self.memory.sample()
                 else:
                     if DEBUG_STATUS:
                         Log.note("[Bug {{bug_state.bug_id}}]: Merging a change with the same timestamp = {{bug_state._id}}: {{bug_state}}", bug_state=currVersion)
             finally:
                 if self.currBugState.blocked == None:
-                    Log.note("[Bug {{bug_id}}]: expecting a created_ts", bug_id= currVersion.bug_id)
+                    HOT.note("[Bug {{bug_id}}]: expecting a created_ts", bug_id= currVersion.bug_id)
                 pass
+        return last
 
     def findFlag(self, flag_list, flag):
-        for f in flag_list:
-            if (
-                f.request_type and flag.request_type and
-                deformat(f.request_type) == deformat(flag.request_type) and
-                f.request_status == flag.request_status and
-                (
-                    (f.request_status!='?' and self.email_alias(f.modified_by) == self.email_alias(flag.modified_by)) or
-                    (f.request_status=='?' and self.email_alias(f.requestee) == self.email_alias(flag.requestee))
-                )
-            ):
-                return f
-
-        for f in flag_list:
-            if f.value == flag.value:
-                return f  # PROBABLY NEVER HAPPENS, IF THE FLAG CAN'T BE MATCHED, IT'S BECAUSE IT CAN'T BE PARSED, WHICH IS BECAUSE IT HAS BEEN CHOPPED OFF BY THE 255 CHAR LIMIT IN BUGS_ACTIVIY TABLE
-
-        # BUGS_ACTIVITY HAS LOTS OF GARBAGE (255 CHAR LIMIT WILL CUT OFF REVIEW REQUEST LISTS)
-        # TRY A LESS STRICT MATCH
-        for f in flag_list:
-            min_len=min(len(f.value), len(flag.value))
-            if f.value[:min_len] == flag.value[:min_len]:
-                return f
-
-        return Null
+        return self.flagIndex(flag_list).find(flag)
 
+    def flagIndex(self, flag_list):
+        """
+        :param flag_list: THE flags OF A BUG, OR ATTACHMENT
+        :return: THE _FlagIndex FOR THE LIST; ALL CHANGES TO THE LIST MUST GO THROUGH IT
+        """
+        flag_list = unwrap(flag_list)
+        if not isinstance(flag_list, list):
+            return _FlagIndex(self.flagKey, [])
+        index = self.flagIndexes.get(id(flag_list))
+        if index is None:
+            index = self.flagIndexes[id(flag_list)] = _FlagIndex(self.flagKey, flag_list)
+        return index
+
+    def appendFlag(self, flag_list, flag):
+        flag_list.append(flag)
+        index = self.flagIndexes.get(id(unwrap(flag_list)))
+        if index is not None:
+            index.add(flag)
+
+    def flagKey(self, flag):
+        """
+        :return: WHAT findFlag() MATCHES ON, OR None IF THE FLAG COULD NOT BE PARSED
+        """
+        request_type = flag.request_type
+        if not request_type:
+            return None
+        request_status = flag.request_status
+        if request_status == '?':
+            person = self.email_alias(flag.requestee)
+        else:
+            person = self.email_alias(flag.modified_by)
+        if person == None:
+            person = None
+        return deformat(request_type), request_status, person
 
     def processFlagChange(self, target, change, modified_ts, modified_by):
         target.flags = listwrap(target.flags)
@@ -656,9 +791,11 @@ class BugHistoryParser(object):
         added_flags, change.new_value = change.new_value, set(c.value for c in change.new_value)
         removed_flags, change.old_value = change.old_value, set(c.value for c in change.old_value)
 
+        index = self.flagIndex(target.flags)
+
         # First, mark any removed flags as straight-up deletions.
         for removed_flag in removed_flags:
-            existing_flag = self.findFlag(target.flags, removed_flag)
+            existing_flag = index.find(removed_flag)
 
             if existing_flag:
                 # Carry forward some previous values:
@@ -678,9 +815,9 @@ class BugHistoryParser(object):
 
                 duration_ms = existing_flag["modified_ts"] - existing_flag["previous_modified_ts"]
                 # existingFlag["duration_days"] = math.floor(duration_ms / (1000.0 * 60 * 60 * 24))  # TODO: REMOVE floor
+                index.update(existing_flag)
             else:
-                self.findFlag(target.flags, removed_flag)
-                Log.note(
+                HOT.note(
                     "[Bug {{bug_id}}]: PROBLEM: Did not find removed FLAG {{removed}} in {{existing}}",
                     removed=removed_flag.value,
                     existing=target.flags,
@@ -702,7 +839,7 @@ class BugHistoryParser(object):
 
             if not candidates:
                 # No matching candidate. Totally new flag.
-                target.flags.append(added_flag)
+                self.appendFlag(target.flags, added_flag)
                 continue
 
             chosen_one = candidates[0]
@@ -730,7 +867,7 @@ class BugHistoryParser(object):
 
                 if not matched_ts and not matched_req:
                     # No matching candidate. Totally new flag.
-                    target.flags.append(added_flag)
+                    self.appendFlag(target.flags, added_flag)
                     continue
                 elif len(matched_ts) == 1 or (not matched_req and matched_ts):
                     chosen_one = matched_ts[0]
@@ -776,6 +913,7 @@ class BugHistoryParser(object):
             if chosen_one != None:
                 for f in ["value", "request_status", "requestee"]:
                     chosen_one[f] = coalesce(added_flag[f], chosen_one[f])
+                index.update(chosen_one)
 
                     # We need to avoid later adding this flag twice, since we rolled an add into a delete.
 
@@ -825,7 +963,7 @@ class BugHistoryParser(object):
 
             #WE CAN NOT REMOVE VALUES WE KNOW TO BE THERE AFTER
             if removed and (field_name != 'cc' or DEBUG_CC_CHANGES) and field_name not in KNOWN_MISSING_KEYWORDS:
-                Log.note(
+                HOT.note(
                     "[Bug {{bug_id}}]: PROBLEM: Found {{type}} {{field_name}} value: (Removing {{removed}} can not result in {{existing}})",
                     bug_id= target.bug_id,
                     type=valueType,
@@ -842,23 +980,33 @@ class BugHistoryParser(object):
                     "attach_id": target.attach_id
                 })
 
+            if field_name == "cc":
+                return self.ccIndex(total).add(add)
             return total | add
 
 
+    def ccIndex(self, cc):
+        """
+        :param cc: SET OF cc VALUES
+        :return: _CCIndex FOR THE SET; IT RETURNS THE NEXT SET AS VALUES ARE ADDED AND REMOVED
+        """
+        index = self.currCC
+        if index is None or index.raw is not cc:
+            index = self.currCC = _CCIndex(self.email_alias, cc)
+        return index
+
     def removeValues(self, total, remove, valueType, field_name, arrayDesc, target):
         if field_name == "flags":
             Log.error("use processFlags")
         elif field_name == "cc":
+            cc = self.ccIndex(total)
             # MAP CANONICAL TO EXISTING (BETWEEN map_* AND self.email_aliases WE HAVE A BIJECTION)
-            map_total = inverse({t: self.email_alias(t) for t in total})
             map_remove = inverse({r: self.email_alias(r) for r in remove})
             # CANONICAL VALUES
-            c_total = set(map_total.keys())
             c_remove = set(map_remove.keys())
 
-            removed = c_total & c_remove
-            diff = c_remove - c_total
-            output = c_total - c_remove
+            removed = set(c for c in c_remove if c in cc.canonical)
+            diff = c_remove - removed
 
             if not target.uncertain:
                 if diff and DEBUG_CC_CHANGES:
@@ -874,15 +1022,20 @@ class BugHistoryParser(object):
             else:
                 # PATTERN MATCH EMAIL ADDRESSES
                 # self.cc_list_ok = False
+                # cc.canonical MAPS EACH CANONICAL EMAIL TO ITS VALUES; ONLY THE
+                # CANONICALS NOT BEING REMOVED, OR ALREADY MATCHED, CAN BE FOUND
                 for lost in diff:
                     best_score = 0.3
                     best = Null
-                    for found in output:
+                    for found in sorted(cc.similar(lost, best_score)):
+                        values = cc.canonical.get(found)
+                        if not values or found in c_remove or found in removed:
+                            continue
                         score = MIN([
                             strings.edit_distance(found, lost),
                             strings.edit_distance(found.split("@")[0], lost.split("@")[0]),
-                            strings.edit_distance(map_total[found][0], lost),
-                            strings.edit_distance(map_total[found][0].split("@")[0], lost.split("@")[0])
+                            strings.edit_distance(values[0], lost),
+                            strings.edit_distance(values[0].split("@")[0], lost.split("@")[0])
                         ])
                         if score < best_score:
                             # best_score=score
@@ -897,7 +1050,6 @@ class BugHistoryParser(object):
                             })
                             #DO NOT SAVE THE ALIAS, IT MAY BE WRONG
                         removed.add(best)
-                        output.discard(best)
                     elif DEBUG_CC_CHANGES:
                         Log.note("[Bug {{bug_id}}]: PROBLEM Unable to pattern match {{type}} value: {{object}}.{{field_name}}: ({{missing}}" + " not in : {{existing}})", {
                             "type": valueType,
@@ -908,38 +1060,16 @@ class BugHistoryParser(object):
                             "bug_id": self.currBugID
                         })
 
-            if valueType == "added":
+            final_removed = cc.remove(removed)
+            if valueType == "added" and final_removed:
                 # DURING WALK BACK IN TIME, WE POPULATE THE changes
-                try:
-                    if removed - set(map_total.keys()):
-                        Log.error("problem with alias finding:\n" +
-                                  "map_total={{map_total}}\n" +
-                                  "map_remove={{map_remove}}\n" +
-                                  "c_total={{c_total}}\n" +
-                                  "c_remove={{c_remove}}\n" +
-                                  "removed={{removed}}\n" +
-                                  "diff={{diff}}\n" +
-                                  "output={{output}}\n", {
-                            "map_total": map_total,
-                            "c_total": c_total,
-                            "map_remove": map_remove,
-                            "c_remove": c_remove,
-                            "removed": removed,
-                            "diff": diff,
-                            "output": output
-                        })
-                    final_removed = jx.map2set(removed, map_total)
-                    if final_removed:
-                        self.currActivity.changes.append({
-                            "field_name": field_name,
-                            "new_value": final_removed,
-                            "old_value": set(),
-                            "attach_id": target.attach_id
-                        })
-                except Exception as email:
-                    Log.error("issues", email)
-
-            return jx.map2set(output, map_total)
+                self.currActivity.changes.append({
+                    "field_name": field_name,
+                    "new_value": final_removed,
+                    "old_value": set(),
+                    "attach_id": target.attach_id
+                })
+            return cc.raw
         else:
             removed = total & remove
             diff = remove - total
@@ -954,7 +1084,7 @@ class BugHistoryParser(object):
                 })
 
             if diff and field_name not in ['blocked', 'dependson']:  # HAPPENS BECAUSE OF MISSING PRIVATE BUGS
-                Log.note("[Bug {{bug_id}}]: PROBLEM Unable to find {{type}} value in {{object}}.{{field_name}}: (All {{missing}}" + " not in : {{existing}})", {
+                HOT.note("[Bug {{bug_id}}]: PROBLEM Unable to find {{type}} value in {{object}}.{{field_name}}: (All {{missing}}" + " not in : {{existing}})", {
                     "bug_id": target.bug_id,
                     "type": valueType,
                     "object": arrayDesc,
@@ -969,27 +1099,29 @@ class BugHistoryParser(object):
 
     def processFlags(self, total, old_values, new_values, modified_ts, modified_by, target_type, target):
         added_values = [] #FOR SOME REASON, REMOVAL BY OBJECT DOES NOT WORK, SO WE USE THIS LIST OF STRING  VALUES
+        index = self.flagIndex(total)
         for v in new_values:
             flag = parse_flag(v, modified_ts, modified_by)
 
             if flag.request_type == None:
-                Log.note("[Bug {{bug_id}}]: PROBLEM Unable to parse flag {{flag}} (caused by 255 char limit?)", {
-                    "flag": convert.value2quote(flag.value),
+                HOT.note("[Bug {{bug_id}}]: PROBLEM Unable to parse flag {{flag|quote}} (caused by 255 char limit?)", {
+                    "flag": flag.value,
                     "bug_id": self.currBugID
                 })
                 continue
 
-            found = self.findFlag(total, flag)
+            found = index.find(flag)
             if found:
                 before=len(total)
                 total.remove(found)
+                index.remove(found)
                 after = len(total)
                 if before != after+1:
                     Log.error("")
                 # total = wrap([unwrap(a) for a in total if tuple(a.items()) != tuple(found.items())])  # COMPARE DICTS
                 added_values.append(flag)
             else:
-                Log.note(
+                HOT.note(
                     "[Bug {{bug_id}}]: PROBLEM Unable to find {{type}} FLAG: {{object}}.{{field_name}}: (All {{missing}}" + " not in : {{existing}})",
                     type=target_type,
                     object=coalesce(target.attach_id, target.bug_id),
@@ -1012,7 +1144,8 @@ class BugHistoryParser(object):
                 parse_flag(v, modified_ts, modified_by)
                 for v in old_values
             ]
-            total.extend(removed_values)
+            for r in removed_values:
+                self.appendFlag(total, r)
 
             self.currActivity.changes.append({
                 "field_name": "flags",
@@ -1029,10 +1162,8 @@ class BugHistoryParser(object):
                 return None
             elif field in EMAIL_FIELDS:
                 return self.email_alias(value)
-            elif field in TIME_FIELDS:
-                value = long(Date(value).unix) * 1000
-            elif field in NUMERIC_FIELDS:
-                value = value2number(value)
+            elif field in TIME_FIELDS or field in NUMERIC_FIELDS:
+                return _canonical_value(field, value)
 
             # candidates = FIELDS_CHANGED[field][literal_field(str(value))]
             # if candidates == None:
@@ -1049,6 +1180,215 @@ class BugHistoryParser(object):
         return self.alias_analyzer.get_canonical(name)
 
 
+class _ChunkedOutput(object):
+    """
+    SEND THE VERSIONS OF A LARGE BUG TO output IN CHUNKS, AND WAIT FOR EACH
+    CHUNK TO LEAVE THE QUEUE BEFORE MAKING MORE
+    """
+
+    def __init__(self, output, size, bug_id, num_rows, please_stop=None):
+        self.output = output
+        self.size = size
+        self.bug_id = bug_id
+        self.num_rows = num_rows
+        self.please_stop = please_stop
+        self.chunk = []
+        self.sent = 0
+
+    def add(self, value):
+        self.chunk.append(value)
+        if len(self.chunk) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if not self.chunk:
+            return
+        chunk, self.chunk = self.chunk, []
+        self.output.extend(chunk)
+        self.sent += len(chunk)
+        if isinstance(self.output, ThreadedQueue):
+            pushed = Signal("chunk of bug " + text_type(self.bug_id) + " pushed")
+            self.output.add(lambda: pushed.go())
+            (pushed | Till(seconds=LARGE_BUG_TIMEOUT) | self.please_stop).wait()
+            if not pushed:
+                Log.error(
+                    "[Bug {{bug_id}}]: Gave up waiting on output after {{num}} versions",
+                    bug_id=self.bug_id,
+                    num=self.sent
+                )
+        Log.note(
+            "[Bug {{bug_id}}]: sent {{num}} versions from {{total}} rows",
+            bug_id=self.bug_id,
+            num=self.sent,
+            total=self.num_rows
+        )
+
+
+def _sort_versions(versions):
+    """
+    SORT THE FlatList OF ACTIVITIES IN PLACE, NEWEST FIRST; IT IS STABLE, SO
+    ACTIVITIES WITH THE SAME modified_ts KEEP THEIR ORDER (LIKE jx.sort())
+    """
+    unwrap(versions).sort(key=_modified_ts, reverse=True)
+
+
+def _modified_ts(version):
+    return version["modified_ts"]
+
+
+class _CCIndex(object):
+    """
+    A SET OF cc VALUES, WITH THE CANONICAL EMAIL OF EACH, SO A CHANGE ONLY
+    LOOKS UP THE ALIASES OF THE VALUES IN THE CHANGE
+    THE SETS ARE NOT CHANGED IN PLACE (EMITTED VERSIONS MAY HOLD THEM), SO
+    add() AND remove() MAKE THE NEXT SET, WHICH BECOMES raw
+    """
+
+    __slots__ = ["email_alias", "raw", "of", "canonical", "fuzzy"]
+
+    def __init__(self, email_alias, raw):
+        self.email_alias = email_alias
+        self.raw = raw
+        self.of = {}  # MAP FROM VALUE TO CANONICAL EMAIL
+        self.canonical = {}  # MAP FROM CANONICAL EMAIL TO LIST OF VALUES
+        self.fuzzy = None  # QGramIndex, MADE ON FIRST USE BY similar()
+        for r in raw:
+            self._add(r)
+
+    def _add(self, value):
+        if value in self.of:
+            return
+        c = self.of[value] = self.email_alias(value)
+        self.canonical.setdefault(c, []).append(value)
+        if self.fuzzy is not None:
+            self._fuzzy_strings(self.fuzzy.add, c, value)
+
+    def similar(self, email, max_distance):
+        """
+        :return: CANONICAL EMAILS THAT MAY BE WITHIN max_distance OF email, OR ITS LOCAL PART
+        """
+        if self.fuzzy is None:
+            self.fuzzy = QGramIndex()
+            for c, values in self.canonical.items():
+                for v in values:
+                    self._fuzzy_strings(self.fuzzy.add, c, v)
+        output = self.fuzzy.candidates(email, max_distance)
+        output.update(self.fuzzy.candidates(email.split("@")[0], max_distance))
+        return output
+
+    @staticmethod
+    def _fuzzy_strings(operator, canonical, value):
+        # THE STRINGS removeValues() COMPARES TO: THE CANONICAL EMAIL, A VALUE, AND THEIR LOCAL PARTS
+        for s in [canonical, canonical.split("@")[0], value, value.split("@")[0]]:
+            operator(s, canonical)
+
+    def add(self, values):
+        """
+        :return: THE NEW SET OF VALUES
+        """
+        for v in values:
+            self._add(v)
+        self.raw = self.raw | values
+        return self.raw
+
+    def remove(self, canonicals):
+        """
+        :param canonicals: CANONICAL EMAILS TO REMOVE
+        :return: THE VALUES REMOVED
+        """
+        output = set()
+        for c in canonicals:
+            for v in self.canonical.pop(c, []):
+                del self.of[v]
+                output.add(v)
+                if self.fuzzy is not None:
+                    self._fuzzy_strings(self.fuzzy.remove, c, v)
+        if output:
+            self.raw = self.raw - output
+        return output
+
+
+def _find_flag_by_value(flag_list, flag):
+    for f in flag_list:
+        if f.value == flag.value:
+            return f  # PROBABLY NEVER HAPPENS, IF THE FLAG CAN'T BE MATCHED, IT'S BECAUSE IT CAN'T BE PARSED, WHICH IS BECAUSE IT HAS BEEN CHOPPED OFF BY THE 255 CHAR LIMIT IN BUGS_ACTIVIY TABLE
+
+    # BUGS_ACTIVITY HAS LOTS OF GARBAGE (255 CHAR LIMIT WILL CUT OFF REVIEW REQUEST LISTS)
+    # TRY A LESS STRICT MATCH
+    for f in flag_list:
+        min_len=min(len(f.value), len(flag.value))
+        if f.value[:min_len] == flag.value[:min_len]:
+            return f
+
+    return Null
+
+
+class _FlagIndex(object):
+    """
+    THE FLAGS OF ONE LIST, BY WHAT findFlag() MATCHES ON
+    EVERY FLAG IS IN THE BUCKET OF ITS CURRENT KEY, IN LIST ORDER, SO THE FIRST
+    IN THE BUCKET IS THE ONE A SCAN OF THE LIST WOULD HAVE FOUND FIRST
+    """
+
+    def __init__(self, key, flags):
+        self.key = key
+        self.flags = flags  # HOLD THE LIST, SO ITS id() IS NOT REUSED
+        self.position = {}  # MAP FROM id(flag) TO (position in list, key)
+        self.buckets = {}  # MAP FROM key TO LIST OF (position, flag)
+        self.next = 0
+        for f in flags:
+            self.add(f)
+
+    def find(self, flag):
+        key = self.key(flag)
+        if key is not None:
+            bucket = self.buckets.get(key)
+            if bucket:
+                return wrap(bucket[0][1])
+        return _find_flag_by_value(FlatList(self.flags), flag)
+
+    def add(self, flag):
+        """
+        flag WAS APPENDED TO THE LIST
+        """
+        flag = unwrap(flag)
+        key = self.key(wrap(flag))
+        self.position[id(flag)] = self.next, key
+        insort(self.buckets.setdefault(key, []), (self.next, flag))
+        self.next += 1
+
+    def update(self, flag):
+        """
+        flag WAS CHANGED IN PLACE
+        """
+        flag = unwrap(flag)
+        position, old_key = self.position[id(flag)]
+        key = self.key(wrap(flag))
+        if key == old_key:
+            return
+        self._bucket_remove(old_key, position)
+        self.position[id(flag)] = position, key
+        insort(self.buckets.setdefault(key, []), (position, flag))
+
+    def remove(self, flag):
+        """
+        flag WAS list.remove()ED, WHICH REMOVES THE FIRST EQUAL FLAG
+        """
+        bucket = self.buckets.get(self.key(flag), [])
+        for i, (position, f) in enumerate(bucket):
+            if flag == f:
+                del bucket[i]
+                del self.position[id(f)]
+                return
+
+    def _bucket_remove(self, key, position):
+        bucket = self.buckets[key]
+        for i, (p, _) in enumerate(bucket):
+            if p == position:
+                del bucket[i]
+                return
+
+
 def parse_flag(flag, modified_ts, modified_by):
     flagParts = Data(
         modified_ts=modified_ts,
@@ -1056,16 +1396,113 @@ def parse_flag(flag, modified_ts, modified_by):
         value=flag
     )
 
-    matches = FLAG_PATTERN.match(flag)
-    if matches:
-        flagParts.request_type = matches.group(1)
-        flagParts.request_status = matches.group(2)
-        if matches.start(3) != -1 and len(matches.group(3)) > 2:
-            flagParts.requestee = matches.group(3)[1:-1]
+    parsed = _parsed_flags.get(flag)
+    if parsed is None:
+        parsed = _parse_flag(flag)
+        if len(_parsed_flags) >= MAX_FLAG_CACHE:
+            _parsed_flags.clear()
+        _parsed_flags[flag] = parsed
+
+    request_type, request_status, requestee = parsed
+    if request_type is not None:
+        flagParts.request_type = request_type
+        flagParts.request_status = request_status
+        if requestee is not None:
+            flagParts.requestee = requestee
 
     return flagParts
 
 
+_parsed_flags = {}  # MAP FROM FLAG STRING TO (request_type, request_status, requestee)
+
+
+def _parse_flag(flag):
+    matches = FLAG_PATTERN.match(flag)
+    if not matches:
+        return None, None, None
+    requestee = None
+    if matches.start(3) != -1 and len(matches.group(3)) > 2:
+        requestee = matches.group(3)[1:-1]
+    return matches.group(1), matches.group(2), requestee
+
+
+CANONICAL_STATS = {"hit": 0, "miss": 0}
+_canonical = {}  # MAP FROM field TO (MAP FROM (type, value) TO canonical value)
+_DIGITS = set("0123456789")
+
+
+def _canonical_value(field, value):
+    """
+    :return: THE CANONICAL FORM OF A TIME OR NUMERIC FIELD VALUE, REMEMBERED
+    """
+    cache = _canonical.get(field)
+    if cache is None:
+        cache = _canonical[field] = {}
+    key = value.__class__, value  # 1 == 1.0 == True, BUT THEY MAY NOT CONVERT THE SAME
+    try:
+        output = cache[key]
+        CANONICAL_STATS["hit"] += 1
+        return output
+    except KeyError:
+        pass
+    except TypeError:
+        return _to_canonical(field, value)  # NOT HASHABLE
+
+    CANONICAL_STATS["miss"] += 1
+    output = _to_canonical(field, value)
+    if len(cache) >= MAX_CANONICAL_CACHE:
+        cache.clear()
+    cache[key] = output
+    return output
+
+
+def _to_canonical(field, value):
+    try:
+        if field in TIME_FIELDS:
+            if isinstance(value, text_type):
+                milli = _string2milli(value)
+                if milli is not None:
+                    return milli
+            return long(Date(value).unix) * 1000
+        else:
+            return value2number(value)
+    except Exception:
+        return value
+
+
+def _string2milli(value):
+    """
+    THE FORMATS BUGZILLA USES, WITHOUT THE Date() SEARCH FOR A MATCHING FORMAT
+    :param value: "YYYY-MM-DD", "YYYY-MM-DD HH:MM:SS", "YYYY-MM-DDTHH:MM:SS", OR UNIX TIMESTAMP (SECONDS OR MILLIS)
+    :return: SAME MILLISECONDS AS long(Date(value).unix) * 1000, OR None IF NOT ONE OF THESE FORMATS
+    """
+    length = len(value)
+    if _DIGITS.issuperset(value):
+        if length not in (9, 10, 12, 13):
+            return None
+        unix = float(value)
+        if unix > 9999999999:  # MILLIS
+            unix = unix / 1000
+        return long(unix) * 1000
+
+    if length == 10:
+        hour, minute, second = "0", "0", "0"
+    elif length == 19 and value[10] in " T" and value[13] == ":" and value[16] == ":":
+        hour, minute, second = value[11:13], value[14:16], value[17:19]
+    else:
+        return None
+    if value[4] != "-" or value[7] != "-":
+        return None
+    year, month, day = value[0:4], value[5:7], value[8:10]
+    if not _DIGITS.issuperset(year + month + day + hour + minute + second):
+        return None
+    try:
+        unix = datetime2unix(datetime(int(year), int(month), int(day), int(hour), int(minute), int(second)))
+    except Exception:
+        return None  # NOT A REAL DATE, LET Date() DEAL WITH IT
+    return long(unix) * 1000
+
+
 def parseMultiField(name, value):
     if name == "flags":
         if value == None:
@@ -1088,7 +1525,16 @@ def parseMultiField(name, value):
 def deformat(value):
     if value == None:
         Log.error("not expected")
-    return value.lower().replace(u"\u2011", u"-")
+    output = _deformatted.get(value)
+    if output is None:
+        output = value.lower().replace(u"\u2011", u"-")
+        if len(_deformatted) >= MAX_FLAG_CACHE:
+            _deformatted.clear()
+        _deformatted[value] = output
+    return output
+
+
+_deformatted = {}
 
 
 def is_null(value):
@@ -1113,7 +1559,9 @@ class ApplyDiff(object):
         self.bug_id = bug_id
         self.timestamp = timestamp
         self._text = coalesce(text, "")
+        self._base = None  # THE DIFF WITH THE PREVIOUS TIMESTAMP, WHOSE LINES THIS diff IS APPLIED TO
         self._diff = diff
+        self._lines = None
         self.reverse = reverse
         self.parent = None
         self.result = None
@@ -1121,18 +1569,22 @@ class ApplyDiff(object):
         if isinstance(text, ApplyDiff):
             if text.timestamp != timestamp:
                 # DIFFERNT DIFF
-                self._text = text_type(text)  # ACTUALIZE THE EFFECTS OF THE OTHER DIFF
+                self._text = None
+                self._base = text  # THE EFFECTS OF THE OTHER DIFF ARE ACTUALIZED LATER, AS LINES
             else:
                 # CHAIN THE DIFF
                 text.parent = self
                 text.parent.result = None  # JUST IN CASE THIS HAS BEEN ACTUALIZED
 
     @property
-    def text(self):
-        if isinstance(self._text, ApplyDiff):
-            return self._text.text
-        else:
-            return self._text
+    def first(self):
+        """
+        :return: THE FIRST ApplyDiff OF THIS CHAIN (SAME timestamp)
+        """
+        output = self
+        while isinstance(output._text, ApplyDiff):
+            output = output._text
+        return output
 
     @property
     def diff(self):
@@ -1162,20 +1614,42 @@ class ApplyDiff(object):
             e = Except.wrap(e)
             text_type(self)
 
+    def lines(self):
+        """
+        :return: LIST OF LINES WITH THE DIFF APPLIED (DO NOT CHANGE IT)
+        """
+        # A LONG HISTORY IS A LONG CHAIN OF _base, SO NO RECURSION
+        todo = []
+        node = self
+        while node is not None and node._lines is None:
+            todo.append(node)
+            node = node.first._base
+        for node in reversed(todo):
+            node._apply()
+        return self._lines
+
+    def _apply(self):
+        first = self.first
+        if first._base is None:
+            lines = coalesce(first._text, "").split("\n")
+        else:
+            lines = list(first._base._lines)
+        try:
+            if DEBUG_DIFF:
+                lines = apply_diff(lines, self.diff.split("\n"), reverse=self.reverse, verify=True)
+            else:
+                patch_lines(lines, self.diff.split("\n"), reverse=self.reverse)
+            self._lines = lines
+        except Exception as e:
+            self._lines = ["<ERROR>"]
+            HOT.warning("problem applying diff for bug {{bug}}", bug=self.bug_id, cause=e)
+
     def __unicode__(self):
         if self.parent:
             return text_type(self.parent)
 
-        text = self.text
-        diff = self.diff
         if self.result == None:
-            try:
-                new_text = apply_diff(coalesce(text, "").split("\n"), diff.split("\n"), reverse=self.reverse, verify=DEBUG_DIFF)
-                self.result = "\n".join(new_text)
-            except Exception as e:
-                e = Except.wrap(e)
-                self.result = "<ERROR>"
-                Log.warning("problem applying diff for bug {{bug}}", bug=self.bug_id, cause=e)
+            self.result = "\n".join(self.lines())
 
         return self.result
 
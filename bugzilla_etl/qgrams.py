@@ -0,0 +1,161 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+# FIND THE STRINGS THAT MAY BE CLOSE TO A QUERY, WITHOUT COMPUTING THE
+# edit_distance TO ALL OF THEM
+#
+# strings.edit_distance(s, t) IS levenshtein(s, t) / max(len(s), len(t)).  THREE
+# FILTERS NEVER REJECT A STRING THAT IS CLOSE ENOUGH:
+#
+# * LENGTH: levenshtein(s, t) >= abs(len(s) - len(t))
+# * q-GRAM: IF levenshtein(s, t) <= k THEN s AND t SHARE AT LEAST
+#   max(len(s), len(t)) - q + 1 - k*q q-GRAMS (COUNTED WITH MULTIPLICITY)
+# * BAG: levenshtein(s, t) >= THE NUMBER OF CHARACTERS (WITH MULTIPLICITY)
+#   IN ONE STRING, BUT NOT THE OTHER; WHICHEVER IS LARGER
+#
+# SO THE CANDIDATES ARE A SUPERSET OF THE MATCHES; THE CALLER STILL CHECKS
+# EACH WITH edit_distance
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+Q = 2
+
+
+class QGramIndex(object):
+
+    def __init__(self, q=Q):
+        self.q = q
+        self.postings = {}  # MAP FROM q-GRAM TO {string: number of times in string}
+        self.letters = {}  # MAP FROM string TO {character: number of times in string}
+        self.lengths = {}  # MAP FROM LENGTH TO SET OF strings
+        self.owners = {}  # MAP FROM string TO {key: refcount}
+
+    def add(self, string, key):
+        """
+        :param string: TEXT TO MATCH ON
+        :param key: WHAT candidates() RETURNS WHEN string IS CLOSE
+        """
+        if not string:
+            return  # edit_distance TO AN EMPTY STRING IS ALWAYS 1.0
+        owners = self.owners.get(string)
+        if owners is None:
+            owners = self.owners[string] = {}
+            self.lengths.setdefault(len(string), set()).add(string)
+            self.letters[string] = _count(string)
+            for g, n in self._grams(string).items():
+                self.postings.setdefault(g, {})[string] = n
+        owners[key] = owners.get(key, 0) + 1
+
+    def remove(self, string, key):
+        if not string:
+            return
+        owners = self.owners[string]
+        owners[key] -= 1
+        if owners[key]:
+            return
+        del owners[key]
+        if owners:
+            return
+        del self.owners[string]
+        del self.letters[string]
+        self.lengths[len(string)].discard(string)
+        for g in self._grams(string):
+            postings = self.postings[g]
+            del postings[string]
+            if not postings:
+                del self.postings[g]
+
+    def candidates(self, query, max_distance):
+        """
+        :param query: TEXT TO MATCH
+        :param max_distance: NORMALIZED edit_distance THE MATCHES MUST BE BELOW
+        :return: SET OF keys WITH A string THAT MAY BE CLOSER THAN max_distance
+        """
+        output = set()
+        if not query:
+            return output
+        q = self.q
+        query_length = len(query)
+
+        common = None
+        letters = _count(query)
+        for length, strings in self.lengths.items():
+            if not strings:
+                continue
+            longest = max(length, query_length)
+            edits = _max_edits(longest, max_distance)
+            if edits < abs(length - query_length):
+                continue
+            bound = longest - q + 1 - edits * q
+            if bound <= 0:
+                matches = strings
+            else:
+                if common is None:
+                    common = self._common(query)
+                matches = [s for s in strings if common.get(s, 0) >= bound]
+            for s in matches:
+                if _bag_distance(letters, self.letters[s]) <= edits:
+                    output.update(self.owners[s])
+        return output
+
+    def _common(self, query):
+        """
+        :return: MAP FROM string TO NUMBER OF q-GRAMS IT SHARES WITH query
+        """
+        output = {}
+        for g, n in self._grams(query).items():
+            for s, m in self.postings.get(g, {}).items():
+                output[s] = output.get(s, 0) + min(n, m)
+        return output
+
+    def _grams(self, string):
+        q = self.q
+        output = {}
+        for i in range(len(string) - q + 1):
+            g = string[i:i + q]
+            output[g] = output.get(g, 0) + 1
+        return output
+
+
+def _count(string):
+    output = {}
+    for c in string:
+        output[c] = output.get(c, 0) + 1
+    return output
+
+
+def _bag_distance(a, b):
+    """
+    :param a: CHARACTER COUNTS OF ONE STRING
+    :param b: CHARACTER COUNTS OF THE OTHER
+    :return: A LOWER BOUND OF THE levenshtein DISTANCE
+    """
+    only_a = 0
+    for c, n in a.items():
+        m = b.get(c, 0)
+        if n > m:
+            only_a += n - m
+    only_b = 0
+    for c, n in b.items():
+        m = a.get(c, 0)
+        if n > m:
+            only_b += n - m
+    return max(only_a, only_b)
+
+
+def _max_edits(length, max_distance):
+    """
+    :return: LARGEST NUMBER OF EDITS, e, WHERE e / length < max_distance (IN FLOATING POINT, LIKE edit_distance)
+    """
+    edits = int(length * max_distance) + 1
+    while edits >= 0 and edits / length >= max_distance:
+        edits -= 1
+    return edits
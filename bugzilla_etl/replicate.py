@@ -21,48 +21,175 @@ from __future__ import division
 from __future__ import absolute_import
 
 from datetime import datetime, timedelta
+from multiprocessing import Pool, cpu_count
 
 from mo_future import text_type
 
 from bugzilla_etl import transform_bugzilla
+from bugzilla_etl.extract_bugzilla import MAX_TIMESTAMP
 from jx_python import jx
-from mo_collections.multiset import Multiset
-from mo_dots import coalesce
+from mo_dots import coalesce, unwrap
 from mo_dots.datas import Data
 from mo_files import File
 from mo_json import json2value, value2json
 from mo_logs import Log, startup
 from mo_math import MIN
+from mo_threads import Lock, Queue, Signal, THREAD_STOP
+from mo_threads.threads import AllThread
 from mo_threads.queues import ThreadedQueue
 from mo_times.timer import Timer
 from pyLibrary import convert
 from pyLibrary.env import elasticsearch
+from pyLibrary.env.big_data import ibytes2ilines, scompressed2ibytes, sbytes2ilines
 from pyLibrary.env.elasticsearch import Cluster
 
 far_back = datetime.utcnow() - timedelta(weeks=52)
 BATCH_SIZE = 1000
+NUM_PROCESSES = max(cpu_count() - 1, 1)  # TO DECODE AND NORMALIZE FILE LINES
+NUM_LOADERS = 2  # CONCURRENT BULK REQUESTS WHEN LOADING FROM FILE
+NUM_SLICES = 4
+SORT = [{"bug_id": "asc"}, {"modified_ts": "asc"}]  # UNIQUE FOR EACH BUG VERSION, SO WE CAN RESUME
 
 
-def extract_from_file(source_settings, destination):
-    file = File(source_settings.filename)
-    for g, d in jx.groupby(file, size=BATCH_SIZE):
+def extract_from_file(source_settings, destination, checkpoint=None):
+    """
+    LOAD THE BUG VERSIONS IN source_settings.filename (MAY BE GZIPPED) INTO destination
+
+    BATCHES ARE DECODED AND NORMALIZED BY A POOL OF PROCESSES, AND SENT TO
+    destination BY NUM_LOADERS THREADS.  NO MORE THAN TWO BATCHES PER PROCESS
+    ARE READ AHEAD OF THE LAST BATCH IN destination, SO A SLOW destination
+    DOES NOT FILL MEMORY WITH DECODED BATCHES
+
+    :param checkpoint: DATA WITH THE NUMBER OF lines ALREADY LOADED, AND A file TO KEEP IT IN
+    """
+    if checkpoint == None:
+        checkpoint = Data()
+    skip = coalesce(checkpoint.lines, 0)
+    if skip:
+        Log.note("Resume loading {{filename}} after line {{line}}", filename=source_settings.filename, line=skip)
+
+    lock = Lock()
+    finished = {}  # MAP FROM BATCH NUMBER TO THE LINE IT ENDS ON
+    next_batch = [0]  # FIRST BATCH NOT YET IN THE destination
+
+    def commit(g, end):
+        # THE CHECKPOINT ONLY MOVES PAST LINES WHERE ALL EARLIER BATCHES ARE LOADED
+        with lock:
+            finished[g] = end
+            while next_batch[0] in finished:
+                checkpoint.lines = finished.pop(next_batch[0])
+                next_batch[0] += 1
+            if checkpoint.file != None:
+                checkpoint.file.write(value2json({"index": checkpoint.index, "lines": checkpoint.lines}))
+
+    def loader(please_stop):
         try:
-            d2 = map(
-                lambda x: {"id": x.id, "value": x},
-                map(
-                    lambda x: transform_bugzilla.normalize(json2value(x)),
-                    d
-                )
-            )
-            Log.note("add {{num}} records", num=len(d2))
-            destination.extend(d2)
-        except Exception as e:
-            filename = "Error_" + text_type(g) + ".txt"
-            File(filename).write(d)
-            Log.warning("Can not convert block {{block}} (file={{host}})", {
-                "block": g,
-                "filename": filename
-            }, e)
+            while not please_stop and not failed:
+                batch = batches.pop(till=please_stop | failed)
+                if batch is THREAD_STOP or batch is None:
+                    break
+                g, end, records = batch
+                if records:
+                    Log.note("add {{num}} records", num=len(records))
+                    destination.extend(records)
+                commit(g, end)
+        except Exception:
+            # CLOSING THE QUEUE RELEASES THE PRODUCER, IF IT IS WAITING FOR SPACE
+            failed.go()
+            batches.close()
+            raise
+
+    def hand_off(please_stop):
+        # SEND THE CONVERTED BATCHES TO THE LOADERS, IN FILE ORDER
+        try:
+            while not please_stop and not failed:
+                result = converting.pop(till=please_stop | failed)
+                if result is THREAD_STOP or result is None:
+                    break
+                g, end, records, lines, error = result.get()
+                if error:
+                    filename = "Error_" + text_type(g) + ".txt"
+                    File(filename).write(lines)
+                    Log.warning("Can not convert block {{block}} (file={{filename}})", block=g, filename=filename, cause=error)
+                batches.add((g, end, records))
+        except Exception:
+            failed.go()
+            batches.close()
+            raise
+        finally:
+            for _ in range(NUM_LOADERS):
+                batches.add(THREAD_STOP)
+
+    num_processes = coalesce(source_settings.num_processes, NUM_PROCESSES)
+    window = num_processes * 2  # MAXIMUM BATCHES READ, BUT NOT YET IN THE destination
+    failed = Signal("loader failed")
+    converting = Queue("batches to convert", max=window + 1)
+    batches = Queue("batches to load", max=NUM_LOADERS * 2, allow_add_after_close=True)
+    pool = Pool(processes=num_processes)
+    try:
+        with AllThread() as threads:
+            for _ in range(NUM_LOADERS):
+                threads.add(loader)
+            threads.add(hand_off)
+
+            try:
+                reader = _read_batches(source_settings.filename, skip, failed)
+                g = 0
+                while True:
+                    with lock:
+                        # commit() RELEASES THE lock, WAKING US WHEN next_batch MOVES
+                        while g >= next_batch[0] + window and not failed:
+                            lock.wait(till=failed)
+                    if failed:
+                        break
+                    batch = next(reader, None)
+                    if batch is None:
+                        break
+                    converting.add(pool.apply_async(_convert_batch, (batch,)))
+                    g += 1
+            finally:
+                converting.add(THREAD_STOP)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _read_batches(filename, skip, please_stop):
+    """
+    :param please_stop: SIGNAL TO STOP READING, SO THE POOL IS NOT FED THE REST OF THE FILE
+    :return: GENERATOR OF (batch_number, end_line, lines) FOR THE LINES AFTER skip
+    """
+    with open(filename, "rb") as f:
+        if filename.endswith(".gz"):
+            lines = ibytes2ilines(scompressed2ibytes(f))
+        else:
+            lines = sbytes2ilines(f)
+
+        g, batch = 0, []
+        for i, line in enumerate(lines):
+            if i < skip:
+                continue
+            batch.append(line)
+            if len(batch) == BATCH_SIZE:
+                if please_stop:
+                    return
+                yield g, i + 1, batch
+                g, batch = g + 1, []
+        if batch:
+            yield g, i + 1, batch
+
+
+def _convert_batch(batch):
+    # RUNS IN THE POOL, SO SEND BACK PLAIN STRUCTURES
+    g, end, lines = batch
+    try:
+        records = [
+            {"id": v.id, "value": unwrap(v)}
+            for v in (transform_bugzilla.normalize(json2value(l)) for l in lines if l.strip())
+        ]
+        return g, end, records, None, None
+    except Exception as e:
+        return g, end, None, lines, text_type(e)
 
 
 def get_last_updated(es):
@@ -72,21 +199,16 @@ def get_last_updated(es):
 
     try:
         results = es.search({
-            "query": {"filtered": {
-                "query": {"match_all": {}},
-                "filter": {
-                    "range": {
-                    "modified_ts": {"gte": convert.datetime2milli(far_back)}}}
-            }},
-            "from": 0,
+            "query": {"bool": {"filter": [
+                {"range": {"modified_ts": {"gte": convert.datetime2milli(far_back)}}}
+            ]}},
             "size": 0,
-            "sort": [],
-            "facets": {"modified_ts": {"statistical": {"field": "modified_ts"}}}
+            "aggs": {"modified_ts": {"max": {"field": "modified_ts"}}}
         })
 
-        if results.facets.modified_ts.count == 0:
+        if results.aggregations.modified_ts.value == None:
             return convert.milli2datetime(0)
-        return convert.milli2datetime(results.facets.modified_ts.max)
+        return convert.milli2datetime(results.aggregations.modified_ts.value)
     except Exception as e:
         Log.error("Can not get_last_updated from {{host}}/{{index}}",{
             "host": es.settings.host,
@@ -94,53 +216,28 @@ def get_last_updated(es):
         }, e)
 
 
-def get_pending(es, since):
+def get_max_bug(es):
     result = es.search({
         "query": {"match_all": {}},
-        "from": 0,
         "size": 0,
-        "sort": [],
-        "facets": {"default": {"statistical": {"field": "bug_id"}}}
+        "aggs": {"bug_id": {"max": {"field": "bug_id"}}}
     })
+    return int(coalesce(result.aggregations.bug_id.value, 0))
 
-    max_bug = int(result.facets.default.max)
-
-
-    pending_bugs = None
-
-    for s, e in jx.intervals(0, max_bug+1, 100000):
-        Log.note("Collect history for bugs from {{start}}..{{end}}", start=s, end=e)
-        result = es.search({
-            "query": {"filtered": {
-                "query": {"match_all": {}},
-                "filter": {"and":[
-                    {"range": {"modified_ts": {"gte": convert.datetime2milli(since)}}},
-                    {"range": {"bug_id": {"gte": s, "lte": e}}}
-                ]}
-            }},
-            "from": 0,
-            "size": 0,
-            "sort": [],
-            "facets": {"default": {"terms": {"field": "bug_id", "size": 200000}}}
-        })
-
-        temp = Multiset(
-            result.facets.default.terms,
-            key_field="term",
-            count_field="count"
-        )
-
-        if pending_bugs is None:
-            pending_bugs = temp
-        else:
-            pending_bugs = pending_bugs + temp
 
-
-
-    Log.note("Source has {{num}} bug versions for updating", {
-        "num": len(pending_bugs)
-    })
-    return pending_bugs
+def changed_since(last_updated):
+    """
+    :return: FILTER FOR THE BUG VERSIONS THAT CHANGED SINCE last_updated:
+             THE NEW VERSIONS, AND THE VERSIONS THAT WERE EXPIRED BY THEM
+    """
+    since = convert.datetime2milli(last_updated)
+    return {"bool": {"filter": [
+        {"range": {"expires_on": {"gte": since}}},
+        {"bool": {"should": [
+            {"range": {"modified_ts": {"gte": since}}},
+            {"range": {"expires_on": {"lt": MAX_TIMESTAMP}}}
+        ]}}
+    ]}}
 
 
 # USE THE source TO GET THE INDEX SCHEMA
@@ -162,35 +259,94 @@ def get_or_create_index(destination_settings, source):
     return elasticsearch.Index(destination_settings)
 
 
-def replicate(source, destination, pending, last_updated):
+def replicate(source, destination, last_updated, num_slices=NUM_SLICES, checkpoint=None):
     """
     COPY source RECORDS TO destination
+
+    THE BUG ID RANGE IS SPLIT INTO num_slices, EACH PAGED WITH search_after,
+    SO MEMORY IS BOUNDED BY THE PAGE SIZE AND THE destination QUEUE.  THE LAST
+    SLICE HAS NO UPPER BOUND, SO BUGS ADDED DURING THE RUN ARE ALSO COPIED
+
+    :param destination: ThreadedQUEUE, WHICH WILL CALL US BACK ONCE A PAGE IS PUSHED
+    :param checkpoint: DATA WITH THE SLICING (max_bug AND num_slices), THE LAST ACKNOWLEDGED
+                       SORT KEY FOR EACH SLICE, AND A file TO KEEP IT IN
     """
-    for g, bugs in jx.groupby(pending, max_size=BATCH_SIZE):
-        with Timer("Replicate {{num_bugs}} bug versions", {"num_bugs": len(bugs)}):
-            data = source.search({
-                "query": {"filtered": {
-                    "query": {"match_all": {}},
-                    "filter": {"and": [
-                        {"terms": {"bug_id": set(bugs)}},
-                        {"range": {"expires_on":
-                            {"gte": convert.datetime2milli(last_updated)}
-                        }}
-                    ]}
-                }},
-                "from": 0,
-                "size": 200000,
-                "sort": []
-            })
-
-            d2 = map(
-                lambda x: {"id": x.id, "value": x},
-                map(
-                    lambda x: transform_bugzilla.normalize(transform_bugzilla.rename_attachments(x._source), old_school=True),
-                    data.hits.hits
-                )
+    if checkpoint == None:
+        checkpoint = Data()
+    if checkpoint.slices and (checkpoint.max_bug == None or checkpoint.num_slices == None):
+        Log.warning("Checkpoint does not say how the bugs were sliced, starting the slices over")
+        checkpoint.slices = None
+    if not checkpoint.slices:
+        checkpoint.max_bug = get_max_bug(source)
+        checkpoint.num_slices = num_slices
+    elif checkpoint.num_slices != num_slices:
+        # THE SAVED KEYS ONLY MEAN SOMETHING FOR THE SAME SLICES
+        Log.note("Resume with the {{num}} slices of the run that did not finish", num=checkpoint.num_slices)
+
+    max_bug, num_slices = checkpoint.max_bug, checkpoint.num_slices
+    slice_size = int(max_bug / num_slices) + 1
+    query = changed_since(last_updated)
+
+    slices = list(jx.intervals(0, max_bug + 1, slice_size))
+    with AllThread() as threads:
+        for i, (start, end) in enumerate(slices):
+            threads.add(
+                replicate_slice,
+                source,
+                destination,
+                query,
+                i,
+                start,
+                None if i == len(slices) - 1 else end,
+                checkpoint
             )
-            destination.extend(d2)
+
+
+def replicate_slice(source, destination, query, slice, start, end, checkpoint, please_stop):
+    """
+    :param end: FIRST bug_id AFTER THE SLICE, None FOR NO LIMIT
+    """
+    after = checkpoint.slices[text_type(slice)]
+    if after:
+        Log.note("Resume slice {{slice}} after {{key}}", slice=slice, key=after)
+
+    bug_ids = {"gte": start} if end is None else {"gte": start, "lt": end}
+    while not please_stop:
+        request = {
+            "query": {"bool": {"filter": [
+                query,
+                {"range": {"bug_id": bug_ids}}
+            ]}},
+            "size": BATCH_SIZE,
+            "sort": SORT
+        }
+        if after:
+            request["search_after"] = after
+
+        with Timer("Replicate slice {{slice}} ({{start}}..{{end}})", {"slice": slice, "start": start, "end": end}):
+            hits = source.search(request).hits.hits
+        if not hits:
+            break
+        destination.extend(
+            {"id": x.id, "value": x}
+            for x in (transform_bugzilla.normalize(h._source) for h in hits)
+        )
+        after = list(hits.last().sort)
+        destination.add(_acknowledge(checkpoint, slice, after))
+
+
+def _acknowledge(checkpoint, slice, key):
+    # RUN BY THE ThreadedQueue, AFTER THE PAGE IS IN THE destination
+    def ack():
+        checkpoint.slices[text_type(slice)] = key
+        if checkpoint.file != None:
+            checkpoint.file.write(value2json({
+                "last_updated": checkpoint.last_updated,
+                "max_bug": checkpoint.max_bug,
+                "num_slices": checkpoint.num_slices,
+                "slices": checkpoint.slices
+            }))
+    return ack
 
 
 def main(settings):
@@ -202,10 +358,21 @@ def main(settings):
         settings.destination.alias = settings.destination.index
         settings.destination.index = Cluster.proto_name(settings.destination.alias)
 
-        dest = Cluster(settings.destination).create_index(kwargs=settings.destination, limit_replicas=True)
+        checkpoint = Data(file=File(coalesce(settings.source.checkpoint, settings.source.filename + ".checkpoint")))
+        if checkpoint.file.exists:
+            # RESUME LOADING INTO THE INDEX WE STARTED
+            previous = json2value(checkpoint.file.read())
+            settings.destination.index = previous.index
+            checkpoint.lines = previous.lines
+            dest = elasticsearch.Index(kwargs=settings.destination)
+        else:
+            dest = Cluster(settings.destination).create_index(kwargs=settings.destination, limit_replicas=True)
+        checkpoint.index = dest.settings.index
+
         dest.set_refresh_interval(-1)
-        extract_from_file(settings.source, dest)
+        extract_from_file(settings.source, dest, checkpoint=checkpoint)
         dest.set_refresh_interval(1)
+        checkpoint.file.delete()
 
         dest.delete_all_but(settings.destination.alias, settings.destination.index)
         dest.add_alias(settings.destination.alias)
@@ -227,16 +394,32 @@ def main(settings):
             destination=get_or_create_index(settings["destination"], source)
 
         # GET LAST UPDATED
-        from_file = None
-        if time_file.exists:
-            from_file = convert.milli2datetime(convert.value2int(time_file.read()))
-        from_es = get_last_updated(destination) - timedelta(hours=1)
-        last_updated = MIN(coalesce(from_file, convert.milli2datetime(0)), from_es)
+        checkpoint = Data(file=File(coalesce(settings.param.replication_checkpoint, time_file.abspath + ".checkpoint")))
+        if checkpoint.file.exists:
+            # RESUME THE RUN THAT DID NOT FINISH
+            previous = json2value(checkpoint.file.read())
+            checkpoint.slices = previous.slices
+            checkpoint.max_bug = previous.max_bug
+            checkpoint.num_slices = previous.num_slices
+            last_updated = convert.milli2datetime(previous.last_updated)
+        else:
+            from_file = None
+            if time_file.exists:
+                from_file = convert.milli2datetime(convert.value2int(time_file.read()))
+            from_es = get_last_updated(destination) - timedelta(hours=1)
+            last_updated = MIN(coalesce(from_file, convert.milli2datetime(0)), from_es)
+        checkpoint.last_updated = convert.datetime2milli(last_updated)
         Log.note("updating records with modified_ts>={{last_updated}}", last_updated=last_updated)
 
-        pending = get_pending(source, last_updated)
-        with ThreadedQueue(destination, max_size=1000) as data_sink:
-            replicate(source, data_sink, pending, last_updated)
+        with ThreadedQueue("replicate to destination", destination, max_size=1000) as data_sink:
+            replicate(
+                source,
+                data_sink,
+                last_updated,
+                num_slices=coalesce(settings.param.num_slices, NUM_SLICES),
+                checkpoint=checkpoint
+            )
+        checkpoint.file.delete()
 
     # RECORD LAST UPDATED
     time_file.write(text_type(convert.datetime2milli(current_time)))
@@ -12,15 +12,15 @@ from __future__ import division
 from __future__ import unicode_literals
 
 import re
-from datetime import date
+from datetime import date, datetime
 
 from jx_python import jx
-from mo_dots import listwrap
-from mo_future import text_type, long
+from mo_dots import listwrap, wrap, unwrap, is_data, FlatList, NullType
+from mo_future import text_type, long, binary_type, none_type
 from mo_logs import Log
+from mo_math import is_number
 from mo_times import Date
 from pyLibrary import convert
-from pyLibrary.env import elasticsearch
 
 DIFF_FIELDS = ["cf_user_story"]
 LONG_FIELDS = ["short_desc"]
@@ -40,6 +40,12 @@ NUMERIC_FIELDS=[
 ]
 ZERO_IS_NULL = ["votes", "remaining_time"]
 NULL_VALUES = ['--', '---', '']
+DATE_FIELDS = ["deadline", "cf_due_date", "cf_last_resolved"]
+MAX_DATE_CACHE = 10000  # NUMBER OF DISTINCT DATE STRINGS TO REMEMBER THE MILLISECONDS OF
+FLAG_ORDER = ["value"]
+ATTACHMENT_ORDER = ["attach_id"]
+ATTACHMENT_FLAG_ORDER = ["modified_ts", "requestee", "value"]
+CHANGE_ORDER = ["attach_id", "field_name"]
 
 # Used to reformat incoming dates into the expected form.
 # Example match: "2012/01/01 00:00:00.000"
@@ -50,93 +56,304 @@ DATE_PATTERN_RELAXED = re.compile("^[0-9]{4}[\\/-][0-9]{2}[\\/-][0-9]{2}")
 
 
 #NORMALIZE BUG VERSION TO STANDARD FORM
-def normalize(bug):
-    bug=bug.copy()
-    bug.id = text_type(bug.bug_id) + "_" + text_type(bug.modified_ts)[:-3]
-    bug._id = None
+def normalize(bug, dates=None):
+    """
+    ONE PASS OVER PLAIN dicts; THE RESULT IS THE SAME AS THE STEPS BELOW, FOLLOWED BY elasticsearch.scrub()
+    :param bug: THE BUG VERSION
+    :param dates: OPTIONAL DateNormalizer, TO SKIP DATES THAT DID NOT CHANGE SINCE THE PREVIOUS VERSION
+    :return: NEW, NORMALIZED, BUG VERSION
+    """
+    bug = wrap(bug)
+    doc = dict(unwrap(bug))
+    doc["id"] = text_type(bug.bug_id) + "_" + text_type(bug.modified_ts)[:-3]
+    doc.pop("_id", None)
 
     #ENSURE STRUCTURES ARE SORTED
     # Do some processing to make sure that diffing between runs stays as similar as possible.
-    bug.flags=sort(bug.flags, "value")
+    # THE attachments AND changes ARE SHARED WITH THE PARSER, WHICH SEES THESE CHANGES TOO
+    _set(doc, "flags", _sort(doc.get("flags"), FLAG_ORDER))
 
-    if bug.attachments:
-        bug.attachments = sort(bug.attachments, "attach_id")
-        for a in bug.attachments:
-            for k,v in list(a.items()):
+    attachments = doc.get("attachments")
+    if attachments:
+        attachments = _sort(attachments, ATTACHMENT_ORDER)
+        _set(doc, "attachments", attachments)
+        for a in attachments:
+            for k, v in list(a.items()):
+                if v == None:
+                    continue
                 if k.startswith("attachments") and (k.endswith("isobsolete") or k.endswith("ispatch") or k.endswith("isprivate")):
                     new_v = convert.value2int(v)
                     del a[k]
-                    a[k[12:]] = new_v
+                    _set(a, k[12:], new_v)
                 elif k.startswith("attachments") and k.endswith("mimetype"):
                     del a[k]
-                    a[k[12:]] = v
-            a.flags = sort(a.flags, ["modified_ts", "requestee", "value"])
+                    _set(a, k[12:], v)
+            _set(a, "flags", _sort(a.get("flags"), ATTACHMENT_FLAG_ORDER))
 
-    if bug.changes != None:
-        for c in listwrap(bug.changes):
-            c.new_value = sort(c.new_value)
-            c.old_value = sort(c.old_value)
-        bug.changes = sort(bug.changes, ["attach_id", "field_name"])
+    changes = doc.get("changes")
+    if wrap(changes) != None:
+        for c in listwrap(changes):
+            c = unwrap(c)
+            if c is None:
+                continue
+            _set(c, "new_value", _sort(c.get("new_value")))
+            _set(c, "old_value", _sort(c.get("old_value")))
+        _set(doc, "changes", _sort(changes, CHANGE_ORDER))
 
-    for k, v in list(bug.items()):
-        if v in NULL_VALUES:
-            bug[k] = None
+    for k, v in list(doc.items()):
+        if v.__class__ is not dict and v != None and wrap(v) in NULL_VALUES:
+            del doc[k]
 
     for f in NUMERIC_FIELDS:
-        v = bug[f]
-        if v == None:
+        v = doc.get(f)
+        if wrap(v) == None:
             continue
         elif f in MULTI_FIELDS:
             try:
-                bug[f] = jx.sort(convert.value2intlist(v))
+                doc[f] = sorted(convert.value2intlist(v))
             except Exception as e:
                 Log.error("not expected", cause=e)
         elif f in ZERO_IS_NULL and convert.value2number(v) == 0:
-            del bug[f]
+            del doc[f]
         else:
-            bug[f]=convert.value2number(v)
+            doc[f] = convert.value2number(v)
 
     for f in MULTI_FIELDS:
-        v = listwrap(bug[f])
-        if v:
-            bug[f] = jx.sort(v)
+        v = doc.get(f)
+        if listwrap(v):
+            _set(doc, f, _sort(v))
 
     # Also reformat some date fields
-    for dateField in ["deadline", "cf_due_date", "cf_last_resolved"]:
-        v = bug[dateField]
+    for dateField in DATE_FIELDS:
+        v = doc.get(dateField)
         if v == None:
             continue
         try:
-            if isinstance(v, date):
-                bug[dateField] = convert.datetime2milli(v)
-            elif isinstance(v, (long, int, float)) and (text_type(v).endswith(('e+11', 'e+12')) or len(text_type(v)) in [12, 13]):
-                bug[dateField] = v
-            elif not isinstance(v, text_type):
-                Log.error("situation not handled")
-            elif DATE_PATTERN_STRICT.match(v):
-                # Convert to "2012/01/01 00:00:00.000"
-                # Example: bug 856732 (cf_last_resolved)
-                # dateString = v.substring(0, 10).replace("/", '-') + "T" + v.substring(11) + "Z"
-                bug[dateField] = convert.datetime2milli(convert.string2datetime(v+"000", "%Y/%m/%d %H:%M%:S%f"))
-            elif DATE_PATTERN_STRICT_SHORT.match(v):
-                # Convert "2012/01/01 00:00:00" to "2012-01-01T00:00:00.000Z", then to a timestamp.
-                # Example: bug 856732 (cf_last_resolved)
-                # dateString = v.substring(0, 10).replace("/", '-') + "T" + v.substring(11) + "Z"
-                bug[dateField] = convert.datetime2milli(convert.string2datetime(v.replace("-", "/"), "%Y/%m/%d %H:%M:%S"))
-            elif DATE_PATTERN_RELAXED.match(v):
-                # Convert "2012/01/01 00:00:00.000" to "2012-01-01"
-                # Example: bug 643420 (deadline)
-                #          bug 726635 (cf_due_date)
-                bug[dateField] = convert.datetime2milli(convert.string2datetime(v[0:10], "%Y-%m-%d"))
+            if dates is None:
+                doc[dateField] = date2milli(v)
+            else:
+                doc[dateField] = dates.date2milli(dateField, v)
         except Exception as e:
             Log.error("problem with converting date to milli (type={{type}}, value={{value}})", value=v, type=type(v), cause=e)
 
-    bug.votes = None
-    bug.etl.timestamp = Date.now()
+    doc.pop("votes", None)
+    etl = doc.get("etl")
+    if etl.__class__ is dict:
+        etl["timestamp"] = Date.now()
+    else:
+        doc["etl"] = {"timestamp": Date.now()}
+
+    return wrap(_scrub(doc))
+
+
+class DateNormalizer(object):
+    """
+    REMEMBER THE DATES OF THE PREVIOUS VERSION, SO THE ONES THAT DID NOT
+    CHANGE ARE NOT CONVERTED AGAIN
+    """
+
+    def __init__(self):
+        self.previous = {}  # MAP FROM FIELD TO (value, milli)
+
+    def date2milli(self, field, value):
+        previous = self.previous.get(field)
+        if previous is not None and previous[0] is value:
+            return previous[1]
+        output = date2milli(value)
+        self.previous[field] = value, output
+        return output
+
 
-    bug = elasticsearch.scrub(bug)
-    return bug
+def date2milli(value):
+    """
+    :param value: deadline, cf_due_date OR cf_last_resolved
+    :return: MILLISECONDS (TEXT IN AN UNKNOWN FORMAT IS RETURNED AS-IS)
+    """
+    if not isinstance(value, text_type):
+        return _parse_date(value)
+    output = _date_cache.get(value)
+    if output is None:
+        output = _string2milli(value)
+        if output is None:
+            output = _parse_date(value)
+        if len(_date_cache) >= MAX_DATE_CACHE:
+            _date_cache.clear()
+        _date_cache[value] = output
+    return output
+
+
+_date_cache = {}  # MAP FROM DATE STRING TO MILLISECONDS
+_DIGITS = set("0123456789")
+
+
+def _string2milli(value):
+    """
+    "YYYY-MM-DD HH:MM:SS" (OR WITH "/") AND "YYYY-MM-DD" BY SLICING
+    :return: SAME AS _parse_date(), OR None FOR ANY OTHER FORMAT
+    """
+    length = len(value)
+    if length == 19:
+        if value[4] not in "-/" or value[7] not in "-/" or value[10] != " " or value[13] != ":" or value[16] != ":":
+            return None
+        hour, minute, second = value[11:13], value[14:16], value[17:19]
+    elif length == 10:
+        if value[4] != "-" or value[7] != "-":
+            return None
+        hour, minute, second = "0", "0", "0"
+    else:
+        return None
+    year, month, day = value[0:4], value[5:7], value[8:10]
+    if not _DIGITS.issuperset(year + month + day + hour + minute + second):
+        return None
+    try:
+        d = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+    except Exception:
+        return None  # NOT A REAL DATE, LET _parse_date() COMPLAIN
+    return convert.datetime2milli(d)
+
+
+def _parse_date(v):
+    """
+    THE GENERAL (SLOW) CONVERSION, WITH REGEX AND strptime
+    """
+    if isinstance(v, date):
+        return convert.datetime2milli(v)
+    elif isinstance(v, (long, int, float)) and (text_type(v).endswith(('e+11', 'e+12')) or len(text_type(v)) in [12, 13]):
+        return v
+    elif not isinstance(v, text_type):
+        Log.error("situation not handled")
+    elif DATE_PATTERN_STRICT.match(v):
+        # Convert to "2012/01/01 00:00:00.000"
+        # Example: bug 856732 (cf_last_resolved)
+        # dateString = v.substring(0, 10).replace("/", '-') + "T" + v.substring(11) + "Z"
+        return convert.datetime2milli(convert.string2datetime(v+"000", "%Y/%m/%d %H:%M%:S%f"))
+    elif DATE_PATTERN_STRICT_SHORT.match(v):
+        # Convert "2012/01/01 00:00:00" to "2012-01-01T00:00:00.000Z", then to a timestamp.
+        # Example: bug 856732 (cf_last_resolved)
+        # dateString = v.substring(0, 10).replace("/", '-') + "T" + v.substring(11) + "Z"
+        return convert.datetime2milli(convert.string2datetime(v.replace("-", "/"), "%Y/%m/%d %H:%M:%S"))
+    elif DATE_PATTERN_RELAXED.match(v):
+        # Convert "2012/01/01 00:00:00.000" to "2012-01-01"
+        # Example: bug 643420 (deadline)
+        #          bug 726635 (cf_due_date)
+        return convert.datetime2milli(convert.string2datetime(v[0:10], "%Y-%m-%d"))
+    return v
 
 
 def sort(value, param=None):
     return jx.sort(listwrap(value), param)
+
+
+def _set(d, key, value):
+    """
+    LIKE Data.__setitem__(): None REMOVES THE KEY
+    """
+    value = unwrap(value)
+    if value is None:
+        d.pop(key, None)
+    else:
+        d[key] = value
+
+
+def _sort(value, fields=None):
+    """
+    SAME ORDER AS sort(), BUT WITHOUT COMPILING THE SORT, OR A PYTHON COMPARE
+    FUNCTION, WHEN THE SORT KEYS ARE ALL NULLS, BOOLEANS, NUMBERS OR STRINGS
+    :param fields: LIST OF PROPERTY NAMES TO SORT BY (None TO SORT THE VALUES THEMSELVES)
+    :return: list, OR None IF THERE IS NOTHING TO SORT
+    """
+    values = [unwrap(v) for v in listwrap(value)]
+    if not values:
+        return None
+    if len(values) == 1:
+        return values
+    try:
+        if fields is None:
+            return sorted(values, key=_sort_key)
+        else:
+            return sorted(values, key=lambda v: _record_key(v, fields))
+    except _NotSimple:
+        return unwrap(sort(value, fields))
+
+
+class _NotSimple(Exception):
+    pass
+
+
+def _record_key(record, fields):
+    if record.__class__ is not dict:
+        raise _NotSimple()
+    return tuple(_sort_key(record.get(f)) for f in fields)
+
+
+def _sort_key(value):
+    """
+    :return: KEY THAT ORDERS LIKE jx_base.language.value_compare() (NULLS LAST)
+    """
+    c = value.__class__
+    if c is text_type:
+        return 2, value
+    elif c in (int, long):
+        return 1, value
+    elif c is float:
+        if value != value:
+            return 10, 0  # NaN IS NULL
+        return 1, value
+    elif c is bool:
+        return 0, value
+    elif c in (none_type, NullType):
+        return 10, 0
+    raise _NotSimple()
+
+
+def _scrub(r):
+    """
+    SAME AS elasticsearch.scrub(), WITH THE COMMON TYPES FIRST, AND NO wrap()
+    """
+    try:
+        c = r.__class__
+        if c is text_type:
+            if r == "":
+                return None
+            return r
+        elif c is dict:
+            output = {}
+            for k, v in r.items():
+                v = _scrub(v)
+                if v is not None:
+                    output[k.lower()] = v
+            if not output:
+                return None
+            return output
+        elif c is list or c is set:
+            output = []
+            for v in r:
+                v = _scrub(v)
+                if v is not None:
+                    output.append(v)
+            if not output:
+                return None
+            elif len(output) == 1:
+                return output[0]
+            else:
+                return output
+        elif c in (int, long, bool):
+            return r
+        elif r == None:
+            return None
+        elif c is binary_type:
+            if r == "":
+                return None
+            return r
+        elif is_number(r):
+            return convert.value2number(r)
+        elif is_data(r):
+            return _scrub(dict(unwrap(r).items()))
+        elif hasattr(r, '__iter__'):
+            if isinstance(r, FlatList):
+                r = r.list
+            return _scrub(list(r))
+        else:
+            return r
+    except Exception as e:
+        Log.warning("Can not scrub: {{json}}", json=r, cause=e)
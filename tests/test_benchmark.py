@@ -0,0 +1,65 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import os
+import unittest
+
+from mo_dots import coalesce
+from mo_files import File
+from mo_json import value2json, json2value
+from mo_logs import Log
+from util.benchmark import run_benchmark, compare, STAGES
+from util.synthetic import SyntheticBugzilla
+
+TOLERANCE = 0.3  # FRACTION SLOWER THAN BASELINE BEFORE WE FAIL
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    NO DATABASE OR ES REQUIRED.  SET BENCHMARK_OUTPUT TO A FILENAME TO KEEP
+    THE RESULTS; SET BENCHMARK_BASELINE TO A PREVIOUS RESULTS FILE TO FAIL
+    ON REGRESSIONS
+    """
+
+    def test_generator_is_deterministic(self):
+        a = [r.copy() for r in SyntheticBugzilla(seed=7, num_bugs=20).rows()]
+        b = [r.copy() for r in SyntheticBugzilla(seed=7, num_bugs=20).rows()]
+        self.assertEqual(value2json(a), value2json(b))
+
+    def test_all_merge_orders(self):
+        rows = list(SyntheticBugzilla(seed=0, num_bugs=50).rows())
+        self.assertEqual({r._merge_order for r in rows}, {1, 2, 7, 8, 9})
+
+    def test_parser_benchmark(self):
+        generator = SyntheticBugzilla(seed=0, num_bugs=100, large_bug_rate=0)
+        result = run_benchmark(generator)
+        Log.note("Benchmark results:\n{{result|json|indent}}", result=result)
+        output = os.environ.get("BENCHMARK_OUTPUT")
+        if output:
+            File(output).write(value2json(result, pretty=True))
+
+        for stage in STAGES:
+            self.assertGreater(coalesce(result[stage].rows_per_second, result[stage].versions_per_second), 0)
+
+        baseline = os.environ.get("BENCHMARK_BASELINE")
+        if baseline:
+            problems = compare(result, json2value(File(baseline).read()), TOLERANCE)
+            if problems:
+                Log.error(
+                    "Slower than baseline:\n{{problems|json|indent}}",
+                    problems=[{"stage": s, "measure": m, "observed": o, "expected": e} for s, m, o, e in problems]
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from mo_future import long
+
+from bugzilla_etl import parse_bug_history
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.parse_bug_history import BugHistoryParser, CANONICAL_STATS, _string2milli
+from mo_dots import Data
+from mo_times import Date
+
+DATES = [
+    "2013-01-25",
+    "2013-01-25 12:34:56",
+    "2013-01-25T12:34:56",
+    "1969-12-31 23:59:59",
+    "2012-02-29",
+    "1357000000",
+    "1357000000123",
+    "135700000",
+]
+
+
+class TestCanonical(unittest.TestCase):
+
+    def test_same_as_date(self):
+        for value in DATES:
+            self.assertEqual(_string2milli(value), long(Date(value).unix) * 1000, value)
+
+    def test_other_formats(self):
+        for value in ["2013-02-30", "2013/01/25", "20130125", " 2013-01-25", "2013-01-25 12:34", "now"]:
+            self.assertIsNone(_string2milli(value), value)
+
+    def test_memoized(self):
+        parser = BugHistoryParser(Data(), AliasAnalyzer(), [])
+        parse_bug_history._canonical.clear()
+        hit, miss = CANONICAL_STATS["hit"], CANONICAL_STATS["miss"]
+        for _ in range(3):
+            for value in DATES:
+                self.assertEqual(parser.canonical("cf_last_resolved", value), long(Date(value).unix) * 1000)
+            self.assertEqual(parser.canonical("votes", "3"), 3)
+            self.assertEqual(parser.canonical("votes", 3.0), 3)
+            self.assertEqual(parser.canonical("cf_due_date", "not a date"), "not a date")
+        self.assertEqual(CANONICAL_STATS["miss"] - miss, len(DATES) + 3)
+        self.assertEqual(CANONICAL_STATS["hit"] - hit, 2 * (len(DATES) + 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
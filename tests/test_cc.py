@@ -0,0 +1,68 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.parse_bug_history import BugHistoryParser, _CCIndex
+from mo_dots import Data
+
+ALIASES = {"old@example.com": "new@example.com"}
+
+
+class TestCC(unittest.TestCase):
+
+    def test_add_remove(self):
+        lookups = []
+
+        def alias(email):
+            lookups.append(email)
+            return ALIASES.get(email, email)
+
+        start = {"a@example.com", "old@example.com", "new@example.com"}
+        cc = _CCIndex(alias, start)
+        self.assertEqual(set(cc.canonical["new@example.com"]), {"old@example.com", "new@example.com"})
+
+        del lookups[:]
+        result = cc.add({"b@example.com"})
+        self.assertEqual(lookups, ["b@example.com"])  # ONLY THE NEW VALUE IS LOOKED UP
+        self.assertEqual(result, {"a@example.com", "b@example.com", "old@example.com", "new@example.com"})
+        self.assertEqual(start, {"a@example.com", "old@example.com", "new@example.com"})  # NOT CHANGED IN PLACE
+
+        removed = cc.remove({"new@example.com", "missing@example.com"})
+        self.assertEqual(removed, {"old@example.com", "new@example.com"})
+        self.assertEqual(cc.raw, {"a@example.com", "b@example.com"})
+        self.assertEqual(cc.remove(set()), set())
+
+    def test_uncertain_remove(self):
+        parser = BugHistoryParser(Data(), AliasAnalyzer(), None)
+        parser.currCC = None
+        parser.currActivity = Data(changes=[])
+        target = Data(bug_id=1, uncertain=True)
+        total = {"jonathan.smith@example.com", "mary.jones@mozilla.org", "b@example.com"}
+
+        # TRUNCATED EMAILS ARE MATCHED TO THE CLOSEST ONE IN THE SET
+        total = parser.removeValues(total, {"jonathan.smith@example.co"}, "added", "cc", "currBugState", target)
+        self.assertEqual(total, {"mary.jones@mozilla.org", "b@example.com"})
+        self.assertEqual(parser.currActivity.changes[0].new_value, {"jonathan.smith@example.com"})
+
+        # THE NEXT CHANGE USES THE SAME INDEX
+        cc = parser.currCC
+        total = parser.removeValues(total, {"mary.jones@mozilla.or", "zzzzzz@nowhere.net"}, "added", "cc", "currBugState", target)
+        self.assertIs(parser.currCC, cc)
+        self.assertEqual(total, {"b@example.com"})
+        self.assertEqual(set(cc.canonical.keys()), {"b@example.com"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.extract_bugzilla import MAX_TIMESTAMP
+from bugzilla_etl.parse_bug_history import BugHistoryParser, STOP_BUG
+from jx_python import jx
+from mo_dots import Data, wrap
+from mo_future import text_type
+from util.benchmark import _Collect
+from util.synthetic import SyntheticBugzilla
+
+
+class TestCurrent(unittest.TestCase):
+
+    def test_last_version_of_each_bug(self):
+        rows = jx.sort(list(SyntheticBugzilla(seed=3, num_bugs=20, large_bug_rate=0.1, large_bug_activity=200).rows()), ROW_ORDER)
+        versions = _Collect()
+        current = _Collect()
+        parser = BugHistoryParser(Data(large_bug_rows=150, large_bug_chunk=50), AliasAnalyzer(), versions, current)
+        for r in rows:
+            parser.processRow(r)
+        parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+
+        last = {}
+        for v in versions:
+            last[v["value"].bug_id] = v["value"]
+        self.assertEqual(len(current), len(last))
+        for c in current:
+            value = c["value"]
+            self.assertEqual(c["id"], text_type(value.bug_id))
+            self.assertIs(value, last[value.bug_id])
+            self.assertEqual(value.expires_on, MAX_TIMESTAMP)
+
+    def test_no_current_queue(self):
+        rows = jx.sort(list(SyntheticBugzilla(seed=3, num_bugs=2).rows()), ROW_ORDER)
+        versions = _Collect()
+        parser = BugHistoryParser(Data(), AliasAnalyzer(), versions)
+        for r in rows:
+            parser.processRow(r)
+        parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+        self.assertGreater(len(versions), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+from datetime import date
+from time import time
+
+from bugzilla_etl import transform_bugzilla
+from bugzilla_etl.transform_bugzilla import DateNormalizer, date2milli, _parse_date
+from mo_logs import Log
+
+VALUES = [
+    "2012-01-01 00:00:00",
+    "2012/01/01 13:14:15",
+    "2012-01/01 23:59:59",
+    "1969-12-31 23:59:59",
+    "2012-08-08",
+    "2012-08-08 0:00",
+    "2012/08/08",
+    "2012-02-30",
+    "2012-01-01 00:00:00.123",
+    "2012-01-01 00:00:00 PST",
+    "2012-01-01 24:00:00",
+    "not a date",
+    1356998400000,
+    1.3569984e+12,
+    date(2012, 1, 1),
+]
+
+
+class TestDates(unittest.TestCase):
+
+    def test_same_as_regex(self):
+        for value in VALUES:
+            self.assertEqual(_result(date2milli, value), _result(_parse_date, value), value)
+            self.assertEqual(_result(date2milli, value), _result(_parse_date, value), value)  # CACHED
+
+    def test_unchanged_is_skipped(self):
+        dates = DateNormalizer()
+        value = "2012-01-01 00:00:00"
+        expected = dates.date2milli("cf_last_resolved", value)
+        transform_bugzilla._date_cache.clear()
+        self.assertEqual(dates.date2milli("cf_last_resolved", value), expected)
+        self.assertEqual(transform_bugzilla._date_cache, {})
+
+    def test_faster_than_regex(self):
+        values = ["2012-01-%02d %02d:00:00" % (d, h) for d in range(1, 29) for h in range(24)] * 3
+        transform_bugzilla._date_cache.clear()
+
+        start = time()
+        for v in values:
+            _parse_date(v)
+        regex_time = time() - start
+
+        start = time()
+        for v in values:
+            date2milli(v)
+        fast_time = time() - start
+
+        Log.note("regex+strptime: {{regex|round(places=3)}}sec, fast: {{fast|round(places=3)}}sec", regex=regex_time, fast=fast_time)
+        self.assertLess(fast_time, regex_time)
+
+
+def _result(func, value):
+    try:
+        return repr(func(value))
+    except Exception:
+        return "error"
+
+
+if __name__ == "__main__":
+    unittest.main()
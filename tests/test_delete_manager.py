@@ -0,0 +1,110 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import os
+import tempfile
+import unittest
+
+from bugzilla_etl import delete_manager
+from bugzilla_etl.delete_manager import DeleteManager, MAX_TASKS, BATCH_SIZE
+from mo_dots import Data, wrap
+from pyLibrary.testing.elasticsearch import FakeES
+
+
+class TestDeleteManager(unittest.TestCase):
+
+    def setUp(self):
+        self.poll_interval = delete_manager.POLL_INTERVAL
+        delete_manager.POLL_INTERVAL = 0.01
+
+    def tearDown(self):
+        delete_manager.POLL_INTERVAL = self.poll_interval
+
+    def test_tasks_are_limited(self):
+        index = _Index("7.10.2")
+        deletes = DeleteManager(index)
+        deletes.delete("bug_id", range(BATCH_SIZE * MAX_TASKS * 3))
+        deletes.wait()
+        self.assertEqual(index.cluster.posted, MAX_TASKS * 3)
+        self.assertLessEqual(index.cluster.most_running, MAX_TASKS)
+        self.assertEqual(index.cluster.running, set())
+        self.assertEqual(index.deleted, 0)
+
+    def test_old_version(self):
+        index = _Index("2.4.6")
+        deletes = DeleteManager(index)
+        deletes.delete("bug_id", range(BATCH_SIZE + 1))
+        deletes.wait()
+        self.assertEqual(index.cluster.posted, 0)
+        self.assertEqual(index.deleted, 2)
+
+    def test_fake_es(self):
+        fd, filename = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            es = FakeES(filename=filename)
+            es.extend(
+                {"id": str(b) + "_" + str(v), "value": {"bug_id": b, "modified_ts": v}}
+                for b in range(10)
+                for v in range(3)
+            )
+            deletes = DeleteManager(es)
+            deletes.delete("bug_id", [2, 3, 7])
+            deletes.wait()
+            self.assertEqual(sorted(set(d.bug_id for d in es.data.values())), [0, 1, 4, 5, 6, 8, 9])
+
+            # THE DELETES ARE IN THE FILE
+            self.assertEqual(len(FakeES(filename=filename).data), 7 * 3)
+        finally:
+            os.remove(filename)
+
+
+class _Index(object):
+
+    def __init__(self, version):
+        self.settings = Data(index="bugs")
+        self.cluster = _Cluster(version)
+        self.deleted = 0
+
+    def delete_record(self, filter):
+        self.deleted += 1
+
+
+class _Cluster(object):
+
+    def __init__(self, version):
+        self.version = version
+        self.posted = 0
+        self.running = set()
+        self.most_running = 0
+        self.polls = {}
+
+    def post(self, path, json, timeout, params):
+        self.posted += 1
+        task = "node:" + str(self.posted)
+        self.running.add(task)
+        self.most_running = max(self.most_running, len(self.running))
+        return wrap({"task": task})
+
+    def get(self, path, timeout):
+        # EACH TASK IS DONE ON ITS SECOND POLL
+        task = path.split("/")[-1]
+        self.polls[task] = self.polls.get(task, 0) + 1
+        if self.polls[task] < 2:
+            return wrap({"completed": False})
+        self.running.discard(task)
+        return wrap({"completed": True, "response": {"failures": []}})
+
+
+if __name__ == "__main__":
+    unittest.main()
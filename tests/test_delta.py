@@ -0,0 +1,91 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.delta import DELTA, reconstruct, versions
+from bugzilla_etl.parse_bug_history import BugHistoryParser, STOP_BUG
+from jx_python import jx
+from mo_dots import Data, wrap
+from mo_json import json2value, value2json
+from util.benchmark import _Collect
+from util.synthetic import SyntheticBugzilla
+
+
+class TestDelta(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rows = jx.sort(list(SyntheticBugzilla(seed=3, num_bugs=20, large_bug_rate=0.1, large_bug_activity=200).rows()), ROW_ORDER)
+        cls.full = _parse(rows, Data())
+        cls.compact = _parse(rows, Data(snapshot_interval=10, large_bug_rows=150, large_bug_chunk=50))
+
+    def test_same_versions(self):
+        self.assertEqual(len(self.compact), len(self.full))
+        self.assertEqual([d["id"] for d in self.compact], [d["id"] for d in self.full])
+
+        result = []
+        for _, docs in jx.groupby(_stored(self.compact), "bug_id"):
+            result.extend(versions(docs))
+        self.assertEqual(len(result), len(self.full))
+        for r, e in zip(result, self.full):
+            self.assertEqual(_comparable(r), _comparable(e["value"]))
+
+    def test_one_version(self):
+        docs = [d for d in _stored(self.compact) if d.bug_id == self.full[-1]["value"].bug_id]
+        expected = [d["value"] for d in self.full if d["value"].bug_id == docs[0].bug_id]
+        for e in expected:
+            # ONLY THE DOCUMENTS FROM THE SNAPSHOT ON ARE NEEDED
+            v = e.bug_version_num
+            start = v - (v - 1) % 10
+            result = reconstruct([d for d in docs if start <= d.bug_version_num <= v], v)
+            self.assertEqual(_comparable(result), _comparable(e))
+
+    def test_missing_snapshot(self):
+        docs = [d for d in _stored(self.compact) if d.bug_version_num > 1]
+        bug_id = docs[0].bug_id
+        with self.assertRaises(Exception):
+            reconstruct([d for d in docs if d.bug_id == bug_id], 2)
+
+    def test_smaller(self):
+        snapshots = len([d for d in self.compact if d["value"][DELTA] == None])
+        self.assertLess(snapshots, len(self.compact) / 5)
+        full_size = sum(len(value2json(d["value"])) for d in self.full)
+        compact_size = sum(len(value2json(d["value"])) for d in self.compact)
+        self.assertLess(compact_size, full_size / 3)
+
+
+def _parse(rows, settings):
+    output = _Collect()
+    parser = BugHistoryParser(settings, AliasAnalyzer(), output)
+    for r in rows:
+        parser.processRow(r.copy())
+    parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+    return output
+
+
+def _stored(output):
+    # WHAT ES WOULD GIVE BACK
+    return [json2value(value2json(d["value"])) for d in output]
+
+
+def _comparable(version):
+    value = json2value(value2json(version))
+    value.etl = None  # HAS THE TIME OF THE RUN
+    return value2json(value)
+
+
+if __name__ == "__main__":
+    unittest.main()
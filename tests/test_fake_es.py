@@ -0,0 +1,68 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import os
+import tempfile
+import unittest
+
+from pyLibrary.testing.elasticsearch import FakeES
+
+
+class TestFakeES(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.es = FakeES(filename=self.filename)
+        self.es.extend(
+            {"id": str(b), "value": {"bug_id": b, "modified_ts": b * 10, "product": "a" if b % 2 else "b"}}
+            for b in range(10)
+        )
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_should(self):
+        self.assertEqual(self._bug_ids({"should": [{"term": {"bug_id": 1}}, {"term": {"bug_id": 2}}]}), [1, 2])
+        # WITH SOMETHING REQUIRED, should ONLY SCORES
+        self.assertEqual(self._bug_ids({"filter": {"term": {"bug_id": 3}}, "should": {"term": {"bug_id": 2}}}), [3])
+        self.assertEqual(self._bug_ids({"filter": {"terms": {"bug_id": [2, 3]}}, "should": {"term": {"bug_id": 2}}, "minimum_should_match": 1}), [2])
+
+    def test_must_not(self):
+        self.assertEqual(self._bug_ids({"must_not": {"term": {"product": "a"}}}), [0, 2, 4, 6, 8])
+        self.assertEqual(
+            self._bug_ids({"filter": {"range": {"modified_ts": {"gte": 30}}}, "must_not": [{"term": {"bug_id": 4}}, {"term": {"product": "a"}}]}),
+            [6, 8]
+        )
+        self.assertEqual(self._bug_ids({"must_not": {"match_all": {}}}), [])
+
+    def test_nested_bool(self):
+        self.assertEqual(self._bug_ids({"must": {"bool": {"should": [{"term": {"bug_id": 1}}, {"term": {"bug_id": 8}}]}}}), [1, 8])
+
+    def test_unknown_clause(self):
+        with self.assertRaises(Exception):
+            self._bug_ids({"filter": {"term": {"bug_id": 1}}, "boost": 2})
+        with self.assertRaises(Exception):
+            self._bug_ids({"should": [{"term": {"bug_id": 1}}], "minimum_should_match": 2})
+
+    def test_delete_with_must_not(self):
+        self.es.delete_record({"bool": {"must_not": {"term": {"product": "a"}}}})
+        self.assertEqual(sorted(d.bug_id for d in self.es.data.values()), [1, 3, 5, 7, 9])
+
+    def _bug_ids(self, bool):
+        result = self.es.search({"query": {"bool": bool}, "size": 100})
+        return sorted(h._source.bug_id for h in result.hits.hits)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.parse_bug_history import BugHistoryParser, parse_flag
+from mo_dots import Data, FlatList, Null
+from util.benchmark import _Collect
+
+
+class TestFlags(unittest.TestCase):
+
+    def test_parse_flag(self):
+        for _ in range(2):  # SECOND TIME IS FROM THE CACHE
+            flag = parse_flag("review?(kyle@example.com)", 10, "a@example.com")
+            self.assertEqual(flag.request_type, "review")
+            self.assertEqual(flag.request_status, "?")
+            self.assertEqual(flag.requestee, "kyle@example.com")
+            self.assertEqual(flag.modified_ts, 10)
+
+            flag = parse_flag("approval-mozilla-beta+", 20, "b@example.com")
+            self.assertEqual(flag.request_type, "approval-mozilla-beta")
+            self.assertEqual(flag.request_status, "+")
+            self.assertEqual(flag.requestee, None)
+            self.assertEqual(set(flag.keys()), {"modified_ts", "modified_by", "value", "request_type", "request_status"})
+
+            flag = parse_flag("review?(kyle@exam", 30, "c@example.com")
+            self.assertEqual(flag.request_type, None)
+
+    def test_find_first(self):
+        parser = BugHistoryParser(Data(), AliasAnalyzer(), _Collect())
+        flags = FlatList()
+        for i, f in enumerate(["review+", "review?(x@y)", "feedback-", "review?(x@y)", "review+"]):
+            parser.appendFlag(flags, parse_flag(f, i, "a@b"))
+
+        self.assertEqual(parser.findFlag(flags, parse_flag("review?(x@y)", 9, "z@z")).modified_ts, 1)
+        self.assertEqual(parser.findFlag(flags, parse_flag("Review+", 9, "a@b")).modified_ts, 0)
+        self.assertEqual(parser.findFlag(flags, parse_flag("review-", 9, "c@d")), Null)
+        self.assertEqual(parser.findFlag(flags, parse_flag("feedb", 9, "c@d")).modified_ts, 2)  # BY VALUE PREFIX
+
+        # CHANGES ARE SEEN BY THE INDEX
+        index = parser.flagIndex(flags)
+        first = index.find(parse_flag("review?(x@y)", 9, "z@z"))
+        first.request_status = "+"
+        index.update(first)
+        self.assertEqual(index.find(parse_flag("review?(x@y)", 9, "z@z")).modified_ts, 3)
+        flags.remove(flags[0])
+        index.remove(parse_flag("review+", 0, "a@b"))
+        self.assertEqual(index.find(parse_flag("review+", 9, "a@b")).modified_ts, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
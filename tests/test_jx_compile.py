@@ -0,0 +1,44 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from jx_base.expressions import jx_expression
+from jx_python import expressions, jx
+from jx_python.expressions import jx_expression_to_function, COMPILE_STATS
+
+
+class TestJxCompile(unittest.TestCase):
+
+    def test_same_function(self):
+        hits = COMPILE_STATS["hit"]
+        a = jx_expression_to_function({"tuple": ["a", "b"]})
+        b = jx_expression_to_function(jx_expression({"tuple": ["a", "b"]}))
+        self.assertIs(a, b)
+        self.assertEqual(COMPILE_STATS["hit"], hits + 1)
+        self.assertEqual(a({"a": 1, "b": 2}), (1, 2))
+        self.assertIsNot(a, jx_expression_to_function({"tuple": ["b", "a"]}))
+
+    def test_sort_still_works(self):
+        data = [{"a": 2, "b": "x"}, {"a": 1, "b": "y"}, {"a": 2, "b": "z"}]
+        for _ in range(3):
+            self.assertEqual(jx.sort(data, ["a", {"field": "b", "sort": -1}]).b, ["y", "z", "x"])
+
+    def test_bounded(self):
+        for i in range(expressions.MAX_COMPILED_EXPRESSIONS + 10):
+            self.assertTrue(jx_expression_to_function({"eq": {"a": i}})({"a": i}))
+        self.assertEqual(len(expressions._compiled), expressions.MAX_COMPILED_EXPRESSIONS)
+
+
+if __name__ == "__main__":
+    unittest.main()
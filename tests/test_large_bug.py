@@ -0,0 +1,120 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.parse_bug_history import BugHistoryParser, STOP_BUG, _ChunkedOutput, _sort_versions
+from jx_python import jx
+from mo_dots import Data, FlatList, wrap
+from mo_json import value2json
+from mo_threads import Signal, ThreadedQueue, THREAD_STOP
+from util.benchmark import _Collect
+from util.synthetic import SyntheticBugzilla
+
+
+class TestLargeBug(unittest.TestCase):
+
+    def test_same_versions(self):
+        rows = jx.sort(list(SyntheticBugzilla(seed=3, num_bugs=20, large_bug_rate=0.1, large_bug_activity=200).rows()), ROW_ORDER)
+
+        expected = _Collect()
+        _parse(rows, Data(), expected)
+
+        result = _Collect()
+        with ThreadedQueue("large bug versions", result, max_size=100, period=0.1, silent=True) as queue:
+            _parse(rows, Data(large_bug_rows=150, large_bug_chunk=50), queue)
+            queue.add(THREAD_STOP)
+
+        self.assertEqual(len(result), len(expected))
+        for e, r in zip(expected, result):
+            self.assertEqual(_comparable(r), _comparable(e))
+
+    def test_sort_versions(self):
+        versions = FlatList([Data(modified_ts=t, n=i) for i, t in enumerate([3, 1, 3, 2, 1, 3, 2])])
+        expected = jx.sort(versions, [{"field": "modified_ts", "sort": -1}])
+        _sort_versions(versions)
+        self.assertEqual([(v.modified_ts, v.n) for v in versions], [(v.modified_ts, v.n) for v in expected])
+
+    def test_activities_are_released(self):
+        # THE ACTIVITIES STILL WAITING FOR THEIR VERSION, EACH TIME A CHUNK IS SENT
+        rows = jx.sort(list(SyntheticBugzilla(seed=3, num_bugs=1, large_bug_rate=1, large_bug_activity=400).rows()), ROW_ORDER)
+        output = _Watch()
+        parser = BugHistoryParser(Data(large_bug_rows=100, large_bug_chunk=50), AliasAnalyzer(), output)
+        output.parser = parser
+        for r in rows:
+            parser.processRow(r.copy())
+        parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+
+        self.assertGreater(len(output.remaining), 2)
+        self.assertEqual(output.remaining, sorted(output.remaining, reverse=True))
+        self.assertEqual(output.remaining[-1], 0)
+        self.assertEqual(parser.bugVersionsMap, {})
+
+    def test_stalled_output(self):
+        stalled = _Stalled()
+        please_stop = Signal("stop waiting")
+        please_stop.go()
+        queue = ThreadedQueue("stalled versions", stalled, max_size=100, period=0.1, silent=True)
+        try:
+            output = _ChunkedOutput(queue, 2, 1, 10, please_stop)
+            output.add({"id": "a"})
+            with self.assertRaises(Exception):
+                output.add({"id": "b"})
+        finally:
+            stalled.release.go()
+            queue.stop()
+
+
+class _Stalled(_Collect):
+    """
+    OUTPUT THAT NEVER FINISHES A BULK INSERT, UNTIL release
+    """
+
+    def __init__(self):
+        _Collect.__init__(self)
+        self.release = Signal("release")
+
+    def extend(self, values):
+        self.release.wait()
+        _Collect.extend(self, values)
+
+
+class _Watch(_Collect):
+
+    def __init__(self):
+        _Collect.__init__(self)
+        self.parser = None
+        self.remaining = []
+
+    def extend(self, values):
+        self.remaining.append(len(self.parser.bugVersions))
+        _Collect.extend(self, values)
+
+
+def _parse(rows, settings, output):
+    parser = BugHistoryParser(settings, AliasAnalyzer(), output)
+    for r in rows:
+        parser.processRow(r.copy())
+    parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+
+
+def _comparable(version):
+    value = version["value"].copy()
+    value.etl = None  # HAS THE TIME OF THE RUN
+    return value2json(value)
+
+
+if __name__ == "__main__":
+    unittest.main()
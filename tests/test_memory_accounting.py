@@ -0,0 +1,55 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import tracemalloc
+import unittest
+
+from bugzilla_etl import parse_bug_history
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.parse_bug_history import BugHistoryParser, STOP_BUG
+from jx_python import jx
+from mo_dots import Data, wrap
+from util.benchmark import _Collect
+from util.synthetic import SyntheticBugzilla
+
+
+class TestMemoryAccounting(unittest.TestCase):
+
+    def test_heaviest_bugs(self):
+        rows = jx.sort(list(SyntheticBugzilla(seed=3, num_bugs=30, large_bug_rate=0).rows()), ROW_ORDER)
+        versions = _Collect()
+
+        parse_bug_history.DEBUG_MEMORY = True
+        try:
+            parser = BugHistoryParser(Data(), AliasAnalyzer(), versions)
+        finally:
+            parse_bug_history.DEBUG_MEMORY = False
+        for r in rows:
+            parser.processRow(r)
+        parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+
+        report = parser.memory.report()
+        self.assertEqual(len(report), min(30, parse_bug_history.MEMORY_TOP))
+        self.assertEqual([r["peak"] for r in report], sorted([r["peak"] for r in report], reverse=True))
+        for r in report:
+            self.assertEqual(r["versions"], len([v for v in versions if v["value"].bug_id == r["bug_id"]]))
+            self.assertGreater(r["rows"], 0)
+        self.assertEqual(parser.memory.report(), [])
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
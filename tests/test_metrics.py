@@ -0,0 +1,65 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.metrics import Metrics
+from mo_files import File
+from mo_json import json2value
+from mo_threads import Queue
+
+RESULTS = "tests/results/metrics.json"
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_snapshot_resets(self):
+        metrics = Metrics()
+        metrics.counter("parse").inc(10)
+        for s in [0.001, 0.002, 0.004, 1.0]:
+            metrics.histogram("parse").add(s)
+        queue = Queue("test", max=100)
+        queue.extend([1, 2, 3])
+        metrics.watch(queue)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["parse"], 10)
+        self.assertEqual(snapshot["gauges"]["queue.test"], 3)
+        parse = snapshot["histograms"]["parse"]
+        self.assertEqual(parse["count"], 4)
+        self.assertEqual(parse["max"], 1.0)
+        self.assertLessEqual(parse["p50"], 0.002 * 2)
+        self.assertEqual(parse["p99"], 1.0)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["parse"], 0)
+        self.assertNotIn("parse", snapshot["histograms"])
+
+    def test_write_json_lines(self):
+        File(RESULTS).delete()
+        metrics = Metrics()
+        metrics.start(filename=RESULTS, interval=3600)
+        try:
+            with metrics.timer("sort"):
+                pass
+            metrics.write(block={"min": 0, "max": 1000})
+        finally:
+            metrics.stop()
+
+        lines = [json2value(l) for l in File(RESULTS).read_lines() if l.strip()]
+        self.assertEqual(lines[0].block.max, 1000)
+        self.assertEqual(lines[0].histograms.sort.count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl import parse_bug_history
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.parse_bug_history import BugHistoryParser, STOP_BUG
+from bugzilla_etl.transform_bugzilla import _scrub, _sort, sort, normalize, date2milli, MULTI_FIELDS, NUMERIC_FIELDS, ZERO_IS_NULL, NULL_VALUES, DATE_FIELDS
+from jx_python import jx
+from mo_dots import Data, FlatList, Null, listwrap, unwrap, wrap
+from mo_json import json2value, value2json
+from mo_times import Date
+from pyLibrary import convert
+from pyLibrary.env import elasticsearch
+from util.benchmark import _Collect
+from util.synthetic import SyntheticBugzilla
+
+VALUES = [
+    None,
+    "",
+    "b",
+    "a",
+    "B",
+    0,
+    3,
+    -1,
+    2.5,
+    3.0,
+    float("nan"),
+    True,
+    False,
+]
+
+RECORDS = [
+    {"attach_id": 2, "field_name": "flagtypes.name"},
+    {"attach_id": None, "field_name": "cc"},
+    {"attach_id": 1, "field_name": "cc"},
+    {"field_name": "bug_status"},
+    {"attach_id": 1, "field_name": "attachments.isobsolete"},
+    {"attach_id": 2, "field_name": ["a", "b"]},  # NOT SIMPLE, FALLS BACK TO sort()
+]
+
+
+class TestNormalize(unittest.TestCase):
+
+    def test_sort_values(self):
+        for i in range(len(VALUES)):
+            values = VALUES[i:] + VALUES[:i]
+            self.assertEqual(_comparable(_sort(values)), _comparable(unwrap(sort(values))))
+
+    def test_sort_records(self):
+        for i in range(len(RECORDS)):
+            records = RECORDS[i:] + RECORDS[:i]
+            self.assertEqual(_sort(records[:-1], ["attach_id", "field_name"]), unwrap(sort(records[:-1], ["attach_id", "field_name"])))
+            self.assertEqual(_sort(records, ["attach_id", "field_name"]), unwrap(sort(records, ["attach_id", "field_name"])))
+
+    def test_sort_nothing(self):
+        self.assertIsNone(_sort(None))
+        self.assertIsNone(_sort([]))
+        self.assertEqual(_sort("a"), ["a"])
+
+    def test_scrub(self):
+        for value in [
+            {"A": "", "b": [], "c": [None, "x"], "d": {"e": None}, "f": 3.0, "g": {1, 2}, "h": False},
+            [wrap({"a": 1}), FlatList([1, 2]), Null, 2.5],
+            Data(x=Data(y=""), Z=[1]),
+            "",
+            7,
+        ]:
+            self.assertEqual(value2json(_scrub(value)), value2json(elasticsearch.scrub(value)))
+
+    def test_parser_state_is_sorted(self):
+        bug = {
+            "bug_id": 1,
+            "modified_ts": 1400000000000,
+            "cc": ["b@x.com", "a@x.com"],
+            "keywords": "crash",
+            "dependson": ["12", "3"],
+            "flags": [{"value": "review?"}, {"value": "needinfo?"}],
+            "changes": [
+                {"field_name": "cc", "new_value": ["b@x.com", "a@x.com"], "old_value": ""},
+                {"field_name": "bug_status", "new_value": "NEW"},
+            ],
+            "priority": "--",
+            "etl": {},
+        }
+        result = normalize(bug)
+        self.assertEqual(result.cc, ["a@x.com", "b@x.com"])
+        self.assertEqual(result.keywords, "crash")
+        self.assertEqual(result.dependson, [3, 12])
+        self.assertEqual(result.flags.value, ["needinfo?", "review?"])
+        self.assertEqual(result.changes.field_name, ["bug_status", "cc"])
+        self.assertEqual(result.priority, None)
+        self.assertEqual(result.id, "1_1400000000")
+        # THE PARSER SEES THE SORTED changes
+        self.assertEqual(bug["changes"][0]["new_value"], ["a@x.com", "b@x.com"])
+        self.assertIsNotNone(bug["etl"]["timestamp"])
+
+    def test_same_as_multi_pass(self):
+        for seed in range(3):
+            rows = jx.sort(list(SyntheticBugzilla(seed=seed, num_bugs=30, large_bug_rate=0.1, large_bug_activity=200).rows()), ROW_ORDER)
+            expected = _parse(rows, _multi_pass_normalize)
+            result = _parse(rows, normalize)
+            self.assertGreater(len(result), 0)
+            self.assertEqual(len(result), len(expected))
+            for r, e in zip(result, expected):
+                self.assertEqual(r["id"], e["id"])
+                self.assertEqual(_without_etl(r["value"]), _without_etl(e["value"]))
+
+
+def _parse(rows, normalize):
+    output = _Collect()
+    original = parse_bug_history.normalize
+    parse_bug_history.normalize = normalize
+    try:
+        parser = BugHistoryParser(Data(), AliasAnalyzer(), output)
+        for r in rows:
+            parser.processRow(r.copy())
+        parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+    finally:
+        parse_bug_history.normalize = original
+    return output
+
+
+def _without_etl(version):
+    value = json2value(value2json(version))
+    value.etl = None  # HAS THE TIME OF THE RUN
+    return value2json(value)
+
+
+def _multi_pass_normalize(bug, dates=None):
+    # normalize() AS IT WAS, BEFORE IT WAS DONE IN ONE PASS
+    bug = bug.copy()
+    bug.id = str(bug.bug_id) + "_" + str(bug.modified_ts)[:-3]
+    bug._id = None
+    bug.flags = sort(bug.flags, "value")
+
+    if bug.attachments:
+        bug.attachments = sort(bug.attachments, "attach_id")
+        for a in bug.attachments:
+            for k, v in list(a.items()):
+                if k.startswith("attachments") and (k.endswith("isobsolete") or k.endswith("ispatch") or k.endswith("isprivate")):
+                    new_v = convert.value2int(v)
+                    del a[k]
+                    a[k[12:]] = new_v
+                elif k.startswith("attachments") and k.endswith("mimetype"):
+                    del a[k]
+                    a[k[12:]] = v
+            a.flags = sort(a.flags, ["modified_ts", "requestee", "value"])
+
+    if bug.changes != None:
+        for c in listwrap(bug.changes):
+            c.new_value = sort(c.new_value)
+            c.old_value = sort(c.old_value)
+        bug.changes = sort(bug.changes, ["attach_id", "field_name"])
+
+    for k, v in list(bug.items()):
+        if v in NULL_VALUES:
+            bug[k] = None
+
+    for f in NUMERIC_FIELDS:
+        v = bug[f]
+        if v == None:
+            continue
+        elif f in MULTI_FIELDS:
+            bug[f] = jx.sort(convert.value2intlist(v))
+        elif f in ZERO_IS_NULL and convert.value2number(v) == 0:
+            del bug[f]
+        else:
+            bug[f] = convert.value2number(v)
+
+    for f in MULTI_FIELDS:
+        v = listwrap(bug[f])
+        if v:
+            bug[f] = jx.sort(v)
+
+    for f in DATE_FIELDS:
+        v = bug[f]
+        if v != None:
+            bug[f] = date2milli(v)
+
+    bug.votes = None
+    bug.etl.timestamp = Date.now()
+    return elasticsearch.scrub(bug)
+
+
+def _comparable(values):
+    # nan != nan, AND Null IS None
+    return [("null", None) if v == None else ("nan", None) if v != v else (v.__class__.__name__, v) for v in values]
+
+
+if __name__ == "__main__":
+    unittest.main()
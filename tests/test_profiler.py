@@ -0,0 +1,92 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+from time import time
+
+from bugzilla_etl.metrics import METRICS
+from mo_files import File
+from mo_future import get_ident
+from mo_threads import Thread
+from mo_threads import sampler
+from mo_threads.sampler import SamplingProfiler, set_tag, stage
+
+RESULTS = "tests/results/profile.collapsed"
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_collapsed_stacks(self):
+        File(RESULTS).delete()
+        profiler = SamplingProfiler(filename=RESULTS, rate=200, interval=3600).start()
+        try:
+            set_tag("block 0..1000")
+            Thread.run("busy", _busy).join()
+        finally:
+            profiler.stop()
+            set_tag("untagged")
+
+        lines = [l for l in File(RESULTS).read_lines() if l.strip()]
+        busy = [l for l in lines if l.startswith("block 0..1000;busy;parse;")]
+        self.assertTrue(busy, "expecting samples of the busy thread, in the parse stage")
+        self.assertTrue(any("_spin (test_profiler.py)" in l for l in busy))
+        for l in lines:
+            stack, count = l.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+    def test_append_and_forget(self):
+        File(RESULTS).delete()
+        profiler = SamplingProfiler(filename=RESULTS, rate=200, interval=3600)
+        profiler.sample()
+        profiler.write()
+        self.assertEqual(len(profiler.samples), 0)
+        first = list(File(RESULTS).read_lines())
+        profiler.sample()
+        profiler.write()
+        self.assertGreater(len(list(File(RESULTS).read_lines())), len(first))
+
+    def test_max_keys(self):
+        profiler = SamplingProfiler(filename=RESULTS, rate=200, interval=3600, max_keys=1)
+        busy = Thread.run("busy", _busy)
+        for _ in range(20):
+            profiler.sample()
+        busy.join()
+        self.assertEqual(len(profiler.samples), 1)
+        self.assertGreater(profiler.dropped, 0)
+
+    def test_stages_forgotten(self):
+        idents = []
+        Thread.run("stages", _stages, idents).join()
+        self.assertNotIn(idents[0], sampler._stages)
+
+
+def _stages(idents, please_stop):
+    idents.append(get_ident())
+    with stage("a"):
+        with stage("b"):
+            pass
+
+
+def _busy(please_stop):
+    with METRICS.timer("parse"):
+        _spin()
+
+
+def _spin():
+    end = time() + 0.5
+    while time() < end:
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
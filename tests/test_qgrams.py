@@ -0,0 +1,81 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+from random import Random
+
+from bugzilla_etl.qgrams import QGramIndex
+from mo_logs.strings import edit_distance
+
+LETTERS = "abcdefghij.@"
+
+
+class TestQGrams(unittest.TestCase):
+
+    def test_never_misses_a_match(self):
+        rand = Random(42)
+        for _ in range(20):
+            strings = set(_word(rand) for _ in range(100))
+            index = QGramIndex()
+            for s in strings:
+                index.add(s, s)
+            for _ in range(20):
+                query = _mutate(rand, rand.choice(sorted(strings)))
+                for max_distance in [0.1, 0.3, 0.5]:
+                    expected = set(s for s in strings if edit_distance(s, query) < max_distance)
+                    candidates = index.candidates(query, max_distance)
+                    self.assertTrue(expected <= candidates, query)
+
+    def test_prunes(self):
+        rand = Random(42)
+        emails = ["".join(rand.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8)) + "@" + rand.choice(["example.com", "mozilla.org", "gmail.com"]) for _ in range(1000)]
+        index = QGramIndex()
+        for i, e in enumerate(emails):
+            index.add(e, i)
+        candidates = index.candidates("x" + emails[17][1:], 0.3)
+        self.assertIn(17, candidates)
+        self.assertLess(len(candidates), len(emails) // 5)
+        self.assertLess(len(index.candidates("somebody.else@mozilla.org", 0.3)), 10)
+
+    def test_remove(self):
+        index = QGramIndex()
+        index.add("kyle@example.com", "a")
+        index.add("kyle@example.com", "b")
+        index.remove("kyle@example.com", "a")
+        self.assertEqual(index.candidates("kyle@example.com", 0.3), {"b"})
+        index.remove("kyle@example.com", "b")
+        self.assertEqual(index.candidates("kyle@example.com", 0.3), set())
+        self.assertEqual(index.postings, {})
+
+
+def _word(rand):
+    return "".join(rand.choice(LETTERS) for _ in range(rand.randint(1, 12)))
+
+
+def _mutate(rand, word):
+    word = list(word)
+    for _ in range(rand.randint(0, 3)):
+        i = rand.randint(0, len(word))
+        op = rand.randint(0, 2)
+        if op == 0:
+            word.insert(i, rand.choice(LETTERS))
+        elif word and i < len(word):
+            if op == 1:
+                del word[i]
+            else:
+                word[i] = rand.choice(LETTERS)
+    return "".join(word)
+
+
+if __name__ == "__main__":
+    unittest.main()
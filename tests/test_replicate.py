@@ -0,0 +1,164 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from time import sleep, time
+
+from bugzilla_etl import replicate
+from mo_dots import Data, coalesce, wrap
+from mo_json import value2json
+
+
+class TestReplicate(unittest.TestCase):
+
+    def setUp(self):
+        self.batch_size = replicate.BATCH_SIZE
+        replicate.BATCH_SIZE = 1  # SO THE batches QUEUE FILLS
+        fd, self.filename = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            for i in range(200):
+                f.write(value2json({"bug_id": i + 1, "modified_ts": 1400000000000}) + "\n")
+
+    def tearDown(self):
+        replicate.BATCH_SIZE = self.batch_size
+        os.remove(self.filename)
+
+    def test_load(self):
+        destination = _Destination()
+        checkpoint = Data()
+        replicate.extract_from_file(Data(filename=self.filename, num_processes=2), destination, checkpoint)
+        self.assertEqual(len(destination.records), 200)
+        self.assertEqual(checkpoint.lines, 200)
+
+    def test_read_ahead_is_bounded(self):
+        read = [0]
+        read_batches = replicate._read_batches
+
+        def counting(*args):
+            for batch in read_batches(*args):
+                read[0] += 1
+                yield batch
+
+        checkpoint = Data()
+        destination = _Destination(delay=0.01, read=read, checkpoint=checkpoint)
+        replicate._read_batches = counting
+        try:
+            replicate.extract_from_file(Data(filename=self.filename, num_processes=2), destination, checkpoint)
+        finally:
+            replicate._read_batches = read_batches
+        self.assertEqual(len(destination.records), 200)
+        self.assertLessEqual(destination.most_ahead, 2 * 2)
+
+    def test_resume_with_saved_slices(self):
+        source = _Source(150)
+        first, last = source.key(10, 2), source.key(90, 0)
+        # THE RUN THAT DID NOT FINISH HAD FEWER BUGS, AND OTHER SLICES
+        checkpoint = Data(max_bug=100, num_slices=4, slices={"0": first, "3": last})
+        sink = _Sink()
+        replicate.replicate(source, sink, datetime(2000, 1, 1), num_slices=2, checkpoint=checkpoint)
+
+        # SLICES OF 26 BUGS; THE LAST ONE HAS NO END
+        expected = [
+            d["id"]
+            for d in source.docs
+            if not (d["bug_id"] < 26 and source.key(d) <= first) and not (d["bug_id"] >= 78 and source.key(d) <= last)
+        ]
+        self.assertEqual(sorted(sink.ids), sorted(expected))
+        self.assertEqual((checkpoint.max_bug, checkpoint.num_slices), (100, 4))
+
+    def test_checkpoint_without_slicing(self):
+        source = _Source(20)
+        checkpoint = Data(slices={"0": source.key(10, 2)})
+        sink = _Sink()
+        replicate.replicate(source, sink, datetime(2000, 1, 1), num_slices=2, checkpoint=checkpoint)
+        self.assertEqual(sorted(sink.ids), sorted(d["id"] for d in source.docs))
+        self.assertEqual((checkpoint.max_bug, checkpoint.num_slices), (20, 2))
+
+    def test_failed_loader(self):
+        start = time()
+        with self.assertRaises(Exception):
+            replicate.extract_from_file(Data(filename=self.filename, num_processes=2), _Destination(fail=True))
+        self.assertLess(time() - start, 30)
+
+
+class _Source(object):
+    """
+    THE search() CALLS replicate() MAKES, FOR BUGS 1 TO max_bug, THREE VERSIONS EACH
+    """
+
+    def __init__(self, max_bug):
+        self.docs = [
+            {"bug_id": b, "modified_ts": 1400000000000 + v * 1000, "id": str(b) + "_" + str(1400000000 + v)}
+            for b in range(1, max_bug + 1)
+            for v in range(3)
+        ]
+
+    def key(self, doc, version=None):
+        if version is not None:
+            return [doc, 1400000000000 + version * 1000]
+        return [doc["bug_id"], doc["modified_ts"]]
+
+    def search(self, request):
+        request = wrap(request)
+        if request.aggs:
+            return wrap({"aggregations": {"bug_id": {"value": max(d["bug_id"] for d in self.docs)}}})
+        bug_ids = request.query.bool.filter[1].range.bug_id
+        after = request.search_after
+        hits = [
+            {"_source": d, "sort": self.key(d)}
+            for d in self.docs
+            if bug_ids.gte <= d["bug_id"] and (bug_ids.lt == None or d["bug_id"] < bug_ids.lt)
+            if not after or self.key(d) > list(after)
+        ]
+        return wrap({"hits": {"hits": hits[:request.size]}})
+
+
+class _Sink(object):
+    """
+    LIKE THE ThreadedQueue replicate() WRITES TO
+    """
+
+    def __init__(self):
+        self.ids = []
+
+    def extend(self, records):
+        self.ids.extend(r["id"] for r in records)
+
+    def add(self, function):
+        function()
+
+
+class _Destination(object):
+
+    def __init__(self, fail=False, delay=0, read=None, checkpoint=None):
+        self.fail = fail
+        self.delay = delay
+        self.read = read
+        self.checkpoint = checkpoint
+        self.most_ahead = 0  # MOST BATCHES READ, BUT NOT COMMITTED
+        self.records = []
+
+    def extend(self, records):
+        if self.fail:
+            raise Exception("can not load")
+        if self.read:
+            self.most_ahead = max(self.most_ahead, self.read[0] - coalesce(self.checkpoint.lines, 0))
+        sleep(self.delay)
+        self.records.extend(records)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from mo_logs import strings
+from mo_logs.strings import expand_template
+
+
+class TestTemplates(unittest.TestCase):
+
+    def test_expand(self):
+        self.assertEqual(expand_template("hello {{name}}", {"name": "kyle"}), "hello kyle")
+        self.assertEqual(expand_template("{{a.b}} and {{a.c|json}}", {"a": {"b": 1, "c": [1, 2]}}), "1 and [1, 2]")
+        self.assertEqual(expand_template("{{x|quote}} {{y|round(places=2)}}", {"x": "q", "y": 3.14159}), "\"q\" 3.1")
+        self.assertEqual(expand_template("{{x|indent}}", {"x": "a\nb"}), "\ta\n\tb")
+        self.assertEqual(expand_template("no vars", {}), "no vars")
+        self.assertEqual(expand_template("{{missing}}!", {}), "!")
+
+    def test_bad_filters_fall_back(self):
+        self.assertEqual(expand_template("{{x|nosuchfilter}}", {"x": 1}), "1")
+        self.assertEqual(expand_template("{{x|left(2)}}{{x|bad(}}", {"x": "abcdef"}), "ababcdef")
+
+    def test_bad_filter_raises_new_error(self):
+        f = strings._failed_filter(SyntaxError("unexpected EOF while parsing", ("<template>", 1, 8, "bad(val, ")))
+        errors = []
+        for _ in range(3):
+            try:
+                f(1)
+            except SyntaxError as e:
+                errors.append(e)
+        self.assertIsNot(errors[0], errors[1])
+        self.assertEqual(errors[0].args, errors[2].args)
+        self.assertIsNone(errors[2].__traceback__.tb_next.tb_next)
+
+    def test_cache_is_bounded(self):
+        for i in range(strings.MAX_COMPILED_TEMPLATES + 10):
+            self.assertEqual(expand_template("{{x}} " + str(i), {"x": "a"}), "a " + str(i))
+        self.assertEqual(len(strings._compiled), strings.MAX_COMPILED_TEMPLATES)
+
+
+if __name__ == "__main__":
+    unittest.main()
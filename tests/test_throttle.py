@@ -0,0 +1,44 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from mo_logs.throttle import Throttle
+
+
+class TestThrottle(unittest.TestCase):
+
+    def test_burst_then_sample(self):
+        throttle = Throttle(burst=3, period=3600, sample=10)
+        allowed = [throttle.allow("a {{x}}") for _ in range(30)]
+        self.assertEqual(allowed[:3], [True, True, True])
+        self.assertEqual(sum(allowed), 3 + 3)  # THE 10th, 20th AND 30th ARE SAMPLED
+        self.assertEqual(throttle.counts(), {"a {{x}}": 30})
+
+    def test_templates_are_independent(self):
+        throttle = Throttle(burst=1, period=3600, sample=0)
+        self.assertTrue(throttle.allow("a"))
+        self.assertFalse(throttle.allow("a"))
+        self.assertTrue(throttle.allow("b"))
+
+    def test_new_period(self):
+        throttle = Throttle(burst=1, period=3600, sample=0)
+        self.assertTrue(throttle.allow("a"))
+        self.assertFalse(throttle.allow("a"))
+        throttle.period = -1  # EVERY MESSAGE STARTS A NEW PERIOD
+        self.assertTrue(throttle.allow("a"))
+        self.assertTrue(throttle.allow("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+from random import Random
+
+from mo_future import text_type
+
+from bugzilla_etl.parse_bug_history import ApplyDiff
+from mo_logs.strings import apply_diff
+
+
+class TestUserStory(unittest.TestCase):
+
+    def test_long_history(self):
+        # EDITS, OLDEST FIRST, AS (story, diff THAT MADE IT)
+        rand = Random(42)
+        lines = []
+        history = []
+        for i in range(2000):
+            new = "line " + text_type(i)
+            if lines and rand.random() < 0.5:
+                j = rand.randrange(len(lines))
+                diff = "@@ -" + text_type(j + 1) + " +" + text_type(j + 1) + " @@\n-" + lines[j] + "\n+" + new
+                lines[j] = new
+            else:
+                diff = "@@ -" + text_type(len(lines)) + ",0 +" + text_type(len(lines) + 1) + " @@\n+" + new
+                lines.append(new)
+            history.append(("\n".join(lines), diff))
+
+        # WALK BACKWARDS, LIKE THE PARSER
+        value = history[-1][0]
+        values = []
+        for timestamp, (_, diff) in reversed(list(enumerate(history))):
+            value = ApplyDiff(1, timestamp, value, diff, reverse=True)
+            values.append(value)
+
+        expected = [""] + [story for story, _ in history[:-1]]
+        self.assertEqual([text_type(v) for v in reversed(values)], expected)
+
+    def test_same_as_apply_diff(self):
+        diff = "@@ -1 +1 @@\n-a\n+b\n@@ -3 +3,2 @@\n-c\n+d\n+e"
+        text = "b\nx\nd\ne"
+        expected = "\n".join(apply_diff(text.split("\n"), diff.split("\n"), reverse=True))
+        self.assertEqual(text_type(ApplyDiff(1, 0, text, diff, reverse=True)), expected)
+        self.assertEqual(expected, "a\nx\nc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# encoding: utf-8
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import unittest
+
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.parse_bug_history import BugHistoryParser, STOP_BUG
+from jx_python import jx
+from mo_dots import Data, wrap
+from mo_json import value2json
+from util.benchmark import _Collect
+from util.synthetic import SyntheticBugzilla
+
+
+class TestWideRows(unittest.TestCase):
+
+    def test_same_as_one_row_per_column(self):
+        # EXTRACT CACHES FROM OLDER RUNS HAVE ONE ROW PER COLUMN; BOTH MUST GIVE THE SAME VERSIONS
+        wide = list(SyntheticBugzilla(seed=5, num_bugs=20, large_bug_rate=0).rows())
+        narrow = []
+        for r in wide:
+            if r.field_name == None and r._merge_order in [1, 7]:
+                narrow.extend(_narrow(r))
+            else:
+                narrow.append(r.copy())
+        self.assertLess(len(wide), len(narrow))
+
+        expected = _parse(narrow)
+        result = _parse(wide)
+        self.assertEqual(len(result), len(expected))
+        for r, e in zip(result, expected):
+            self.assertEqual(r, e)
+
+
+def _narrow(row):
+    for field_name, value in row.items():
+        if field_name == "_merge_order" or (row._merge_order == 7 and field_name == "bug_id"):
+            continue
+        yield Data(
+            bug_id=row.bug_id,
+            modified_ts=row.modified_ts,
+            modified_by=row.modified_by,
+            field_name=field_name,
+            new_value=value,
+            attach_id=row.attach_id,
+            _merge_order=row._merge_order
+        )
+
+
+def _parse(rows):
+    output = _Collect()
+    parser = BugHistoryParser(Data(), AliasAnalyzer(), output)
+    for r in jx.sort(rows, ROW_ORDER):
+        parser.processRow(r)
+    parser.processRow(wrap({"bug_id": STOP_BUG, "_merge_order": 1}))
+
+    result = []
+    for v in output:
+        value = v["value"].copy()
+        value.etl = None  # HAS THE TIME OF THE RUN
+        result.append(value2json(value))
+    return result
+
+
+if __name__ == "__main__":
+    unittest.main()
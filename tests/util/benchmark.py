@@ -0,0 +1,165 @@
+# encoding: utf-8
+#
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+
+# MEASURE THE PARSER, WITHOUT BUGZILLA OR ES
+#
+# RUN WITH
+#     export PYTHONPATH=.:vendor:tests
+#     python -m util.benchmark --bugs 1000 --seed 0 --output results/benchmark.json
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+import argparse
+import tracemalloc
+from time import time
+
+from bugzilla_etl import parse_bug_history
+from bugzilla_etl.alias_analysis import AliasAnalyzer
+from bugzilla_etl.bz_etl import ROW_ORDER
+from bugzilla_etl.parse_bug_history import BugHistoryParser
+from bugzilla_etl.transform_bugzilla import normalize
+from jx_python import jx
+from mo_dots import Data, wrap
+from mo_files import File
+from mo_json import value2json
+from mo_logs import Log
+from pyLibrary.env.elasticsearch import ID
+from pyLibrary.env.typed_inserter import TypedInserter
+from util.synthetic import SyntheticBugzilla
+
+STAGES = ["sort", "parse", "normalize", "encode"]
+
+
+def run_benchmark(generator, memory=True):
+    """
+    :param generator: SyntheticBugzilla
+    :param memory: ALSO RUN A SECOND PASS (WITH tracemalloc) TO FIND PEAK MEMORY OF EACH STAGE
+    :return: {stage: {seconds, rows, versions, rows_per_second, versions_per_second, peak_memory}}
+    """
+    result = _run(generator, False)
+    if memory:
+        for stage, stats in _run(generator, True).items():
+            result[stage].peak_memory = stats.peak_memory
+    return result
+
+
+def _run(generator, trace):
+    output = Data()
+
+    rows = list(generator.rows())
+    num_rows = len(rows)
+
+    with _Stage(output, "sort", trace) as stage:
+        rows = jx.sort(rows, ROW_ORDER)
+        stage.rows = num_rows
+
+    versions = _Collect()
+    with _Stage(output, "parse", trace) as stage:
+        parser = BugHistoryParser(Data(), AliasAnalyzer(), versions)
+        for r in rows:
+            parser.processRow(r)
+        parser.processRow(wrap({"bug_id": parse_bug_history.STOP_BUG, "_merge_order": 1}))
+        stage.rows = num_rows
+        stage.versions = len(versions)
+    del rows
+
+    with _Stage(output, "normalize", trace) as stage:
+        for v in versions:
+            normalize(v["value"])
+        stage.versions = len(versions)
+
+    encode = TypedInserter(None, ID).typed_encode
+    with _Stage(output, "encode", trace) as stage:
+        for v in versions:
+            encode(v)
+        stage.versions = len(versions)
+
+    return output
+
+
+class _Stage(object):
+    """
+    TIME (OR MEASURE THE MEMORY OF) ONE STAGE, AND ADD THE STATS TO output
+    """
+
+    def __init__(self, output, name, trace):
+        self.stats = output[name]
+        self.trace = trace
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self.start = time()
+        return self.stats
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time() - self.start
+        if self.trace:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stats.peak_memory = peak
+            return
+        self.stats.seconds = duration
+        if self.stats.rows:
+            self.stats.rows_per_second = self.stats.rows / duration
+        if self.stats.versions:
+            self.stats.versions_per_second = self.stats.versions / duration
+
+
+class _Collect(list):
+    """
+    STAND-IN FOR THE OUTPUT QUEUE
+    """
+
+    def add(self, value):
+        self.append(value)
+
+
+def compare(result, baseline, tolerance):
+    """
+    :return: LIST OF (stage, measure, observed, expected) THAT ARE WORSE THAN baseline BY MORE THAN tolerance
+    """
+    problems = []
+    for stage in STAGES:
+        for measure in ["rows_per_second", "versions_per_second"]:
+            expected = baseline[stage][measure]
+            observed = result[stage][measure]
+            if expected and observed < expected * (1 - tolerance):
+                problems.append((stage, measure, observed, expected))
+        expected = baseline[stage].peak_memory
+        observed = result[stage].peak_memory
+        if expected and observed and observed > expected * (1 + tolerance):
+            problems.append((stage, "peak_memory", observed, expected))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bug history parser on synthetic data")
+    parser.add_argument("--bugs", type=int, default=1000, help="number of bugs to generate")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--activity", type=int, default=20, help="mean number of change sets per bug")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory pass")
+    parser.add_argument("--output", help="write the results, as JSON, to this file")
+    args = parser.parse_args()
+
+    Log.start()
+    try:
+        generator = SyntheticBugzilla(seed=args.seed, num_bugs=args.bugs, activity_mean=args.activity)
+        result = run_benchmark(generator, memory=not args.no_memory)
+        Log.note("Benchmark results:\n{{result|json|indent}}", result=result)
+        if args.output:
+            File(args.output).write(value2json(result, pretty=True))
+    finally:
+        Log.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+# encoding: utf-8
+#
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+#
+# Author: Kyle Lahnakoski (kyle@lahnakoski.com)
+
+# MAKE BUGZILLA HISTORY OUT OF THIN AIR
+#
+# EACH BUG IS SIMULATED FORWARD IN TIME, THEN EMITTED AS THE ROWS THE
+# extract_bugzilla FUNCTIONS WOULD RETURN: THE CURRENT bugs ROW (_merge_order=1),
+# THE CURRENT MULTI-VALUE ROWS (2), ATTACHMENTS (7), FLAGS (8) AND THE
+# bugs_activity ROWS (9).  THE SAME seed GIVES THE SAME ROWS.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import unicode_literals
+
+from random import Random
+
+from mo_dots import Data
+from mo_kwargs import override
+
+STATUS_FLOW = {
+    "UNCONFIRMED": ["NEW", "RESOLVED"],
+    "NEW": ["ASSIGNED", "RESOLVED"],
+    "ASSIGNED": ["RESOLVED", "NEW"],
+    "RESOLVED": ["VERIFIED", "REOPENED"],
+    "REOPENED": ["ASSIGNED", "RESOLVED"],
+    "VERIFIED": ["REOPENED"]
+}
+RESOLUTIONS = ["FIXED", "INVALID", "WONTFIX", "DUPLICATE", "WORKSFORME", "INCOMPLETE"]
+PRIORITIES = ["--", "P1", "P2", "P3", "P4", "P5"]
+SEVERITIES = ["normal", "minor", "major", "critical", "blocker", "trivial", "enhancement"]
+PRODUCTS = {
+    "Core": ["DOM", "Networking", "Graphics", "JavaScript Engine", "Layout"],
+    "Firefox": ["General", "Toolbars", "Session Restore", "Preferences"],
+    "Toolkit": ["Add-ons Manager", "Telemetry", "Startup and Profile System"]
+}
+KEYWORDS = ["crash", "regression", "perf", "intermittent-failure", "dev-doc-needed", "testcase", "topcrash", "sec-high"]
+FLAG_TYPES = ["review", "feedback", "superreview", "approval-mozilla-beta"]
+MIME_TYPES = ["text/plain", "text/x-review-board-request", "image/png", "application/octet-stream"]
+WORDS = "the a crash when loading page with large image leaks memory after restart fails on startup timeout in test".split()
+NOBODY = "nobody@mozilla.org"
+
+# CHANGES, AND HOW OFTEN THEY HAPPEN
+ACTIVITY_WEIGHTS = [
+    ("cc", 30),
+    ("bug_status", 8),
+    ("assigned_to", 5),
+    ("priority", 5),
+    ("bug_severity", 2),
+    ("keywords", 6),
+    ("dependson", 4),
+    ("status_whiteboard", 4),
+    ("short_desc", 2),
+    ("cf_user_story", 3),
+    ("attachment", 6),
+    ("attachment_flag", 6),
+    ("attachment_obsolete", 2),
+    ("bug_flag", 4)
+]
+
+
+class SyntheticBugzilla(object):
+
+    @override
+    def __init__(
+        self,
+        seed=0,                 # SAME seed, SAME HISTORY
+        num_bugs=100,           # NUMBER OF BUGS TO MAKE
+        min_bug_id=1,
+        activity_mean=20,       # MEAN NUMBER OF CHANGE SETS PER BUG (EXPONENTIALLY DISTRIBUTED)
+        large_bug_rate=0.01,    # FRACTION OF BUGS THAT ARE "LARGE"
+        large_bug_activity=2000,  # NUMBER OF CHANGE SETS IN A LARGE BUG
+        num_people=300,         # SIZE OF THE POOL OF EMAIL ADDRESSES
+        email_change_rate=0.05,  # FRACTION OF PEOPLE WHO CHANGE THEIR EMAIL PARTWAY THROUGH HISTORY
+        truncate_rate=0.02,     # FRACTION OF TRUNCATED ("? ") VALUES IN cc AND keywords ACTIVITY
+        start_time=1230768000000,  # 2009-01-01
+        kwargs=None
+    ):
+        self.kwargs = kwargs
+        self.seed = seed
+        self.num_bugs = num_bugs
+        self.min_bug_id = min_bug_id
+        self.activity_mean = activity_mean
+        self.large_bug_rate = large_bug_rate
+        self.large_bug_activity = large_bug_activity
+        self.truncate_rate = truncate_rate
+        self.start_time = start_time
+
+        rand = Random(seed)
+        self.people = []
+        for i in range(num_people):
+            email = "person" + str(i) + "@example.com"
+            if rand.random() < email_change_rate:
+                # (UNTIL, EMAIL) PAIRS; THE LAST EMAIL IS STILL IN USE
+                changed = start_time + rand.randint(0, 5 * 365 * 86400) * 1000
+                self.people.append([(changed, email), (None, "p" + str(i) + "@mozilla.com")])
+            else:
+                self.people.append([(None, email)])
+        self.activity_id = 0
+
+    @property
+    def bug_ids(self):
+        return list(range(self.min_bug_id, self.min_bug_id + self.num_bugs))
+
+    def rows(self):
+        """
+        :return: GENERATOR OF ALL ROWS, FOR ALL BUGS, IN bug_id ORDER (BUT NOT SORTED WITHIN EACH BUG)
+        """
+        self.activity_id = 0
+        for bug_id in self.bug_ids:
+            for r in self.bug(bug_id):
+                yield r
+
+    def email(self, person, timestamp):
+        for until, email in self.people[person]:
+            if until is None or timestamp < until:
+                return email
+
+    def bug(self, bug_id):
+        """
+        :return: LIST OF ROWS FOR ONE BUG
+        """
+        rand = Random(self.seed * 1000003 + bug_id)
+        people = len(self.people)
+        reporter = rand.randrange(people)
+        created = self.start_time + rand.randint(0, 5 * 365 * 86400) * 1000
+        product = rand.choice(sorted(PRODUCTS.keys()))
+
+        state = {
+            "bug_status": "NEW",
+            "resolution": "",
+            "priority": "--",
+            "bug_severity": "normal",
+            "assigned_to": None,  # PERSON, NOT EMAIL
+            "status_whiteboard": "",
+            "short_desc": _sentence(rand),
+            "cf_user_story": [],  # LINES
+            "product": product,
+            "component": rand.choice(PRODUCTS[product]),
+            "op_sys": rand.choice(["Windows 10", "Linux", "macOS", "Android"]),
+            "rep_platform": rand.choice(["x86_64", "ARM", "Unspecified"]),
+            "version": "unspecified",
+            "target_milestone": "---"
+        }
+        cc = {reporter}
+        keywords = set()
+        dependson = set()
+        attachments = {}  # MAP FROM attach_id TO ATTACHMENT
+        bug_flags = {}  # MAP FROM FLAG TYPE TO (flag, timestamp, setter)
+        activities = []
+
+        if rand.random() < self.large_bug_rate:
+            num_changes = self.large_bug_activity
+        else:
+            num_changes = int(rand.expovariate(1.0 / self.activity_mean))
+
+        now = created
+        for _ in range(num_changes):
+            now += rand.randint(60, 7 * 86400) * 1000
+            who = rand.randrange(people)
+            changes = []  # (field_name, added, removed, attach_id)
+            kind = _weighted(rand, ACTIVITY_WEIGHTS)
+
+            if kind == "cc":
+                if cc and rand.random() < 0.4:
+                    removed = set(rand.sample(sorted(cc), rand.randint(1, min(3, len(cc)))))
+                    cc -= removed
+                    changes.append(("cc", None, [self.email(p, now) for p in sorted(removed)], None))
+                else:
+                    added = set(rand.randrange(people) for _ in range(rand.randint(1, 3))) - cc
+                    if added:
+                        cc |= added
+                        changes.append(("cc", [self.email(p, now) for p in sorted(added)], None, None))
+            elif kind == "bug_status":
+                old = state["bug_status"]
+                new = rand.choice(STATUS_FLOW[old])
+                state["bug_status"] = new
+                changes.append(("bug_status", new, old, None))
+                if new == "RESOLVED":
+                    resolution = rand.choice(RESOLUTIONS)
+                    changes.append(("resolution", resolution, state["resolution"], None))
+                    state["resolution"] = resolution
+                elif old == "RESOLVED" or old == "VERIFIED":
+                    changes.append(("resolution", "", state["resolution"], None))
+                    state["resolution"] = ""
+            elif kind == "assigned_to":
+                old = state["assigned_to"]
+                new = rand.randrange(people)
+                state["assigned_to"] = new
+                changes.append((
+                    "assigned_to",
+                    self.email(new, now),
+                    NOBODY if old is None else self.email(old, now),
+                    None
+                ))
+            elif kind in ("priority", "bug_severity"):
+                old = state[kind]
+                new = rand.choice(PRIORITIES if kind == "priority" else SEVERITIES)
+                if new != old:
+                    state[kind] = new
+                    changes.append((kind, new, old, None))
+            elif kind == "keywords":
+                if keywords and rand.random() < 0.3:
+                    k = rand.choice(sorted(keywords))
+                    keywords.discard(k)
+                    changes.append(("keywords", None, [k], None))
+                else:
+                    k = rand.choice(KEYWORDS)
+                    if k not in keywords:
+                        keywords.add(k)
+                        changes.append(("keywords", [k], None, None))
+            elif kind == "dependson":
+                other = max(1, bug_id - rand.randint(1, 1000))
+                if other in dependson:
+                    dependson.discard(other)
+                    changes.append(("dependson", None, [str(other)], None))
+                else:
+                    dependson.add(other)
+                    changes.append(("dependson", [str(other)], None, None))
+            elif kind == "status_whiteboard":
+                old = state["status_whiteboard"]
+                new = "[" + rand.choice(WORDS) + "]" + old
+                state["status_whiteboard"] = new
+                changes.append(("status_whiteboard", new, old, None))
+            elif kind == "short_desc":
+                old = state["short_desc"]
+                new = _sentence(rand)
+                state["short_desc"] = new
+                changes.append(("short_desc", new, old, None))
+            elif kind == "cf_user_story":
+                lines = state["cf_user_story"]
+                if lines and rand.random() < 0.5:
+                    i = rand.randrange(len(lines))
+                    new = _sentence(rand)
+                    diff = "@@ -" + str(i + 1) + " +" + str(i + 1) + " @@\n-" + lines[i] + "\n+" + new
+                    lines[i] = new
+                else:
+                    new = _sentence(rand)
+                    if lines:
+                        diff = "@@ -" + str(len(lines)) + ",0 +" + str(len(lines) + 1) + " @@\n+" + new
+                    else:
+                        diff = "@@ -0,0 +1 @@\n+" + new
+                    lines.append(new)
+                changes.append(("cf_user_story", diff, None, None))
+            elif kind == "attachment":
+                attach_id = bug_id * 1000 + len(attachments) + 1
+                attachments[attach_id] = {
+                    "created_ts": now,
+                    "created_by": who,
+                    "ispatch": 1 if rand.random() < 0.6 else 0,
+                    "isobsolete": 0,
+                    "mimetype": rand.choice(MIME_TYPES),
+                    "flags": {}
+                }
+            elif kind == "attachment_obsolete":
+                live = [a for a, v in sorted(attachments.items()) if not v["isobsolete"]]
+                if live:
+                    attach_id = rand.choice(live)
+                    attachments[attach_id]["isobsolete"] = 1
+                    changes.append(("attachments_isobsolete", "1", "0", attach_id))
+            elif kind == "attachment_flag":
+                if attachments:
+                    attach_id = rand.choice(sorted(attachments.keys()))
+                    changes.extend(self._change_flag(rand, attachments[attach_id]["flags"], now, who, attach_id))
+            elif kind == "bug_flag":
+                changes.extend(self._change_flag(rand, bug_flags, now, who, None, types=["needinfo"]))
+
+            for field_name, added, removed, attach_id in changes:
+                activities.append((now, who, field_name, added, removed, attach_id))
+
+        return self._emit(bug_id, created, reporter, state, cc, keywords, dependson, attachments, bug_flags, activities, rand)
+
+    def _change_flag(self, rand, flags, now, who, attach_id, types=FLAG_TYPES):
+        """
+        REQUEST, GRANT, DENY OR CLEAR A FLAG
+        :return: LIST OF CHANGES
+        """
+        flag_type = rand.choice(types)
+        current = flags.get(flag_type)
+        if current is None:
+            requestee = self.email(rand.randrange(len(self.people)), now)
+            new = flag_type + "?(" + requestee + ")"
+            flags[flag_type] = (new, now, who)
+            return [("flagtypes_name", new, None, attach_id)]
+        old = current[0]
+        if old.endswith(")") and flag_type != "needinfo":
+            new = flag_type + rand.choice("+-")
+            flags[flag_type] = (new, current[1], current[2])
+            return [("flagtypes_name", new, old, attach_id)]
+        del flags[flag_type]
+        return [("flagtypes_name", None, old, attach_id)]
+
+    def _emit(self, bug_id, created, reporter, state, cc, keywords, dependson, attachments, bug_flags, activities, rand):
+        output = []
+        reporter_email = self.email(reporter, MAX_TIME)
+
+        # THE CURRENT bugs ROW, ALL COLUMNS IN ONE ROW, LIKE extract_bugzilla.get_bugs()
+        current = {
+            "bug_id": bug_id,
+            "modified_ts": created,
+            "modified_by": reporter_email,
+            "created_ts": created,
+            "created_by": reporter_email,
+            "assigned_to": NOBODY if state["assigned_to"] is None else self.email(state["assigned_to"], MAX_TIME),
+            "qa_contact": None,
+            "everconfirmed": 1,
+            "cf_user_story": "\n".join(state["cf_user_story"])
+        }
+        for k, v in state.items():
+            if k not in current:
+                current[k] = v
+        row = Data(_merge_order=1)
+        for field_name, value in sorted(current.items()):
+            row[field_name] = value
+        output.append(row)
+
+        # CURRENT MULTI-VALUE TABLES
+        for field_name, values in [
+            ("cc", [self.email(p, MAX_TIME) for p in sorted(cc)]),
+            ("keywords", sorted(keywords)),
+            ("dependson", sorted(dependson))
+        ]:
+            for v in values:
+                output.append(Data(
+                    bug_id=bug_id,
+                    field_name=field_name,
+                    new_value=v,
+                    _merge_order=2
+                ))
+
+        # CURRENT ATTACHMENTS, ONE ROW EACH, LIKE extract_bugzilla.get_attachments()
+        for attach_id, a in sorted(attachments.items()):
+            submitter = self.email(a["created_by"], MAX_TIME)
+            output.append(Data(
+                bug_id=bug_id,
+                modified_ts=a["created_ts"],
+                modified_by=submitter,
+                created_ts=a["created_ts"],
+                created_by=submitter,
+                attachments_ispatch=a["ispatch"],
+                attachments_isobsolete=a["isobsolete"],
+                attachments_isprivate=0,
+                attachments_mimetype=a["mimetype"],
+                attach_id=attach_id,
+                _merge_order=7
+            ))
+
+        # CURRENT FLAGS
+        flags = [(None, f) for f in bug_flags.values()]
+        flags.extend((attach_id, f) for attach_id, a in sorted(attachments.items()) for f in a["flags"].values())
+        for attach_id, (flag, timestamp, setter) in flags:
+            output.append(Data(
+                bug_id=bug_id,
+                modified_ts=timestamp,
+                modified_by=self.email(setter, MAX_TIME),
+                field_name="flagtypes_name",
+                new_value=flag,
+                attach_id=attach_id,
+                _merge_order=8
+            ))
+
+        # bugs_activity
+        for now, who, field_name, added, removed, attach_id in activities:
+            self.activity_id += 1
+            output.append(Data(
+                id=self.activity_id,
+                bug_id=bug_id,
+                modified_ts=now,
+                modified_by=self.email(who, now),
+                field_name=field_name,
+                new_value=self._value(rand, field_name, added),
+                old_value=self._value(rand, field_name, removed),
+                attach_id=attach_id,
+                _merge_order=9
+            ))
+        return output
+
+    def _value(self, rand, field_name, value):
+        if value is None or value == "":
+            return None
+        if not isinstance(value, list):
+            return value
+        if field_name in ("cc", "keywords") and rand.random() < self.truncate_rate:
+            # BUGZILLA TRUNCATED SOME OF THESE, AND MARKED THEM WITH "? "
+            if rand.random() < 0.2:
+                return "?"
+            return "? " + ", ".join(value)
+        return ", ".join(value)
+
+
+MAX_TIME = 10 ** 15  # AFTER ALL EMAIL CHANGES
+
+
+def _sentence(rand):
+    return " ".join(rand.choice(WORDS) for _ in range(rand.randint(3, 9)))
+
+
+def _weighted(rand, choices):
+    total = sum(w for _, w in choices)
+    r = rand.random() * total
+    for c, w in choices:
+        r -= w
+        if r < 0:
+            return c
+    return choices[-1][0]